@@ -0,0 +1,188 @@
+from dataclasses import dataclass
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from timecodes import SQL_DAY_NUMBER
+
+# Rows fetched from SQLite at a time while loading
+CHUNK_SIZE = 50000
+
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+
+
+@dataclass
+class AttendanceFrame:
+    """
+    Attendance of a date range in columnar form, one element per user and
+    day: the user's index in `user_ids`, the day number (see timecodes.py),
+    the first check-in in minutes since midnight (-1 if unknown) and the
+    minutes worked, as kept in attendance_daily.
+    """
+    user_ids: List[str]
+    user: np.ndarray
+    day: np.ndarray
+    arrival: np.ndarray
+    worked: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.day)
+
+    @property
+    def hours(self) -> np.ndarray:
+        return self.worked / 60
+
+    @property
+    def weekday(self) -> np.ndarray:
+        """0 (Monday) to 6 (Sunday); day 0, 1970-01-01, was a Thursday."""
+        return (self.day + 3) % 7
+
+    def late(self, after: int) -> np.ndarray:
+        """Whether each day's first check-in was later than `after` (minutes since midnight)."""
+        return self.arrival > after
+
+
+def load_attendance(c, start: date, end: date) -> AttendanceFrame:
+    """Load the attendance from `start` to `end` (inclusive) from attendance_daily, fetching rows in chunks."""
+    c.execute(f"""
+        SELECT user_id, {SQL_DAY_NUMBER.format('date')}, COALESCE(first_minute_in, -1), worked_minutes
+        FROM attendance_daily
+        WHERE date BETWEEN ? AND ?
+    """, (start.isoformat(), end.isoformat()))
+
+    index: Dict[str, int] = {}
+    chunks = []
+    while rows := c.fetchmany(CHUNK_SIZE):
+        chunks.append(np.array(
+            [(index.setdefault(user_id, len(index)), day, arrival, worked) for user_id, day, arrival, worked in rows],
+            dtype=np.int32
+        ))
+    if not chunks:
+        return AttendanceFrame([], *np.empty((4, 0), dtype=np.int32))
+    return AttendanceFrame(list(index), *np.concatenate(chunks).T)
+
+
+@dataclass
+class UserStats:
+    """Per-user aggregates of an AttendanceFrame, aligned with its `user_ids`."""
+    user_ids: List[str]
+    days: np.ndarray
+    mean_hours: np.ndarray
+    stdev_hours: np.ndarray
+    late_days: np.ndarray
+
+    def get(self, user_id: str) -> Optional[Tuple[float, float, int, int]]:
+        """(avg hours, stdev, attended days, late days) of a user, or None without records."""
+        try:
+            i = self.user_ids.index(user_id)
+        except ValueError:
+            return None
+        return float(self.mean_hours[i]), float(self.stdev_hours[i]), int(self.days[i]), int(self.late_days[i])
+
+
+def user_stats(frame: AttendanceFrame, late_after: int) -> UserStats:
+    """Attended days, mean and sample stdev of daily hours, and late days per user, as group-bys on the user index."""
+    n = len(frame.user_ids)
+    hours = frame.hours
+    days = np.bincount(frame.user, minlength=n)
+    mean = np.bincount(frame.user, weights=hours, minlength=n) / np.maximum(days, 1)
+    # Two passes, like statistics.stdev; 0 for users with a single day
+    squares = np.bincount(frame.user, weights=(hours - mean[frame.user]) ** 2, minlength=n)
+    stdev = np.where(days > 1, np.sqrt(squares / np.maximum(days - 1, 1)), 0.0)
+    late = np.bincount(frame.user, weights=frame.late(late_after), minlength=n).astype(np.int64)
+    return UserStats(frame.user_ids, days, mean, stdev, late)
+
+
+def hour_percentiles(frame: AttendanceFrame, q: Sequence[float] = (50, 90)) -> Optional[List[float]]:
+    """Percentiles of the daily hours of everyone, or None without records."""
+    if not len(frame):
+        return None
+    return [float(value) for value in np.percentile(frame.hours, q)]
+
+
+def weekday_arrivals(frame: AttendanceFrame, late_after: int,
+                     q: Sequence[float] = (50, 90)) -> Dict[int, Tuple[int, List[int], int]]:
+    """
+    Per weekday with records: (days with a known check-in, percentiles of
+    the first check-in in minutes since midnight, late days).
+    """
+    known = frame.arrival >= 0
+    weekday = frame.weekday[known]
+    arrival = frame.arrival[known]
+    # Sorted by weekday, then arrival, so each weekday is one contiguous slice
+    order = np.lexsort((arrival, weekday))
+    weekday, arrival = weekday[order], arrival[order]
+    bounds = np.searchsorted(weekday, np.arange(8))
+    counts = np.diff(bounds)
+    late = np.bincount(weekday, weights=arrival > late_after, minlength=7).astype(np.int64)
+
+    result = {}
+    for day in np.flatnonzero(counts):
+        values = arrival[bounds[day]:bounds[day + 1]]
+        result[int(day)] = (
+            int(counts[day]),
+            [int(round(value)) for value in np.percentile(values, q)],
+            int(late[day])
+        )
+    return result
+
+
+def format_minutes(minutes: int) -> str:
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+@dataclass
+class AttendanceRates:
+    """
+    Per user, aligned with `user_ids`: working days attended, expected
+    (working days not on vacation) and on vacation, and the day numbers of
+    the expected days without an attendance record.
+    """
+    user_ids: List[str]
+    attended: np.ndarray
+    expected: np.ndarray
+    vacation: np.ndarray
+    missing: List[np.ndarray]
+
+
+def attendance_rates(frame: AttendanceFrame, first: int, working: Sequence[bool],
+                     vacations: Iterable) -> AttendanceRates:
+    """
+    Attendance rates of everyone with attendance or `vacations` (objects
+    with user_id, start and end day numbers) over the days from `first`,
+    with `working[i]` telling whether day `first + i` is a working day.
+
+    Each user is a row of a users x days grid, filled from the frame and
+    the vacations in one pass each.
+    """
+    working = np.asarray(working, dtype=bool)
+    days = len(working)
+    user_ids = list(frame.user_ids)
+    index = {user_id: i for i, user_id in enumerate(user_ids)}
+    spans = []
+    for vacation in vacations:
+        if vacation.user_id not in index:
+            index[vacation.user_id] = len(user_ids)
+            user_ids.append(vacation.user_id)
+        spans.append((index[vacation.user_id], max(vacation.start - first, 0), min(vacation.end - first, days - 1)))
+
+    attended = np.zeros((len(user_ids), days), dtype=bool)
+    inside = (frame.day >= first) & (frame.day < first + days)
+    attended[frame.user[inside], frame.day[inside] - first] = True
+    on_vacation = np.zeros_like(attended)
+    for i, start, end in spans:
+        on_vacation[i, start:end + 1] = True
+
+    expected = working & ~on_vacation
+    attended &= expected
+    rows, columns = np.nonzero(expected & ~attended)
+    # Row-major, so each user's missing days are one slice
+    bounds = np.searchsorted(rows, np.arange(len(user_ids) + 1))
+    return AttendanceRates(
+        user_ids,
+        attended.sum(axis=1),
+        expected.sum(axis=1),
+        (working & on_vacation).sum(axis=1),
+        [columns[bounds[i]:bounds[i + 1]] + first for i in range(len(user_ids))]
+    )
@@ -0,0 +1,136 @@
+"""
+In-process stand-in for the parts of `mattermostdriver` the bot uses.
+
+`install(team)` registers it as the `mattermostdriver` module, so the bot's
+modules can be imported and driven without a Mattermost server. Every API
+call answers from memory and is counted in `Driver.calls`.
+"""
+import sys
+import types
+from collections import Counter
+from typing import Dict, List
+
+
+class ResourceNotFound(Exception):
+    pass
+
+
+class FakeTeam:
+    """Users, one team and its channels, shared by every Driver instance."""
+
+    def __init__(self, team_id: str = 'team'):
+        self.team_id = team_id
+        self.users: Dict[str, dict] = {}
+        self.channels: Dict[str, dict] = {}
+        self.posts: List[dict] = []
+
+    def add_user(self, user_id: str, username: str, is_bot: bool = False):
+        self.users[user_id] = {
+            'id': user_id,
+            'username': username,
+            'is_bot': is_bot,
+            'delete_at': 0,
+        }
+
+    def add_channel(self, channel_id: str):
+        self.channels[channel_id] = {'id': channel_id, 'team_id': self.team_id}
+
+
+class _Endpoint:
+    def __init__(self, driver: 'Driver'):
+        self.driver = driver
+        self.team = driver.team
+
+    def _count(self, name: str):
+        self.driver.calls[name] += 1
+
+
+class _Users(_Endpoint):
+    def get_user(self, user_id: str) -> dict:
+        self._count('get_user')
+        if user_id == 'me':
+            return self.team.users[self.driver.bot_user_id]
+        if user_id not in self.team.users:
+            raise ResourceNotFound(user_id)
+        return self.team.users[user_id]
+
+    def get_users_by_ids(self, user_ids: List[str]) -> List[dict]:
+        self._count('get_users_by_ids')
+        return [self.team.users[user_id] for user_id in user_ids if user_id in self.team.users]
+
+    def get_users_by_usernames(self, usernames: List[str]) -> List[dict]:
+        self._count('get_users_by_usernames')
+        wanted = set(usernames)
+        return [user for user in self.team.users.values() if user['username'] in wanted]
+
+
+class _Teams(_Endpoint):
+    def get_team_members(self, team_id: str, params: dict = None) -> List[dict]:
+        self._count('get_team_members')
+        params = params or {}
+        page, per_page = params.get('page', 0), params.get('per_page', 60)
+        user_ids = list(self.team.users)[page * per_page:(page + 1) * per_page]
+        return [{'team_id': team_id, 'user_id': user_id} for user_id in user_ids]
+
+
+class _Channels(_Endpoint):
+    def get_channel(self, channel_id: str) -> dict:
+        self._count('get_channel')
+        return self.team.channels[channel_id]
+
+    def create_direct_message_channel(self, user_ids: List[str]) -> dict:
+        self._count('create_direct_message_channel')
+        return {'id': 'dm_' + '_'.join(sorted(user_ids))}
+
+
+class _Posts(_Endpoint):
+    def create_post(self, options: dict) -> dict:
+        self._count('create_post')
+        post = dict(options, id=f'post{len(self.team.posts)}')
+        self.team.posts.append(post)
+        return post
+
+    def get_posts_for_channel(self, channel_id: str, params: dict = None) -> dict:
+        self._count('get_posts_for_channel')
+        return {'order': [], 'posts': {}}
+
+
+class _Files(_Endpoint):
+    def upload_file(self, channel_id: str, files: dict) -> dict:
+        self._count('upload_file')
+        return {'file_infos': [{'id': f'file{self.driver.calls["upload_file"]}'}]}
+
+
+class Driver:
+    # Set by install()
+    team: FakeTeam = None
+    bot_user_id: str = 'bot'
+
+    def __init__(self, options: dict):
+        self.options = options
+        self.client = types.SimpleNamespace(token=options.get('token'))
+        self.calls: Counter = Counter()
+        self.users = _Users(self)
+        self.teams = _Teams(self)
+        self.channels = _Channels(self)
+        self.posts = _Posts(self)
+        self.files = _Files(self)
+
+    def login(self):
+        self.calls['login'] += 1
+
+
+def install(team: FakeTeam, bot_user_id: str = 'bot') -> types.ModuleType:
+    """Register this module as `mattermostdriver` (and `mattermostdriver.exceptions`)."""
+    Driver.team = team
+    Driver.bot_user_id = bot_user_id
+    team.add_user(bot_user_id, 'attendance-bot', is_bot=True)
+
+    module = types.ModuleType('mattermostdriver')
+    module.Driver = Driver
+    exceptions = types.ModuleType('mattermostdriver.exceptions')
+    exceptions.ResourceNotFound = ResourceNotFound
+    module.exceptions = exceptions
+    sys.modules['mattermostdriver'] = module
+    sys.modules['mattermostdriver.exceptions'] = exceptions
+    return module
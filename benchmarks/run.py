@@ -0,0 +1,282 @@
+"""
+Command latency and report scaling benchmarks on synthetic data.
+
+Generates `--members` members with `--years` of attendance, vacations and
+birthdays in a temporary database, then times the commands through
+main.handle_message (with an in-process fake Mattermost driver, see
+fakedriver.py) and the scheduled jobs directly. Results are written as
+JSON, so runs on different commits can be compared. The time to import
+main.py (in a fresh interpreter, without configs.json) is checked against
+--import-budget-ms, and the run exits with status 1 if it is over budget:
+
+    python benchmarks/run.py --members 500 --years 5 --output before.json
+    python benchmarks/run.py --members 500 --years 5 --output after.json --compare before.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import date, datetime, timedelta
+from statistics import mean
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fakedriver
+
+CHANNEL_ID = 'attendance'
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def measure(func, iterations, setup=None):
+    """
+    Call `func(i)` `iterations` times and summarise the latencies in
+    milliseconds. `setup(i)`, if given, runs untimed before each call.
+    """
+    timings = []
+    for i in range(iterations):
+        if setup is not None:
+            setup(i)
+        start = time.perf_counter()
+        func(i)
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        'iterations': iterations,
+        'mean_ms': round(mean(timings), 3),
+        'p50_ms': round(percentile(timings, 0.5), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'min_ms': round(min(timings), 3),
+        'max_ms': round(max(timings), 3),
+    }
+
+
+def generate(conn, team, members, years, last_day, seed):
+    """Fill the database with synthetic members, attendance and vacations. Returns row counts."""
+    rng = random.Random(seed)
+    c = conn.cursor()
+    first_day = last_day - timedelta(days=365 * years)
+
+    member_rows = []
+    for i in range(members):
+        user_id, username = f'user{i:04d}', f'member{i:04d}'
+        team.add_user(user_id, username)
+        birthday = date(1970 + rng.randrange(35), 1, 1) + timedelta(days=rng.randrange(365))
+        member_rows.append((f'@{username}', username, 'Researcher', '010-0000-0000',
+                            f'{username}@example.com', birthday.isoformat(), birthday.strftime('%m-%d')))
+    c.executemany("""
+        INSERT INTO members_info (user_id, name, position, phone, email, birthday, birthday_md)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, member_rows)
+
+    vacation_rows = []
+    for i in range(members):
+        for _ in range(3 * years):
+            start = first_day + timedelta(days=rng.randrange(365 * years))
+            end = start + timedelta(days=rng.randrange(5))
+            vacation_rows.append((f'user{i:04d}', start.isoformat(), end.isoformat(), 'Synthetic'))
+    c.executemany("INSERT INTO vacations VALUES (?, ?, ?, ?)", vacation_rows)
+
+    attendance_rows = []
+    day = first_day
+    while day <= last_day:
+        if day.weekday() < 5:
+            for i in range(members):
+                if rng.random() < 0.1:
+                    continue
+                time_in = 8 * 60 + rng.randrange(120)
+                # A few records on the last day stay open for auto_checkout
+                open_record = day == last_day and rng.random() < 0.2
+                time_out = None if open_record else f'{(time_in + 480 + rng.randrange(120)) // 60:02d}:{rng.randrange(60):02d}'
+                attendance_rows.append((f'user{i:04d}', day.isoformat(), f'{time_in // 60:02d}:{time_in % 60:02d}',
+                                        time_out, 'Office'))
+        day += timedelta(days=1)
+    c.executemany("""
+        INSERT INTO attendance (user_id, date, time_in, time_out, location) VALUES (?, ?, ?, ?, ?)
+    """, attendance_rows)
+    conn.commit()
+    return {'members_info': len(member_rows), 'vacations': len(vacation_rows), 'attendance': len(attendance_rows)}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure_import(module: str = 'main') -> float:
+    """Milliseconds to import `module` in a fresh interpreter, from an empty directory."""
+    code = (
+        "import sys, time; sys.path.insert(0, sys.argv[1]); "
+        f"start = time.perf_counter(); import {module}; print((time.perf_counter() - start) * 1000)"
+    )
+    with tempfile.TemporaryDirectory() as empty:
+        result = subprocess.run([sys.executable, '-c', code, ROOT], cwd=empty,
+                                capture_output=True, text=True, check=True)
+    return float(result.stdout)
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)['results']
+    print(f"{'benchmark':<28}{'baseline p50':>14}{'p50':>10}{'change':>10}")
+    for name, stats in results.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]['p50_ms'], stats['p50_ms']
+        change = f"{(after - before) / before * 100:+.1f}%" if before else 'n/a'
+        print(f"{name:<28}{before:>14.3f}{after:>10.3f}{change:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--members', type=int, default=500)
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="write the results to this JSON file (default: stdout)")
+    parser.add_argument('--compare', help="print the p50 change against a previous results file")
+    parser.add_argument('--import-budget-ms', type=float, default=500,
+                        help="maximum time to import main.py (default: 500)")
+    args = parser.parse_args()
+    # Importing must not log in, open the database or read configs.json
+    import_ms = measure_import()
+    # Relative to where the benchmark was started, not the temporary working directory
+    output_path = os.path.abspath(args.output) if args.output else None
+    baseline_path = os.path.abspath(args.compare) if args.compare else None
+
+    # configs.py reads configs.json from the working directory
+    workdir = tempfile.mkdtemp(prefix='attendance-bench-')
+    db_path = os.path.join(workdir, 'bench.db')
+    with open(os.path.join(ROOT, 'configs.json')) as f:
+        configs = json.load(f)
+    configs.update({
+        'DEBUG': False,
+        'use_websocket': False,
+        'db_path': db_path,
+        'channel_id_attendance': CHANNEL_ID,
+    })
+    with open(os.path.join(workdir, 'configs.json'), 'w') as f:
+        json.dump(configs, f)
+    os.environ['DB_PATH'] = db_path
+    os.chdir(workdir)
+
+    team = fakedriver.FakeTeam()
+    team.add_channel(CHANNEL_ID)
+    fakedriver.install(team)
+
+    from database import init_db
+    from rollup import rebuild_daily_rollup
+
+    # History ends on the last weekday before today
+    last_day = date.today() - timedelta(days=1)
+    while last_day.weekday() >= 5:
+        last_day -= timedelta(days=1)
+    start = time.perf_counter()
+    conn = sqlite3.connect(db_path)
+    init_db(conn)
+    rows = generate(conn, team, args.members, args.years, last_day, args.seed)
+    rebuild_daily_rollup(conn.cursor(), conn)
+    generate_seconds = time.perf_counter() - start
+    conn.close()
+
+    from main import Application
+    from commands import fix_database
+    from utils import auto_checkout, BirthdayGreeter
+    from cache import get_directory
+    from reports import report_cache
+
+    # Logs in to the fake driver and opens the database
+    start = time.perf_counter()
+    app = Application()
+    bot, c, conn = app.bot, app.c, app.conn
+    startup_seconds = time.perf_counter() - start
+    user_ids = [f'user{i:04d}' for i in range(args.members)]
+    now_ms = int(time.time() * 1000)
+
+    def command(message, user_index=0):
+        post = {
+            'id': f'bench{time.perf_counter_ns()}',
+            'user_id': user_ids[user_index % len(user_ids)],
+            'channel_id': CHANNEL_ID,
+            'message': message,
+            'create_at': now_ms,
+            'root_id': '',
+        }
+        response = app.handle_message(post)
+        conn.commit()
+        return response
+
+    iterations = args.iterations
+    month = (last_day.replace(day=1) - timedelta(days=1)).strftime('%Y-%m')
+    results = {}
+    # The first full run also closes the open records; run auto_checkout first
+    results['auto_checkout'] = measure(lambda i: auto_checkout(bot, c, conn, last_day), 1)
+    results['fix_database_full'] = measure(lambda i: fix_database(bot, c, conn), 1)
+    results['!in'] = measure(lambda i: command('!in', i), min(iterations, args.members))
+    # The report commands are timed computing their result (the report cache
+    # is cleared before every call) and answered from the cache
+    for name, message in (
+        ('!teamstatus', f'!teamstatus {last_day.isoformat()}'),
+        ('!monthlyreport', f'!monthlyreport {month}'),
+        ('!yearlyreport', f'!yearlyreport {last_day.year}'),
+        ('!attendancerate', f'!attendancerate {month}'),
+    ):
+        results[name] = measure(lambda i: command(message, i), iterations, setup=lambda i: report_cache.clear(conn))
+        results[f'{name} (cached)'] = measure(lambda i: command(message, i), iterations)
+    results['!recentrecord'] = measure(lambda i: command('!recentrecord', i), iterations)
+    results['!edit'] = measure(
+        lambda i: command(f'!edit 0 {(last_day - timedelta(days=7)).isoformat()} 09:00 18:00', i), iterations
+    )
+    results['fix_database_incremental'] = measure(lambda i: fix_database(bot, c, conn, incremental=True), iterations)
+    greeter = BirthdayGreeter(c, conn, get_directory(bot))
+    results['birthday_daily'] = measure(lambda i: greeter.get_daily_greeting(last_day - timedelta(days=i)), iterations)
+    results['birthday_monthly'] = measure(lambda i: greeter.get_monthly_greeting(), iterations)
+
+    output = {
+        'meta': {
+            'commit': git_commit(),
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'members': args.members,
+            'years': args.years,
+            'seed': args.seed,
+            'rows': rows,
+            'db_bytes': os.path.getsize(db_path),
+            'generate_seconds': round(generate_seconds, 3),
+            'import_ms': round(import_ms, 3),
+            'import_budget_ms': args.import_budget_ms,
+            'startup_seconds': round(startup_seconds, 3),
+            'api_calls': dict(bot.calls),
+        },
+        'results': results,
+    }
+    if output_path:
+        with open(output_path, 'w') as f:
+            json.dump(output, f, indent=2)
+    else:
+        print(json.dumps(output, indent=2))
+    if baseline_path:
+        compare(results, baseline_path)
+    if import_ms > args.import_budget_ms:
+        print(f"Importing main.py took {import_ms:.1f} ms, over the budget of {args.import_budget_ms:.0f} ms",
+              file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
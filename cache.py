@@ -0,0 +1,166 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, List
+
+from utils import API_PAGE_SIZE, get_team_member_ids
+
+# Get the logger in main.py
+logger = logging.getLogger('bot')
+
+MISSING = object()
+
+
+class TTLCache:
+    """
+    A thread-safe LRU cache whose entries expire `ttl` seconds after they
+    were stored. Holds at most `maxsize` entries and counts hits and misses.
+    """
+
+    def __init__(self, maxsize: int = 1000, ttl: float = 600, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > self.clock():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = (self.clock() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data)}
+
+
+class UserDirectory:
+    """
+    Cached view of Mattermost user profiles, team rosters and channel teams.
+
+    Entries expire after `ttl` seconds and are dropped or refreshed as soon
+    as the WebSocket reports a change (`user_updated`, `added_to_team`,
+    `leave_team`), so the TTL only bounds staleness when events are missed.
+    """
+
+    def __init__(self, bot, maxsize: int = 1000, ttl: float = 600):
+        self.bot = bot
+        self.users = TTLCache(maxsize, ttl)
+        self.usernames = TTLCache(maxsize, ttl)
+        self.rosters = TTLCache(maxsize, ttl)
+        self.channel_teams = TTLCache(maxsize, ttl)
+
+    def _store(self, user: dict):
+        self.users.set(user['id'], user)
+        self.usernames.set(user['username'], user['id'])
+
+    def get_user(self, user_id: str) -> dict:
+        if (user := self.users.get(user_id)) is MISSING:
+            user = self.bot.users.get_user(user_id)
+            self._store(user)
+        return user
+
+    def get_users(self, user_ids: Iterable[str]) -> Dict[str, dict]:
+        """Get profiles keyed by user id, fetching all misses in bulk."""
+        users = {}
+        missing = []
+        for user_id in user_ids:
+            if (user := self.users.get(user_id)) is MISSING:
+                missing.append(user_id)
+            else:
+                users[user_id] = user
+        for start in range(0, len(missing), API_PAGE_SIZE):
+            for user in self.bot.users.get_users_by_ids(missing[start:start + API_PAGE_SIZE]):
+                self._store(user)
+                users[user['id']] = user
+        return users
+
+    def get_users_by_usernames(self, usernames: Iterable[str]) -> Dict[str, dict]:
+        """Get profiles keyed by username, fetching all misses in bulk."""
+        users = {}
+        missing = []
+        for username in usernames:
+            user_id = self.usernames.get(username)
+            user = self.users.get(user_id) if user_id is not MISSING else MISSING
+            if user is MISSING:
+                missing.append(username)
+            else:
+                users[username] = user
+        for start in range(0, len(missing), API_PAGE_SIZE):
+            for user in self.bot.users.get_users_by_usernames(missing[start:start + API_PAGE_SIZE]):
+                self._store(user)
+                users[user['username']] = user
+        return users
+
+    def get_team_id(self, channel_id: str) -> str:
+        if (team_id := self.channel_teams.get(channel_id)) is MISSING:
+            team_id = self.bot.channels.get_channel(channel_id)['team_id']
+            self.channel_teams.set(channel_id, team_id)
+        return team_id
+
+    def get_team_member_ids(self, team_id: str) -> List[str]:
+        if (member_ids := self.rosters.get(team_id)) is MISSING:
+            member_ids = get_team_member_ids(self.bot, team_id)
+            self.rosters.set(team_id, member_ids)
+        return member_ids
+
+    def handle_event(self, event: dict):
+        """Invalidate entries changed by a WebSocket event."""
+        name = event.get('event')
+        data = event.get('data') or {}
+        broadcast = event.get('broadcast') or {}
+
+        if name == 'user_updated' and (user := data.get('user')):
+            # Deactivation and profile changes both arrive as user_updated
+            self.users.pop(user['id'])
+            self.usernames.pop(user.get('username'))
+        elif name in ('added_to_team', 'leave_team'):
+            if team_id := data.get('team_id') or broadcast.get('team_id'):
+                self.rosters.pop(team_id)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            'users': self.users.stats(),
+            'usernames': self.usernames.stats(),
+            'rosters': self.rosters.stats(),
+            'channel_teams': self.channel_teams.stats(),
+        }
+
+
+_directories: Dict[int, UserDirectory] = {}
+_directories_lock = threading.Lock()
+
+
+def get_directory(bot) -> UserDirectory:
+    """Return the process-wide UserDirectory of a driver, creating it on first use."""
+    with _directories_lock:
+        if (directory := _directories.get(id(bot))) is None:
+            directory = _directories[id(bot)] = UserDirectory(bot)
+        return directory
@@ -1,133 +1,47 @@
 from datetime import date
-from statistics import mean, stdev
+from statistics import median
 import datetime
 
-from configs import get_datetime, cal, channel_id_attendance
+import configs
+from configs import get_datetime
 from utils import DateTimeValidator
+from cache import get_directory
+from rollup import refresh_daily_rollup, rebuild_daily_rollup
+from workdays import WorkingDays
+from timecodes import day_number, day_from_number, minute_of_day
+from reports import report_cache
+from vacations import vacation_index, vacation_days
+import analytics
 
 validator = DateTimeValidator()
 
-def help_command():
-    help_message = (
-        f"## Attendance Bot version 241023\n"
-        f"# Bot Commands\n"
-        f"All commands must start with a '!' character.\n"
-        f"모든 명령어는 '!' 문자로 시작해야 합니다.\n"
-        f"\n"
-        f"Response will be sent to Direct Message.\n"
-        f"응답은 DM으로 전송됩니다.\n"
-        f"\n"
-        f"## Available commands:\n"
-        f"\n"
-        f"### Help\n"
-        f"- `!도움`, `!h`, `!help`\n"
-        f"- 도움말 보기 Show this help message\n"
-        f"- **Example:** `!도움` or `!h`\n"
-        f"\n"
-        f"### Attendance Commands\n"
-        f"\n"
-        f"#### Check-in\n"
-        f"- `!출근`, `!in`\n"
-        f"- 출근 Attend work\n"
-        f"- **Example:** `!출근` or `!in`\n"
-        f"\n"
-        f"#### Check-out\n"
-        f"- `!퇴근`, `!out`\n"
-        f"- 퇴근 Leave work\n"
-        f"- **Example:** `!퇴근` or `!out`\n"
-        f"\n"
-        f"#### Missing Attendance\n"
-        f"- `!출퇴근누락 <일자> <출근시간> <퇴근시간>`, `!missing <date> <time_in> <time_out>`\n"
-        f"- 누락된 출퇴근 기록 입력 Enter missing attendance\n"
-        f"- **Example:** `!출퇴근누락 2024-12-31 09:00:00 18:00:00` or `!missing 2024-12-31 09:00:00 18:00:00`\n"
-        f"\n"
-        f"#### Look up recent records\n"
-        f"- `!recentrecord`, `!최근기록`\n"
-        f"- 최근 7일 출퇴근 기록 조회 Look up recent 7 days' attendance records\n"
-        f"- **Example:** `!recentrecord` or `!최근기록`\n"
-        f"\n"
-        f"### Edit a Record\n"
-        f"- `!수정 <인덱스> <날짜> <출근시간> <퇴근시간:선택> <위치:선택>`, `!edit <index> <date> <time_in> <time_out:optional> <location:optional>`\n"
-        f"- 최근 7일 출퇴근 기록 수정 Edit a record within recent 7 days\n"
-        f"- **Example:** `!수정 0 2024-12-31 09:00:00 18:00:00` or `!edit 0 2024-12-31 09:00:00 18:00:00`\n"
-        f"- **Note:** Index는 최근 7일 출퇴근 기록에서 선택한 인덱스입니다. Index is selected from recent 7 days' attendance records.\n"
-        f"\n"
-        f"### Delete a Record\n"
-        f"- `!삭제 <인덱스>`, `!delete <index>`\n"
-        f"- 최근 7일 특정 출퇴근 기록 삭제 Delete a record within recent 7 days\n"
-        f"- **Example:** `!삭제 0` or `!delete 0`\n"
-        f"- **Note:** Index는 최근 7일 출퇴근 기록에서 선택한 인덱스입니다. Index is selected from recent 7 days' attendance records.\n"
-        f"#### Vacation\n"
-        f"- `!휴가 <휴가시작일> <휴가마감일> <사유>`, `!vacation <start_date> <end_date> <reason>`\n"
-        f"- 휴가 기록 Record vacation\n"
-        f"- **Example:** `!휴가 2024-12-31 2025-01-02 가족여행` or `!vacation 2024-12-31 2025-01-02 Family_trip`\n"
-        f"\n"
-        f"#### Team Status\n"
-        f"- `!상태 <일자:선택>`, `!teamstatus <date:optional>`\n"
-        f"- 출퇴근 상태 출력 Print all team members' statuses\n"
-        f"- 일자를 지정하지 않으면 오늘의 상태 출력 Print all team members' statuses for the current date\n"
-        f"- **Example:** `!상태` or `!상태 2024-12-31` or `!teamstatus` or `!teamstatus 2024-12-31`\n"
-        f"\n"
-        f"#### Monthly Report\n"
-        f"- `!월간보고 <연도-월:선택>`, `!monthlyreport <year-month:optional>`\n"
-        f"- 이번 달 출퇴근 보고서 출력 (자신의 보고서만) Print the monthly attendance report for the current month (your report only)\n"
-        f"- 연도와 월을 지정하지 않으면 현재 달의 보고서 출력 Print the monthly attendance report for the specified year and month (your report only)\n"
-        f"- **Example:** `!월간보고` or `!월간보고 2024-12` or `!monthlyreport` or `!monthlyreport 2024-12`\n"
-        f"\n"
-        f"### Member Management Commands\n"
-        f"\n"
-        f"#### Add Member\n"
-        f"- `!멤버추가 <@아이디> <이름> <과정> <전화번호> <이메일> <생일>`, `!addmember <@user_id> <name> <position> <phone> <email> <birthday>`\n"
-        f"- 멤버 추가 Add a member\n"
-        f"- **Example:** `!멤버추가 @gdhong 홍길동 PhD 010-1234-5678 1970-01-01` or `!addmember @gdhong Gildong-Hong PhD 010-1234-5678 gdhong@kw.ac.kr 1970-01-01`\n"
-        f"\n"
-        f"#### Delete Member\n"
-        f"- `!멤버삭제 <@아이디>`, `!deletemember <@user_id>`\n"
-        f"- 멤버 삭제 Delete a member\n"
-        f"- **Example:** `!멤버삭제 @gdhong` or `!deletemember @gdhong`\n"
-        f"\n"
-        f"#### Update Member\n"
-        f"- `!멤버업데이트 <@아이디> <과정:선택> <전화번호:선택> <이메일:선택> <생일:선택>`, `!updatemember <@user_id> <position:optional> <phone:optional> <email:optional> <birthday:optional>`\n"
-        f"- 멤버 정보 업데이트 Update member info (optional)\n"
-        f"- **Example:** `!멤버업데이트 @gdhong PhD 010-1234-5678 gdhong@kw.ac.kr 1970-01-01` or `!updatemember @gdhong PhD 010-1234-5678`\n"
-        f"\n"
-        f"#### Member Info\n"
-        f"- `!멤버조회 <@아이디>`, `!memberinfo <@user_id>`\n"
-        f"- 멤버 정보 조회 Get member info\n"
-        f"- **Example:** `!멤버조회 @gdhong` or `!memberinfo @gdhong`\n"
-        f"\n"
-        f"## Developer Information\n"
-        f"\n"
-        f"- **Developer:** Jiwoon Lee 이지운\n"
-        f"- **GitHub:** [metr0jw](https://github.com/metr0jw)\n"
-        f"\n"
-        f"Contact me if you have any questions or suggestions.\n"
-        f"질문이나 제안이 있으면 연락주세요.\n"
-    )
-    return help_message
-
-def record_attendance(bot, c, conn, user_id, action, location):
-    now = get_datetime()
+def record_attendance(bot, c, conn, user_id, action, location, now=None):
+    # `now` is the time the command was posted, which differs from the
+    # current time when posts are replayed after a restart
+    if now is None:
+        now = get_datetime()
     date = now.strftime("%Y-%m-%d")
     time_now = now.strftime("%H:%M")
     
     if action == 'in':
         # Check if there's an existing 'in' record without an 'out' for the same day
-        c.execute("SELECT * FROM attendance WHERE user_id = ? AND date = ? AND time_out IS NULL", (user_id, date))
+        c.execute("SELECT 1 FROM attendance WHERE user_id = ? AND day = ? AND minute_out IS NULL", (user_id, day_number(date)))
         existing_record = c.fetchone()
         
         if existing_record:
             return f"Error: You are already checked in for {date}. Please check out first."
         else:
-            c.execute("INSERT INTO attendance VALUES (?, ?, ?, ?, ?)", 
+            c.execute("INSERT INTO attendance (user_id, date, time_in, time_out, location) VALUES (?, ?, ?, ?, ?)", 
                     (user_id, date, time_now, None, location))
     elif action == 'out':
-        c.execute("UPDATE attendance SET time_out = ?, location = ? WHERE user_id = ? AND date = ? AND time_out IS NULL", 
-                (time_now, location, user_id, date))
+        c.execute("UPDATE attendance SET time_out = ?, location = ? WHERE user_id = ? AND day = ? AND minute_out IS NULL", 
+                (time_now, location, user_id, day_number(date)))
         if c.rowcount == 0:
             return f"Error: No active check-in found for {date}. Please check in first."
 
+    refresh_daily_rollup(c, [(user_id, date)])
     conn.commit()
+    report_cache.invalidate(conn, [date])
     return (
         f"## 출퇴근 기록 (Attendance Record)\n"
         f"- **행동 (Action):** {action.capitalize()}\n"
@@ -157,26 +71,31 @@ def record_missing(bot, c, conn, user_id, date, time_in, time_out=None):
             f"- **날짜 (Date):** {date}\n"
             f"- **상태 (Status):** 출근 시간 형식이 잘못되었습니다 (Invalid check-in time format)\n"
         )
+    # Stored zero-padded, e.g. '9:30' as '09:30'
+    date, time_in = validator.normalize_date(date), validator.normalize_time(time_in)
     
     if time_out:
-        if validator.is_past(time_out, time_in):
+        if not validator.valid_time(time_out):
             return (
                 f"## 누락된 출퇴근 기록 (Missing Attendance Recorded)\n"
                 f"- **날짜 (Date):** {date}\n"
-                f"- **상태 (Status):** 퇴근 시간이 출근 시간보다 빠를 수 없습니다 (Check-out time cannot be earlier than check-in time)\n"
+                f"- **상태 (Status):** 퇴근 시간 형식이 잘못되었습니다 (Invalid check-out time format)\n"
             )
-        if not validator.valid_time(time_out):
+        time_out = validator.normalize_time(time_out)
+        if validator.is_past(time_out, time_in):
             return (
                 f"## 누락된 출퇴근 기록 (Missing Attendance Recorded)\n"
                 f"- **날짜 (Date):** {date}\n"
-                f"- **상태 (Status):** 퇴근 시간 형식이 잘못되었습니다 (Invalid check-out time format)\n"
+                f"- **상태 (Status):** 퇴근 시간이 출근 시간보다 빠를 수 없습니다 (Check-out time cannot be earlier than check-in time)\n"
             )
-        c.execute("INSERT INTO attendance VALUES (?, ?, ?, ?, ?)", 
+        c.execute("INSERT INTO attendance (user_id, date, time_in, time_out, location) VALUES (?, ?, ?, ?, ?)", 
                   (user_id, date, time_in, time_out, "Manual Entry"))
     else:
-        c.execute("UPDATE attendance SET time_out = ? WHERE user_id = ? AND date = ?", 
-                  (time_in, user_id, date))
+        c.execute("UPDATE attendance SET time_out = ? WHERE user_id = ? AND day = ?", 
+                  (time_in, user_id, day_number(date)))
+    refresh_daily_rollup(c, [(user_id, date)])
     conn.commit()
+    report_cache.invalidate(conn, [date])
     return (
         f"## 누락된 출퇴근 기록 (Missing Attendance Recorded)\n"
         f"- **날짜 (Date):** {date}\n"
@@ -185,7 +104,7 @@ def record_missing(bot, c, conn, user_id, date, time_in, time_out=None):
 
 def recent_records(bot, c, conn, user_id):
     # Print recent 7 days' attendance records
-    c.execute("SELECT * FROM attendance WHERE user_id = ? ORDER BY date DESC LIMIT 7", (user_id,))
+    c.execute("SELECT user_id, date, time_in, time_out, location FROM attendance WHERE user_id = ? ORDER BY day DESC LIMIT 7", (user_id,))
     records = reversed(c.fetchall())
 
     if not records:
@@ -221,13 +140,15 @@ def edit_record(bot, c, conn, user_id, index, date, time_in, time_out=None, loca
             f"- **날짜 (Date):** {date}\n"
             f"- **상태 (Status):** 출근 시간 형식이 잘못되었습니다 (Invalid check-in time format)\n"
         )
+    # Stored zero-padded, e.g. '9:30' as '09:30'
+    date, time_in = validator.normalize_date(date), validator.normalize_time(time_in)
     
     # Add ROWID to the selection to ensure unique record identification
     c.execute("""
         SELECT ROWID, user_id, date, time_in, time_out, location 
         FROM attendance 
         WHERE user_id = ? 
-        ORDER BY date DESC, time_in DESC 
+        ORDER BY day DESC, minute_in DESC 
         LIMIT 7
     """, (user_id,))
     records = list(reversed(c.fetchall()))
@@ -244,17 +165,18 @@ def edit_record(bot, c, conn, user_id, index, date, time_in, time_out=None, loca
         return "Error: Invalid record index."
 
     if time_out:
-        if validator.is_past(time_out, time_in):
+        if not validator.valid_time(time_out):
             return (
                 f"## 출퇴근 기록 수정 (Attendance Record Edited)\n"
                 f"- **날짜 (Date):** {date}\n"
-                f"- **상태 (Status):** 퇴근 시간이 출근 시간보다 빠를 수 없습니다 (Check-out time cannot be earlier than check-in time)\n"
+                f"- **상태 (Status):** 퇴근 시간 형식이 잘못되었습니다 (Invalid check-out time format)\n"
             )
-        if not validator.valid_time(time_out):
+        time_out = validator.normalize_time(time_out)
+        if validator.is_past(time_out, time_in):
             return (
                 f"## 출퇴근 기록 수정 (Attendance Record Edited)\n"
                 f"- **날짜 (Date):** {date}\n"
-                f"- **상태 (Status):** 퇴근 시간 형식이 잘못되었습니다 (Invalid check-out time format)\n"
+                f"- **상태 (Status):** 퇴근 시간이 출근 시간보다 빠를 수 없습니다 (Check-out time cannot be earlier than check-in time)\n"
             )
         # Use ROWID for precise record identification
         c.execute("""
@@ -269,7 +191,9 @@ def edit_record(bot, c, conn, user_id, index, date, time_in, time_out=None, loca
             WHERE ROWID = ?
         """, (date, time_in, location if location else location_old, row_id))
     
+    refresh_daily_rollup(c, [(user_id, date_old), (user_id, date)])
     conn.commit()
+    report_cache.invalidate(conn, [date_old, date])
     return (
         f"## 출퇴근 기록 수정 (Attendance Record Edited)\n"
         f"- **날짜 (Date):** {date}\n"
@@ -281,7 +205,7 @@ def edit_record(bot, c, conn, user_id, index, date, time_in, time_out=None, loca
 def delete_record(bot, c, conn, user_id, index):
     # Delete a record within recent 7 days (0-indexed)
     # Index is described in the recent_records function
-    c.execute("SELECT * FROM attendance WHERE user_id = ? ORDER BY date DESC LIMIT 7", (user_id,))
+    c.execute("SELECT user_id, date, time_in, time_out, location FROM attendance WHERE user_id = ? ORDER BY day DESC LIMIT 7", (user_id,))
     records = list(reversed(c.fetchall()))
 
     if not records:
@@ -293,8 +217,10 @@ def delete_record(bot, c, conn, user_id, index):
         return "Error: Invalid record index."
     
     user_id, date, time_in, time_out, location = record
-    c.execute("DELETE FROM attendance WHERE user_id = ? AND date = ?", (user_id, date))
+    c.execute("DELETE FROM attendance WHERE user_id = ? AND day = ?", (user_id, day_number(date)))
+    refresh_daily_rollup(c, [(user_id, date)])
     conn.commit()
+    report_cache.invalidate(conn, [date])
     return (
         f"## 출퇴근 기록 삭제 (Attendance Record Deleted)\n"
         f"- **날짜 (Date):** {date}\n"
@@ -312,9 +238,31 @@ def record_vacation(bot, c, conn, user_id, start_date, end_date, reason):
             f"- **종료일 (End Date):** {end_date}\n"
             f"- **상태 (Status):** 날짜 형식이 잘못되었습니다 (Invalid date format)\n"
         )
+    start_date, end_date = validator.normalize_date(start_date), validator.normalize_date(end_date)
+    if validator.is_past(end_date, start_date):
+        return (
+            f"## 휴가 기록 (Vacation Record)\n"
+            f"- **시작일 (Start Date):** {start_date}\n"
+            f"- **종료일 (End Date):** {end_date}\n"
+            f"- **상태 (Status):** 종료일이 시작일보다 빠릅니다 (End date is before start date)\n"
+        )
+    # One vacation per day: the user's vacations overlapping the new one
+    overlapping = vacation_index.overlapping(conn, start_date, end_date, user_id)
+    if overlapping:
+        return (
+            f"## 휴가 기록 (Vacation Record)\n"
+            f"- **시작일 (Start Date):** {start_date}\n"
+            f"- **종료일 (End Date):** {end_date}\n"
+            f"- **상태 (Status):** 기존 휴가와 겹칩니다 (Overlaps an existing vacation)\n"
+            + "".join(
+                f"  - {vacation.start_date} ~ {vacation.end_date}: {vacation.reason}\n" for vacation in overlapping
+            )
+        )
     c.execute("INSERT INTO vacations VALUES (?, ?, ?, ?)", 
               (user_id, start_date, end_date, reason))
     conn.commit()
+    vacation_index.add(conn, user_id, start_date, end_date, reason)
+    report_cache.invalidate_range(conn, start_date, end_date)
     return (
         f"## 휴가 기록 (Vacation Record)\n"
         f"- **시작일 (Start Date):** {start_date}\n"
@@ -322,7 +270,52 @@ def record_vacation(bot, c, conn, user_id, start_date, end_date, reason):
         f"- **상태 (Status):** 성공적으로 기록됨 (Successfully recorded)\n"
     )
 
-def get_team_status(bot, c, conn, day=None):
+def get_vacation_balance(bot, c, conn, user_id, year=None):
+    # YYYY
+    if year is None:
+        year = get_datetime().strftime("%Y")
+    elif not year.isdigit() or len(year) != 4:
+        return (
+            f"## 오류: 잘못된 날짜 형식 (Error: Invalid date format)\n"
+            f"올바른 형식: `YYYY`\n"
+            f"예시: `2024`\n"
+        )
+
+    # Only working days count, so weekends and public holidays within a vacation are free
+    first_day, last_day = datetime.date(int(year), 1, 1), datetime.date(int(year), 12, 31)
+    working_days = WorkingDays(c, conn)
+    vacations = vacation_index.overlapping(conn, first_day, last_day, user_id)
+    used = vacation_days(working_days, vacations, first_day, last_day)
+    allowance = configs.vacation_days_per_year
+
+    lines = [
+        f"## 휴가 잔여 (Vacation Balance) {year}",
+        f"- **연차 (Allowance):** {allowance}일 (days)",
+        f"- **사용 (Used):** {used}일 (days)",
+        f"- **잔여 (Remaining):** {allowance - used}일 (days)",
+    ]
+    if vacations:
+        lines.append("#### 휴가 목록 (Vacations)")
+        for vacation in vacations:
+            days = vacation_days(working_days, [vacation], first_day, last_day)
+            lines.append(f"- {vacation.start_date} ~ {vacation.end_date} ({days}일 days): {vacation.reason}")
+    return "\n".join(lines)
+
+def _day_status(c, conn, day):
+    # (on_vacation, at_work, attended) of everyone with an attendance or vacation record for the day
+    c.execute("""
+        SELECT user_id, MAX(minute_out IS NULL) AS at_work
+        FROM attendance
+        WHERE day = ?
+        GROUP BY user_id
+    """, (day_number(day),))
+    status = {user_id: (0, at_work, 1) for user_id, at_work in c.fetchall()}
+    for user_id in vacation_index.on_vacation(conn, day):
+        _, at_work, attended = status.get(user_id, (0, 0, 0))
+        status[user_id] = (1, at_work, attended)
+    return status
+
+def get_team_status(bot, c, conn, day=None, channel_id=None):
     # Get the attendance status of all team members for the current date if date is not specified    
     if day is None:
         # Get the current date in the team's timezone
@@ -338,39 +331,40 @@ def get_team_status(bot, c, conn, day=None):
     
     # Check if the day is a holiday
     y, m, d = map(int, day.split('-'))
-    if cal.is_holiday(date(y, m, d)):
+    if WorkingDays(c, conn).is_holiday(date(y, m, d)):
         return "#### :calendar: Team Status\n**The date is not a working day.**"
     
     status_messages = []
     
     # Get team members
-    # Get channel info to retrieve team_id
-    channel_info = bot.channels.get_channel(channel_id_attendance)
-    team_id = channel_info['team_id']
-    team_members = bot.teams.get_team_members(team_id)
-
-    for member in team_members:
-        user_id = member['user_id']
-        user = bot.users.get_user(user_id)
+    # Channel team, roster and profiles come from the shared cache
+    directory = get_directory(bot)
+    # The members of the team owning the attendance channel
+    team_id = directory.get_team_id(channel_id or configs.channel_id_attendance)
+    member_ids = directory.get_team_member_ids(team_id)
+    users = directory.get_users(member_ids)
+
+    # Attendance and vacation state of everyone with a record for the day, in one query.
+    # Shared by everyone asking for the same day until a write touches that day.
+    day_status, token = report_cache.lookup(conn, 'status', day)
+    if day_status is None:
+        day_status = _day_status(c, conn, day)
+        report_cache.store(token, day_status)
+
+    for user_id in member_ids:
+        user = users.get(user_id)
         
         # Skip bots and deactivated users
-        if user.get('is_bot') or user.get('delete_at') != 0:
+        if user is None or user.get('is_bot') or user.get('delete_at') != 0:
             continue
 
         username = user['username']  # You can choose 'first_name', 'last_name', 'nickname' as preferred
+        on_vacation, at_work, attended = day_status.get(user_id, (0, 0, 0))
         
-        # Get attendance status
-        c.execute("SELECT * FROM attendance WHERE user_id = ? AND date = ?", (user_id, day))
-        attendance = c.fetchone()
-        
-        # Check for vacation
-        c.execute("SELECT * FROM vacations WHERE user_id = ? AND ? BETWEEN start_date AND end_date", (user_id, day))
-        vacation = c.fetchone()
-        
-        if vacation:
+        if on_vacation:
             status = ":palm_tree: On vacation"
-        elif attendance:
-            if attendance[3]:  # time_out
+        elif attended:
+            if not at_work:
                 status = ":door: Left work"
             else:
                 status = ":computer: At work"
@@ -385,6 +379,27 @@ def get_team_status(bot, c, conn, day=None):
         return "#### :warning: Team Status\n**No team members with attendance records found.**"
 
 
+def _monthly_stats(c, conn, first_day):
+    next_month = datetime.date(first_day.year + first_day.month // 12, first_day.month % 12 + 1, 1)
+    last_day = next_month - datetime.timedelta(days=1)
+    frame = analytics.load_attendance(c, first_day, last_day)
+    users = analytics.user_stats(frame, minute_of_day(configs.late_after))
+    percentiles = analytics.hour_percentiles(frame)
+
+    return {
+        # user_id -> (avg hours, stdev, attended days)
+        'users': {
+            user_id: (float(users.mean_hours[i]), float(users.stdev_hours[i]), int(users.days[i]))
+            for i, user_id in enumerate(users.user_ids)
+        },
+        'avg_hours': float(frame.hours.mean()) if len(frame) else None,
+        'avg_attended_days': float(users.days.mean()) if len(users.user_ids) else None,
+        # Team-wide median and 90th percentile of the daily hours
+        'hours_percentiles': percentiles,
+        # Working days of the month, for comparison with the attended days
+        'working_days': WorkingDays(c, conn).working_days_between(first_day, last_day),
+    }
+
 def get_monthly_report(bot, c, conn, requested_user, year=None, month=None):
     # YYYY-MM
     if year is None or month is None:
@@ -399,104 +414,280 @@ def get_monthly_report(bot, c, conn, requested_user, year=None, month=None):
                 f"예시: `2024-08`\n"
             )
     
-    c.execute("SELECT * FROM attendance WHERE strftime('%Y', date) = ? AND strftime('%m', date) = ?", (year, month))
-    records = c.fetchall()
-    
-    report = {}
-    
-    for record in records:
-        user_id, date, time_in, time_out, location = record
-        
-        if user_id not in report:
-            report[user_id] = {}
-        if date not in report[user_id]:
-            report[user_id][date] = []
-        if time_out is None:
-            # Ignore records without a check-out time
-            continue
-        
-        report[user_id][date].append((time_in, time_out, location))
-
-    # Calculate statistics
-    requested_user_hours = []
-    all_users_hours = []
-    users_attended_days = {}  # Dictionary to store attended days per user
-
-    # Initialize attended days counter for each user
-    for user_id in report.keys():
-        users_attended_days[user_id] = set()
-
-    # Calculate hours and attended days
-    for user_id, user_records in report.items():
-        for date, day_records in user_records.items():
-            daily_hours = 0
-            for time_in, time_out, location in day_records:
-                time_in_dt = datetime.datetime.strptime(time_in, "%H:%M")
-                time_out_dt = datetime.datetime.strptime(time_out, "%H:%M")
-                hours_worked = (time_out_dt - time_in_dt).total_seconds() / 3600
-                daily_hours += hours_worked
-            
-            all_users_hours.append(daily_hours)
-            users_attended_days[user_id].add(date)
-            
-            if user_id == requested_user:
-                requested_user_hours.append(daily_hours)
-
-    # Calculate requested user's stats
-    if requested_user in users_attended_days and requested_user_hours:
-        requested_user_avg_hours = mean(requested_user_hours)
-        requested_user_stdev_hours = stdev(requested_user_hours) if len(requested_user_hours) > 1 else 0
+    # Statistics of the month, shared by everyone asking for the month
+    # until a write touches one of its days
+    first_day = datetime.date(int(year), int(month), 1)
+    stats, token = report_cache.lookup(conn, 'month', first_day.strftime("%Y-%m"))
+    if stats is None:
+        stats = _monthly_stats(c, conn, first_day)
+        report_cache.store(token, stats)
+
+    # Requested user's stats
+    if requested_user in stats['users']:
+        requested_user_avg_hours, requested_user_stdev_hours, attended_days = stats['users'][requested_user]
         requested_user_stats = f"#### Requested User Stats\n" \
                                f"- **Avg hours**: {requested_user_avg_hours:.2f}\n" \
                                f"- **Stdev**: {requested_user_stdev_hours:.2f}\n" \
-                               f"- **Attended days**: {len(users_attended_days[requested_user])}"
+                               f"- **Attended days**: {attended_days}"
     else:
         requested_user_stats = "#### Requested User Stats\n**No attendance records**"
 
-    # Calculate all users' average stats
-    if all_users_hours:
-        all_users_avg_hours = mean(all_users_hours)
-        # Calculate average attended days across all users
-        all_users_avg_attended_days = mean([len(days) for days in users_attended_days.values()])
+    # All users' average stats
+    if stats['users']:
+        p50, p90 = stats['hours_percentiles']
         all_users_stats = f"#### All Users Stats\n" \
-                          f"- **Avg hours**: {all_users_avg_hours:.2f}\n" \
-                          f"- **Avg attended days**: {all_users_avg_attended_days:.2f}"
+                          f"- **Avg hours**: {stats['avg_hours']:.2f}\n" \
+                          f"- **Hours p50 / p90**: {p50:.2f} / {p90:.2f}\n" \
+                          f"- **Avg attended days**: {stats['avg_attended_days']:.2f}\n" \
+                          f"- **Working days**: {stats['working_days']}"
     else:
         all_users_stats = "#### All Users Stats\n**No attendance records**"
 
     return f"{requested_user_stats}\n\n{all_users_stats}"
 
 
-def fix_database(bot, c, conn):
-    # Fix the database for any inconsistencies
-    # 1. Delete records with time_out but no time_in
-    # 2. Delete duplicate records
-    # 3. If time_in is "HH:MM:SS", change to "HH:MM"
-    # 4. If time_out is "HH:MM:SS", change to "HH:MM"
-    # 5. If time_in is over 24:00, change to 00:00
-    # 6. If time_out is over 24:00, change to 23:59
-    # 7. If time_in is recorded but time_out is not, set time_out to 23:59
-    c.execute("SELECT * FROM attendance")
-    records = c.fetchall()
+def _yearly_stats(c, conn, year):
+    first_day, last_day = datetime.date(year, 1, 1), datetime.date(year, 12, 31)
+    late_after = minute_of_day(configs.late_after)
+    frame = analytics.load_attendance(c, first_day, last_day)
+    users = analytics.user_stats(frame, late_after)
+
+    return {
+        # user_id -> (avg hours, stdev, attended days, late days)
+        'users': {user_id: users.get(user_id) for user_id in users.user_ids},
+        'avg_hours': float(frame.hours.mean()) if len(frame) else None,
+        'hours_percentiles': analytics.hour_percentiles(frame),
+        'avg_attended_days': float(users.days.mean()) if len(users.user_ids) else None,
+        'late_days': int(users.late_days.sum()),
+        # weekday -> (days, [p50, p90] of the first check-in, late days)
+        'weekdays': analytics.weekday_arrivals(frame, late_after),
+        'working_days': WorkingDays(c, conn).working_days_between(first_day, last_day),
+    }
+
+def get_yearly_report(bot, c, conn, requested_user, year=None):
+    # YYYY
+    if year is None:
+        year = get_datetime().strftime("%Y")
+    elif not year.isdigit() or len(year) != 4:
+        return (
+            f"## 오류: 잘못된 날짜 형식 (Error: Invalid date format)\n"
+            f"올바른 형식: `YYYY`\n"
+            f"예시: `2024`\n"
+        )
+
+    # Statistics of the year, shared like the monthly ones
+    stats, token = report_cache.lookup(conn, 'year', year)
+    if stats is None:
+        stats = _yearly_stats(c, conn, int(year))
+        report_cache.store(token, stats)
 
-    for record in records:
-        user_id, date, time_in, time_out, location = record
-        if time_out and not time_in:                        # 1. Delete records with time_out but no time_in
-            c.execute("DELETE FROM attendance WHERE user_id = ? AND date = ?", (user_id, date))
-        if time_in and time_out and time_in == time_out:  # 2. Delete duplicate records
-            c.execute("DELETE FROM attendance WHERE user_id = ? AND date = ?", (user_id, date))
-        if time_in and len(time_in) > 5:                  # 3. If time_in is "HH:MM:SS", change to "HH:MM"
-            c.execute("UPDATE attendance SET time_in = ? WHERE user_id = ? AND date = ?", (time_in[:5], user_id, date))
-        if time_out and len(time_out) > 5:                # 4. If time_out is "HH:MM:SS", change to "HH:MM"
-            c.execute("UPDATE attendance SET time_out = ? WHERE user_id = ? AND date = ?", (time_out[:5], user_id, date))
-        if time_in and time_in > "23:59":                 # 5. If time_in is over 24:00, change to 00:00
-            c.execute("UPDATE attendance SET time_in = ? WHERE user_id = ? AND date = ?", ("00:00", user_id, date))
-        if time_out and time_out > "23:59":               # 6. If time_out is over 24:00, change to 23:59
-            c.execute("UPDATE attendance SET time_out = ? WHERE user_id = ? AND date = ?", ("23:59", user_id, date))
-        if time_in and not time_out:                      # 7. If time_in is recorded but time_out is not, set time_out to 23:59
-            c.execute("UPDATE attendance SET time_out = ? WHERE user_id = ? AND date = ?", ("23:59", user_id, date))
-    conn.commit()
-    return "Database fixed successfully"
+    header = f"## :bar_chart: 연간 보고서 (Yearly Report) {year}"
+    if not stats['users']:
+        return f"{header}\n**No attendance records**"
+
+    # Requested user's stats
+    if requested_user in stats['users']:
+        avg_hours, stdev_hours, attended_days, late_days = stats['users'][requested_user]
+        requested_user_stats = f"#### Requested User Stats\n" \
+                               f"- **Avg hours**: {avg_hours:.2f}\n" \
+                               f"- **Stdev**: {stdev_hours:.2f}\n" \
+                               f"- **Attended days**: {attended_days}\n" \
+                               f"- **Late arrivals**: {late_days}"
+    else:
+        requested_user_stats = "#### Requested User Stats\n**No attendance records**"
+
+    p50, p90 = stats['hours_percentiles']
+    all_users_stats = f"#### All Users Stats\n" \
+                      f"- **Members with records**: {len(stats['users'])}\n" \
+                      f"- **Avg hours**: {stats['avg_hours']:.2f}\n" \
+                      f"- **Hours p50 / p90**: {p50:.2f} / {p90:.2f}\n" \
+                      f"- **Avg attended days**: {stats['avg_attended_days']:.2f}\n" \
+                      f"- **Late arrivals**: {stats['late_days']}\n" \
+                      f"- **Working days**: {stats['working_days']}"
+
+    # First check-in per weekday
+    rows = [
+        f"| {analytics.WEEKDAYS[weekday]} | {days} | {analytics.format_minutes(p50)} | "
+        f"{analytics.format_minutes(p90)} | {late_days} |"
+        for weekday, (days, (p50, p90), late_days) in sorted(stats['weekdays'].items())
+    ]
+    arrivals = f"#### Arrival by Weekday (late after {configs.late_after})\n" \
+               f"| Weekday | Days | Median | p90 | Late |\n" \
+               f"|---|---|---|---|---|\n" + "\n".join(rows)
+
+    return f"{header}\n{requested_user_stats}\n\n{all_users_stats}\n\n{arrivals}"
+
+
+def _attendance_rate_stats(c, conn, first_day, last_day):
+    working_days = WorkingDays(c, conn)
+    rates = analytics.attendance_rates(
+        analytics.load_attendance(c, first_day, last_day),
+        day_number(first_day),
+        [working_days.is_working_day(first_day + datetime.timedelta(days=i))
+         for i in range((last_day - first_day).days + 1)],
+        vacation_index.overlapping(conn, first_day, last_day)
+    )
+    return {
+        'through': last_day,
+        'working_days': working_days.working_days_between(first_day, last_day),
+        # user_id -> (attended, expected, vacation days, missing days)
+        'users': {
+            user_id: (int(rates.attended[i]), int(rates.expected[i]), int(rates.vacation[i]),
+                      [day_from_number(int(day)) for day in rates.missing[i]])
+            for i, user_id in enumerate(rates.user_ids)
+        },
+    }
+
+def _rate(attended, expected):
+    return f"{attended / expected * 100:.1f}%" if expected else "n/a"
+
+def get_attendance_rate(bot, c, conn, requested_user, year=None, month=None, channel_id=None):
+    # YYYY-MM
+    today = get_datetime().date()
+    if year is None or month is None:
+        year, month = today.strftime("%Y"), today.strftime("%m")
+    elif not year.isdigit() or not month.isdigit():
+        return (
+            f"## 오류: 잘못된 날짜 형식 (Error: Invalid date format)\n"
+            f"올바른 형식: `YYYY-MM`\n"
+            f"예시: `2024-08`\n"
+        )
+
+    # Days after today are not missed yet
+    first_day = datetime.date(int(year), int(month), 1)
+    next_month = datetime.date(first_day.year + first_day.month // 12, first_day.month % 12 + 1, 1)
+    last_day = min(next_month - datetime.timedelta(days=1), today)
+    header = f"## :chart_with_upwards_trend: 출근율 (Attendance Rate) {first_day.strftime('%Y-%m')}"
+    if last_day < first_day:
+        return f"{header}\n**No working days yet**"
+
+    # Shared like the monthly report; recomputed once the month has more days behind it
+    stats, token = report_cache.lookup(conn, 'rate', first_day.strftime("%Y-%m"))
+    if stats is None or stats['through'] != last_day:
+        stats = _attendance_rate_stats(c, conn, first_day, last_day)
+        report_cache.store(token, stats)
+
+    # Everyone on the team counts, including members without any record
+    directory = get_directory(bot)
+    member_ids = directory.get_team_member_ids(directory.get_team_id(channel_id or configs.channel_id_attendance))
+    users = directory.get_users(member_ids)
+    active = [
+        user_id for user_id in member_ids
+        if (user := users.get(user_id)) is not None and not user.get('is_bot') and user.get('delete_at') == 0
+    ]
+
+    def user_stats(user_id):
+        if user_id in stats['users']:
+            return stats['users'][user_id]
+        return 0, stats['working_days'], 0, None
+
+    # Requested user's stats
+    attended, expected, vacation_days, missing = user_stats(requested_user)
+    if missing is None:
+        missing_days = "모든 근무일 (Every working day)" if expected else "-"
+    else:
+        missing_days = ", ".join(day.isoformat() for day in missing) or "-"
+    requested_user_stats = f"#### Requested User Stats\n" \
+                           f"- **Attendance rate**: {_rate(attended, expected)} ({attended} / {expected})\n" \
+                           f"- **Vacation days**: {vacation_days}\n" \
+                           f"- **Missing days**: {missing_days}"
+
+    # All users' stats
+    team = [user_stats(user_id) for user_id in active]
+    rates = [attended / expected for attended, expected, _, _ in team if expected]
+    total_attended = sum(attended for attended, _, _, _ in team)
+    total_expected = sum(expected for _, expected, _, _ in team)
+    all_users_stats = f"#### All Users Stats\n" \
+                      f"- **Members**: {len(team)}\n" \
+                      f"- **Attendance rate**: {_rate(total_attended, total_expected)} ({total_attended} / {total_expected})\n" \
+                      f"- **Median rate**: {_rate(median(rates), 1) if rates else 'n/a'}\n" \
+                      f"- **Members with missing days**: {sum(attended < expected for attended, expected, _, _ in team)}\n" \
+                      f"- **Working days**: {stats['working_days']} (~{last_day.isoformat()})"
+
+    return f"{header}\n{requested_user_stats}\n\n{all_users_stats}"
+
+
+# Repair rules of fix_database, applied in order. Each is one set-based
+# statement; {scope} limits it to the rows touched since the last run.
+FIX_RULES = (
+    # 1. If time_in is "H:MM", change to "0H:MM" (which re-encodes minute_in)
+    ("Zero-padded check-in hours",
+     "UPDATE attendance SET time_in = '0' || time_in WHERE time_in GLOB '[0-9]:*' {scope}"),
+    # 2. If time_out is "H:MM", change to "0H:MM"
+    ("Zero-padded check-out hours",
+     "UPDATE attendance SET time_out = '0' || time_out WHERE time_out GLOB '[0-9]:*' {scope}"),
+    # 3. Delete records with time_out but no time_in
+    ("Deleted records without check-in",
+     "DELETE FROM attendance WHERE minute_out IS NOT NULL AND minute_in IS NULL {scope}"),
+    # 4. Delete duplicate records
+    ("Deleted records with equal check-in and check-out",
+     "DELETE FROM attendance WHERE minute_in = minute_out {scope}"),
+    # 5. If time_in is "HH:MM:SS", change to "HH:MM"
+    ("Trimmed check-in seconds",
+     "UPDATE attendance SET time_in = substr(time_in, 1, 5) WHERE length(time_in) > 5 {scope}"),
+    # 6. If time_out is "HH:MM:SS", change to "HH:MM"
+    ("Trimmed check-out seconds",
+     "UPDATE attendance SET time_out = substr(time_out, 1, 5) WHERE length(time_out) > 5 {scope}"),
+    # 7. If time_in is over 24:00, change to 00:00
+    ("Clamped check-in past 23:59",
+     "UPDATE attendance SET time_in = '00:00' WHERE minute_in > 1439 {scope}"),
+    # 8. If time_out is over 24:00, change to 23:59
+    ("Clamped check-out past 23:59",
+     "UPDATE attendance SET time_out = '23:59' WHERE minute_out > 1439 {scope}"),
+    # 9. If time_in is recorded but time_out is not, set time_out to 23:59
+    ("Closed records without check-out",
+     "UPDATE attendance SET time_out = '23:59' WHERE minute_in IS NOT NULL AND minute_out IS NULL {scope}"),
+)
+
+def fix_database(bot, c, conn, incremental=False):
+    # Fix the database for any inconsistencies, see FIX_RULES.
+    # Every write to attendance is logged in attendance_changes by a trigger.
+    # The incremental mode only examines rows logged after the watermark
+    # stored by the last successful run; without a watermark it runs in full.
+    c.execute("SELECT value FROM meta WHERE key = 'fix_database_watermark'")
+    row = c.fetchone()
+    if incremental and row is not None:
+        scope = "AND rowid IN (SELECT row_id FROM attendance_changes WHERE seq > ?)"
+        params = (row[0],)
+    else:
+        incremental = False
+        scope = ""
+        params = ()
+
+    counts = []
+    try:
+        # Days whose rollup may change, collected before rows are deleted
+        if incremental:
+            c.execute(f"SELECT DISTINCT user_id, date FROM attendance WHERE 1 {scope}", params)
+            touched = c.fetchall()
+
+        for description, statement in FIX_RULES:
+            c.execute(statement.format(scope=scope), params)
+            counts.append((description, c.rowcount))
+
+        if incremental:
+            refresh_daily_rollup(c, touched)
+
+        # The repairs above are logged too, so the watermark is taken after them
+        c.execute("SELECT COALESCE(MAX(seq), 0) FROM attendance_changes")
+        watermark = c.fetchone()[0]
+        c.execute("INSERT OR REPLACE INTO meta VALUES ('fix_database_watermark', ?)", (watermark,))
+        c.execute("DELETE FROM attendance_changes WHERE seq <= ?", (watermark,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    if incremental:
+        report_cache.invalidate(conn, [date for _, date in touched])
+    else:
+        # Also drops the cached reports
+        rebuild_daily_rollup(c, conn)
+
+    return (
+        f"Database fixed successfully ({'incremental' if incremental else 'full'})\n"
+        + "\n".join(f"- {description}: {count}" for description, count in counts)
+    )
 
 ################################
 ### Member Management System ###
@@ -504,8 +695,10 @@ def fix_database(bot, c, conn):
 def add_member(bot, c, conn, user_id, username, position, phone, email, birthday):
     # table name: members_info
     # columns: user_id, name, phone, email, birthday
-    c.execute("INSERT INTO members_info VALUES (?, ?, ?, ?, ?, ?)", 
-              (user_id, username, position, phone, email, birthday))
+    c.execute("""
+        INSERT INTO members_info (user_id, name, position, phone, email, birthday, birthday_md)
+        VALUES (?, ?, ?, ?, ?, ?, strftime('%m-%d', ?))
+    """, (user_id, username, position, phone, email, birthday, birthday))
     conn.commit()
     return f"Member added: {username}"
 
@@ -515,7 +708,7 @@ def delete_member(bot, c, conn, user_id):
     return "Member deleted"
 
 def get_member(bot, c, conn, user_id):
-    c.execute("SELECT * FROM members_info WHERE user_id = ?", (user_id,))
+    c.execute("SELECT user_id, name, position, phone, email, birthday FROM members_info WHERE user_id = ?", (user_id,))
     member_info = c.fetchone()
     if member_info:
         user_id, name, position, phone, email, birthday = member_info
@@ -535,6 +728,16 @@ def get_member(bot, c, conn, user_id):
 def update_member(bot, c, conn, user_id, position=None, phone=None, email=None, birthday=None):
     # table name: members_info
     # columns: user_id, name, phone, email, birthday
+    c.execute("SELECT 1 FROM members_info WHERE user_id = ?", (user_id,))
+    if c.fetchone() is None:
+        return (
+            f"## 오류: 멤버가 존재하지 않음 (Error: Member does not exist)\n"
+            f"멤버 {user_id}가 존재하지 않습니다.\n"
+            f"멤버를 추가하려면 `!addmember`를 사용하세요.\n"
+            f"\n"
+            f"Member {user_id} does not exist.\n"
+            f"Use `!addmember` to add the member.\n"
+        )
     if position:
         c.execute("UPDATE members_info SET position = ? WHERE user_id = ?", (position, user_id))
     if phone:
@@ -542,6 +745,6 @@ def update_member(bot, c, conn, user_id, position=None, phone=None, email=None,
     if email:
         c.execute("UPDATE members_info SET email = ? WHERE user_id = ?", (email, user_id))
     if birthday:
-        c.execute("UPDATE members_info SET birthday = ? WHERE user_id = ?", (birthday, user_id))
+        c.execute("UPDATE members_info SET birthday = ?, birthday_md = strftime('%m-%d', ?) WHERE user_id = ?", (birthday, birthday, user_id))
     conn.commit()
     return "Member info updated"
@@ -1,8 +1,10 @@
 import os
 import json
 import datetime
+import threading
+from dataclasses import dataclass, replace
+from typing import List
 import pytz
-from workalendar.asia import SouthKorea
 
 def get_datetime(day=None):
     return datetime.datetime.now(pytz.utc).astimezone(tz)
@@ -12,21 +14,139 @@ def load_config():
         return json.load(f)
 
 tz = pytz.timezone('Asia/Seoul')
-cal = SouthKorea()
-
-configs = load_config()
-DEBUG = configs['DEBUG']
-mattermost_url = configs['mattermost_url']
-bot_token = configs['bot_token']
-if DEBUG:
-    channel_id_attendance = channel_id_birthday = configs['channel_id_debug']
-    DB_PATH = configs['db_path_debug']
-else:
-    channel_id_attendance = configs['channel_id_attendance']   # attendance channel
-    channel_id_birthday = configs['channel_id_birthday']       # birthday channel
-    # Use an environment variable with a default fallback
-    DB_PATH = os.environ.get('DB_PATH', configs['db_path'])
-
-channel_id_admin = configs['channel_id_admin']  # admin channel
-
-channels_to_monitor = [channel_id_attendance, channel_id_admin]
+
+@dataclass(frozen=True)
+class TeamConfig:
+    """One team served by the bot: its channels, database shard and schedule."""
+    name: str
+    channel_id_attendance: str
+    channel_id_birthday: str
+    channel_id_admin: str
+    db_path: str
+    # Local times (HH:MM) of the birthday greetings and of the automatic checkout
+    greeting_time: str = '12:00'
+    checkout_time: str = '23:59'
+
+    @property
+    def channels_to_monitor(self) -> List[str]:
+        return [self.channel_id_attendance, self.channel_id_admin]
+
+def _team(name: str, configs: dict, DEBUG: bool) -> TeamConfig:
+    if DEBUG:
+        channel_id_attendance = channel_id_birthday = configs['channel_id_debug']
+        db_path = configs['db_path_debug']
+    else:
+        channel_id_attendance = configs['channel_id_attendance']   # attendance channel
+        channel_id_birthday = configs['channel_id_birthday']       # birthday channel
+        db_path = configs['db_path']
+    return TeamConfig(
+        name,
+        channel_id_attendance,
+        channel_id_birthday,
+        configs['channel_id_admin'],  # admin channel
+        db_path,
+        configs.get('greeting_time', '12:00'),
+        configs.get('checkout_time', '23:59') if not DEBUG else '00:00'
+    )
+
+def _debug_db_path(db_path_debug: str, name: str) -> str:
+    root, ext = os.path.splitext(db_path_debug)
+    return f"{root}-{name}{ext}"
+
+def _teams(configs: dict, DEBUG: bool) -> List[TeamConfig]:
+    """
+    The teams listed under "teams", each entry falling back to the top-level
+    keys; without the list, the top-level keys describe the only team.
+    """
+    if not configs.get('teams'):
+        team = _team('default', configs, DEBUG)
+        if not DEBUG:
+            # Use an environment variable with a default fallback
+            team = replace(team, db_path=os.environ.get('DB_PATH', team.db_path))
+        return [team]
+
+    teams = []
+    for entry in configs['teams']:
+        team_configs = dict(configs, **entry)
+        if DEBUG and 'db_path_debug' not in entry:
+            # Each team gets its own debug database, named after it: debugdb.db -> debugdb-lab-a.db
+            team_configs['db_path_debug'] = _debug_db_path(configs['db_path_debug'], entry['name'])
+        teams.append(_team(entry['name'], team_configs, DEBUG))
+    # Posts are routed to a team by channel, and every team needs its own shard
+    for field in ('name', 'db_path'):
+        values = [getattr(team, field) for team in teams]
+        if len(set(values)) != len(values):
+            raise ValueError(f"Every team needs its own {field} in configs.json")
+    channels = [channel_id for team in teams for channel_id in set(team.channels_to_monitor)]
+    if DEBUG:
+        # A debug channel shared by every team is answered by the first one
+        channels = [channel_id for channel_id in channels if channel_id != configs['channel_id_debug']]
+    if len(set(channels)) != len(channels):
+        raise ValueError("A channel is monitored for more than one team in configs.json")
+    return teams
+
+def _settings(configs: dict) -> dict:
+    """The settings derived from configs.json, by name."""
+    settings = {'configs': configs}
+    settings['DEBUG'] = DEBUG = configs['DEBUG']
+    settings['mattermost_url'] = configs['mattermost_url']
+    settings['bot_token'] = configs['bot_token']
+    settings['mattermost_scheme'] = configs.get('mattermost_scheme', 'https')
+    settings['mattermost_port'] = configs.get('mattermost_port', 8443)
+    # Receive posts over the WebSocket API; REST polling is then only used to catch up
+    settings['use_websocket'] = configs.get('use_websocket', True)
+    # Number of channels fetched concurrently when polling over REST
+    settings['poll_workers'] = configs.get('poll_workers', 8)
+    # Number of posts fetched per channel per iteration while catching up after a restart
+    settings['catchup_page_size'] = configs.get('catchup_page_size', 100)
+    # Background delivery of replies: worker threads, queue bound, posts per second and burst size
+    settings['outbound_workers'] = configs.get('outbound_workers', 4)
+    settings['outbound_queue_size'] = configs.get('outbound_queue_size', 1000)
+    settings['outbound_rate'] = configs.get('outbound_rate', 10)
+    settings['outbound_burst'] = configs.get('outbound_burst', 20)
+    # Serve Prometheus metrics at http://metrics_host:metrics_port/metrics; disabled unless a port is set
+    settings['metrics_port'] = configs.get('metrics_port')
+    settings['metrics_host'] = configs.get('metrics_host', '0.0.0.0')
+    # Log SQLite statements slower than this many milliseconds; disabled unless set
+    settings['slow_query_ms'] = configs.get('slow_query_ms')
+    # Profile the first BOT_PROFILE commands after startup; `!profile N` does the same at runtime
+    settings['profile_commands'] = int(os.environ.get('BOT_PROFILE', 0))
+    settings['profile_dir'] = os.environ.get('BOT_PROFILE_DIR', configs.get('profile_dir', 'profiles'))
+    # Leader election between replicas sharing the database: only the replica holding the
+    # lease handles posts and runs jobs; a standby takes over within lease_ttl seconds (null disables)
+    settings['lease_ttl'] = configs.get('lease_ttl')
+    settings['replica_id'] = os.environ.get('BOT_REPLICA_ID', configs.get('replica_id'))
+    # First check-ins after this local time (HH:MM) count as late arrivals in !yearlyreport
+    settings['late_after'] = configs.get('late_after', '10:00')
+    # Vacation days per year, counted in working days by !vacationbalance
+    settings['vacation_days_per_year'] = configs.get('vacation_days_per_year', 15)
+    # Seconds cached reports and vacations are reused; picks up writes made outside this process (null keeps them until a write here)
+    settings['cache_ttl'] = configs.get('cache_ttl', 60)
+    # One process can serve several teams, each with its own channels and database shard
+    settings['teams'] = teams = _teams(configs, DEBUG)
+    # The first team's channels and database
+    settings['channel_id_attendance'] = teams[0].channel_id_attendance
+    settings['channel_id_birthday'] = teams[0].channel_id_birthday
+    settings['channel_id_admin'] = teams[0].channel_id_admin
+    settings['DB_PATH'] = teams[0].db_path
+
+    settings['channels_to_monitor'] = [channel_id for team in teams for channel_id in team.channels_to_monitor]
+    return settings
+
+# configs.json is read on the first access to one of its settings
+# (e.g. `configs.DB_PATH`), not at import
+_loaded = None
+_lock = threading.Lock()
+
+def __getattr__(name):
+    global _loaded
+    if name.startswith('__'):
+        raise AttributeError(name)
+    if _loaded is None:
+        with _lock:
+            if _loaded is None:
+                _loaded = _settings(load_config())
+    try:
+        return _loaded[name]
+    except KeyError:
+        raise AttributeError(f"module 'configs' has no attribute '{name}'") from None
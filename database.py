@@ -0,0 +1,315 @@
+import sys
+import sqlite3
+import logging
+from typing import Callable, Dict, List, Tuple
+
+from timecodes import SQL_DAY_NUMBER, SQL_MINUTES
+
+# Get the logger in main.py
+logger = logging.getLogger('bot')
+
+SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS attendance
+       (user_id TEXT, date TEXT, time_in TEXT, time_out TEXT, location TEXT)''',
+
+    '''CREATE TABLE IF NOT EXISTS vacations
+       (user_id TEXT, start_date TEXT, end_date TEXT, reason TEXT)''',
+
+    # Integrity check for user_id in members_info
+    # user_id is a unique key in members_info
+    '''CREATE TABLE IF NOT EXISTS members_info
+       (user_id TEXT PRIMARY KEY, name TEXT, position TEXT, phone TEXT, email TEXT, birthday TEXT)''',
+
+    # Newest handled post per monitored channel, so restarts resume where they stopped
+    '''CREATE TABLE IF NOT EXISTS channel_cursors
+       (channel_id TEXT PRIMARY KEY, create_at INTEGER, post_id TEXT)''',
+
+    # Ids of recently handled posts, so a post is never handled twice
+    '''CREATE TABLE IF NOT EXISTS processed_posts
+       (post_id TEXT PRIMARY KEY, create_at INTEGER)''',
+
+    # Direct message channel between the bot and each user
+    '''CREATE TABLE IF NOT EXISTS dm_channels
+       (user_id TEXT PRIMARY KEY, channel_id TEXT)''',
+
+    # Time each scheduled job last ran (ISO 8601), so missed runs are caught up after a restart
+    '''CREATE TABLE IF NOT EXISTS job_runs
+       (name TEXT PRIMARY KEY, last_run TEXT)''',
+
+    # Working days and holidays of each year as bitmaps, see workdays.py
+    '''CREATE TABLE IF NOT EXISTS working_days
+       (year INTEGER PRIMARY KEY, working BLOB, holidays BLOB)''',
+
+    # Which replica holds each lease and until when (Unix time), see lease.py
+    '''CREATE TABLE IF NOT EXISTS leases
+       (name TEXT PRIMARY KEY, holder TEXT, expires_at REAL)''',
+)
+
+
+##################
+### Migrations ###
+##################
+def _add_indexes(c: sqlite3.Cursor):
+    """Index the hot lookups and store each member's birthday as 'MM-DD'."""
+    c.execute("CREATE INDEX IF NOT EXISTS idx_attendance_user_date ON attendance (user_id, date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_attendance_date_time_out ON attendance (date, time_out)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_vacations_user_range ON vacations (user_id, start_date, end_date)")
+
+    c.execute("ALTER TABLE members_info ADD COLUMN birthday_md TEXT")
+    c.execute("UPDATE members_info SET birthday_md = strftime('%m-%d', birthday)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_members_birthday_md ON members_info (birthday_md)")
+
+
+def _add_vacation_range_index(c: sqlite3.Cursor):
+    """Index vacations by date range for whole-team lookups."""
+    c.execute("CREATE INDEX IF NOT EXISTS idx_vacations_range ON vacations (start_date, end_date)")
+
+
+def _add_attendance_changes(c: sqlite3.Cursor):
+    """Log every write to attendance, so repairs can run incrementally."""
+    c.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)")
+    c.execute("CREATE TABLE IF NOT EXISTS attendance_changes (seq INTEGER PRIMARY KEY AUTOINCREMENT, row_id INTEGER)")
+    c.execute("""
+        CREATE TRIGGER IF NOT EXISTS attendance_log_insert AFTER INSERT ON attendance
+        BEGIN
+            INSERT INTO attendance_changes (row_id) VALUES (NEW.rowid);
+        END
+    """)
+    c.execute("""
+        CREATE TRIGGER IF NOT EXISTS attendance_log_update AFTER UPDATE ON attendance
+        BEGIN
+            INSERT INTO attendance_changes (row_id) VALUES (NEW.rowid);
+        END
+    """)
+
+
+def _add_attendance_daily(c: sqlite3.Cursor):
+    """Add the per-user, per-day attendance rollup and fill it from raw attendance."""
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS attendance_daily
+        (date TEXT, user_id TEXT, worked_minutes INTEGER, sessions INTEGER,
+         PRIMARY KEY (date, user_id)) WITHOUT ROWID
+    """)
+    c.execute(f"""
+        INSERT INTO attendance_daily
+        SELECT date, user_id,
+               SUM(CASE WHEN time_out IS NOT NULL THEN {SQL_MINUTES.format('time_out')} - {SQL_MINUTES.format('time_in')} ELSE 0 END),
+               COUNT(*)
+        FROM attendance
+        GROUP BY date, user_id
+    """)
+
+
+def _add_daily_first_check_in(c: sqlite3.Cursor):
+    """Add the first check-in of each day to the attendance rollup, for the analytics reports."""
+    c.execute("ALTER TABLE attendance_daily ADD COLUMN first_minute_in INTEGER")
+    c.execute("DELETE FROM attendance_daily")
+    c.execute(f"""
+        INSERT INTO attendance_daily
+        SELECT date, user_id,
+               SUM(CASE WHEN time_out IS NOT NULL THEN {SQL_MINUTES.format('time_out')} - {SQL_MINUTES.format('time_in')} ELSE 0 END),
+               COUNT(*),
+               MIN({SQL_MINUTES.format('time_in')})
+        FROM attendance
+        GROUP BY date, user_id
+    """)
+
+
+# Integer encodings of an attendance row's text columns, see timecodes.py
+_ENCODED_COLUMNS = (
+    f"day = {SQL_DAY_NUMBER.format('date')}, "
+    f"minute_in = {SQL_MINUTES.format('time_in')}, "
+    f"minute_out = {SQL_MINUTES.format('time_out')}"
+)
+
+
+def _add_integer_columns(c: sqlite3.Cursor):
+    """Store attendance dates as day numbers and times as minutes since midnight."""
+    c.execute("ALTER TABLE attendance ADD COLUMN day INTEGER")
+    c.execute("ALTER TABLE attendance ADD COLUMN minute_in INTEGER")
+    c.execute("ALTER TABLE attendance ADD COLUMN minute_out INTEGER")
+
+    # The text columns stay the written form; triggers derive the integer
+    # columns from them, so every writer keeps them in sync
+    c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS attendance_encode_insert AFTER INSERT ON attendance
+        BEGIN
+            UPDATE attendance SET {_ENCODED_COLUMNS} WHERE rowid = NEW.rowid;
+        END
+    """)
+    c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS attendance_encode_update AFTER UPDATE OF date, time_in, time_out ON attendance
+        BEGIN
+            UPDATE attendance SET {_ENCODED_COLUMNS} WHERE rowid = NEW.rowid;
+        END
+    """)
+    # Log changes to the text columns only, not the encoding updates above
+    c.execute("DROP TRIGGER IF EXISTS attendance_log_update")
+    c.execute("""
+        CREATE TRIGGER attendance_log_update AFTER UPDATE OF user_id, date, time_in, time_out, location ON attendance
+        BEGIN
+            INSERT INTO attendance_changes (row_id) VALUES (NEW.rowid);
+        END
+    """)
+
+    # Existing rows were encoded in chunks after migrating; schema version 7
+    # replaces these columns with generated ones
+    c.execute("CREATE INDEX IF NOT EXISTS idx_attendance_user_day ON attendance (user_id, day)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_attendance_day_minute_out ON attendance (day, minute_out)")
+    c.execute("DROP INDEX IF EXISTS idx_attendance_user_date")
+    c.execute("DROP INDEX IF EXISTS idx_attendance_date_time_out")
+
+
+def _generate_integer_columns(c: sqlite3.Cursor):
+    """Compute the integer attendance columns from the text columns instead of storing them."""
+    # Version 5 stored them, filled by triggers: an INSERT was followed by an
+    # UPDATE of the same row, and rows written before it had to be backfilled.
+    # VIRTUAL generated columns take no space in the rows and are always in
+    # sync; only the indexes below store their values. The text columns stay
+    # the written form, so a row is no smaller than before version 5.
+    c.execute("DROP TRIGGER IF EXISTS attendance_encode_insert")
+    c.execute("DROP TRIGGER IF EXISTS attendance_encode_update")
+    c.execute("DROP TRIGGER IF EXISTS attendance_log_update")
+    c.execute("""
+        CREATE TRIGGER attendance_log_update AFTER UPDATE ON attendance
+        BEGIN
+            INSERT INTO attendance_changes (row_id) VALUES (NEW.rowid);
+        END
+    """)
+    c.execute("DROP INDEX IF EXISTS idx_attendance_user_day")
+    c.execute("DROP INDEX IF EXISTS idx_attendance_day_minute_out")
+    # Rewrites the table once, dropping the stored values
+    for column in ('day', 'minute_in', 'minute_out'):
+        c.execute(f"ALTER TABLE attendance DROP COLUMN {column}")
+    c.execute("DELETE FROM meta WHERE key = 'integer_backfill_done'")
+
+    c.execute(f"ALTER TABLE attendance ADD COLUMN day INTEGER GENERATED ALWAYS AS ({SQL_DAY_NUMBER.format('date')}) VIRTUAL")
+    c.execute(f"ALTER TABLE attendance ADD COLUMN minute_in INTEGER GENERATED ALWAYS AS ({SQL_MINUTES.format('time_in')}) VIRTUAL")
+    c.execute(f"ALTER TABLE attendance ADD COLUMN minute_out INTEGER GENERATED ALWAYS AS ({SQL_MINUTES.format('time_out')}) VIRTUAL")
+    c.execute("CREATE INDEX idx_attendance_user_day ON attendance (user_id, day)")
+    c.execute("CREATE INDEX idx_attendance_day_minute_out ON attendance (day, minute_out)")
+
+    # Refilled with the corrected encoding of unpadded 'H:MM' times
+    c.execute("DELETE FROM attendance_daily")
+    c.execute("""
+        INSERT INTO attendance_daily
+        SELECT date, user_id, SUM(COALESCE(minute_out - minute_in, 0)), COUNT(*), MIN(minute_in)
+        FROM attendance
+        GROUP BY date, user_id
+    """)
+
+
+# MIGRATIONS[i] upgrades a database from version i to version i + 1.
+# The version is stored in SQLite's `user_version` header field.
+MIGRATIONS: List[Callable[[sqlite3.Cursor], None]] = [
+    _add_indexes,
+    _add_vacation_range_index,
+    _add_attendance_changes,
+    _add_attendance_daily,
+    _add_integer_columns,
+    _add_daily_first_check_in,
+    _generate_integer_columns,
+]
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection):
+    """Apply every pending migration, each in its own transaction."""
+    c = conn.cursor()
+    version = schema_version(conn)
+    for target, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        logger.info(f"Migrating database to schema version {target}: {migration.__doc__}")
+        c.execute("BEGIN")
+        try:
+            migration(c)
+            c.execute(f"PRAGMA user_version = {target}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+
+def init_db(conn: sqlite3.Connection):
+    """Create missing tables and bring the schema up to date."""
+    c = conn.cursor()
+    for statement in SCHEMA:
+        c.execute(statement)
+    conn.commit()
+    migrate(conn)
+
+
+#########################
+### Query plan checks ###
+#########################
+# Queries run on every command or scheduled job, with representative parameters
+HOT_QUERIES: Dict[str, Tuple[str, tuple]] = {
+    'record_attendance': (
+        "SELECT 1 FROM attendance WHERE user_id = ? AND day = ? AND minute_out IS NULL",
+        ('user', 19936)
+    ),
+    'recent_records': (
+        "SELECT user_id, date, time_in, time_out, location FROM attendance WHERE user_id = ? ORDER BY day DESC LIMIT 7",
+        ('user',)
+    ),
+    'team_status': (
+        "SELECT user_id, MAX(minute_out IS NULL) FROM attendance WHERE day = ? GROUP BY user_id",
+        (19936,)
+    ),
+    'monthly_report': (
+        f"""SELECT user_id, {SQL_DAY_NUMBER.format('date')}, COALESCE(first_minute_in, -1), worked_minutes
+            FROM attendance_daily
+            WHERE date BETWEEN ? AND ?""",
+        ('2024-08-01', '2024-08-31')
+    ),
+    'auto_checkout': (
+        "SELECT user_id, location FROM attendance WHERE day = ? AND minute_out IS NULL",
+        (19936,)
+    ),
+    'daily_birthdays': (
+        "SELECT * FROM members_info WHERE birthday_md = ?",
+        ('08-01',)
+    ),
+    'monthly_birthdays': (
+        "SELECT * FROM members_info WHERE birthday_md BETWEEN ? AND ?",
+        ('08-01', '08-31')
+    ),
+}
+
+
+def explain(conn: sqlite3.Connection, sql: str, params: tuple = ()) -> List[str]:
+    """Return the EXPLAIN QUERY PLAN details of a statement."""
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def unindexed_hot_queries(conn: sqlite3.Connection) -> Dict[str, List[str]]:
+    """
+    Return the plans of hot queries that scan a table without an index.
+    An empty result means every hot query is answered from an index.
+    """
+    unindexed = {}
+    for name, (sql, params) in HOT_QUERIES.items():
+        plan = explain(conn, sql, params)
+        # "SCAN <table>" without "USING ... INDEX" reads the whole table;
+        # scans of subquery results ("SCAN (subquery-N)") are fine
+        if any(step.startswith('SCAN ') and not step.startswith('SCAN (') and 'USING' not in step
+               for step in plan):
+            unindexed[name] = plan
+    return unindexed
+
+
+if __name__ == '__main__':
+    # Usage: python database.py [db_path]
+    # Migrates the database and prints the query plan of every hot query
+    from configs import DB_PATH
+    conn = sqlite3.connect(sys.argv[1] if len(sys.argv) > 1 else DB_PATH)
+    init_db(conn)
+    for name, (sql, params) in HOT_QUERIES.items():
+        print(f"{name}:")
+        for step in explain(conn, sql, params):
+            print(f"    {step}")
+    unindexed = unindexed_hot_queries(conn)
+    print("All hot queries use an index." if not unindexed else f"Unindexed: {', '.join(unindexed)}")
+    sys.exit(1 if unindexed else 0)
@@ -0,0 +1,235 @@
+import time
+import zlib
+import queue
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import requests
+from mattermostdriver.exceptions import ResourceNotFound
+
+# Get the logger in main.py
+logger = logging.getLogger('bot')
+
+
+class DirectChannels:
+    """
+    Direct message channel ids between the bot and each user.
+
+    Ids are kept in memory and in the `dm_channels` table, so a channel is
+    only created (or looked up) through the API once per user, even across
+    restarts.
+    """
+
+    def __init__(self, bot, bot_user_id: str, c, conn):
+        self.bot = bot
+        self.bot_user_id = bot_user_id
+        self.c = c
+        self.conn = conn
+        self._lock = threading.Lock()
+
+        self.c.execute("SELECT user_id, channel_id FROM dm_channels")
+        self._channels: Dict[str, str] = dict(self.c.fetchall())
+
+    def get(self, user_id: str) -> str:
+        with self._lock:
+            if (channel_id := self._channels.get(user_id)) is not None:
+                return channel_id
+
+            channel_id = self.bot.channels.create_direct_message_channel(
+                [self.bot_user_id, user_id]
+            )['id']
+            self._channels[user_id] = channel_id
+            self.c.execute(
+                "INSERT OR REPLACE INTO dm_channels VALUES (?, ?)",
+                (user_id, channel_id)
+            )
+            self.conn.commit()
+            return channel_id
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            self._channels.pop(user_id, None)
+            self.c.execute("DELETE FROM dm_channels WHERE user_id = ?", (user_id,))
+            self.conn.commit()
+
+
+def send_direct_message(bot, channels: DirectChannels, user_id: str, message: str):
+    """Post a message to a user's DM channel, recreating the channel if it is gone."""
+    try:
+        return bot.posts.create_post({
+            'channel_id': channels.get(user_id),
+            'message': message
+        })
+    except ResourceNotFound:
+        logger.info(f"Cached DM channel of user {user_id} not found, creating it again")
+        channels.invalidate(user_id)
+        return bot.posts.create_post({
+            'channel_id': channels.get(user_id),
+            'message': message
+        })
+
+
+@dataclass
+class OutboundPost:
+    """A message waiting to be posted to a user's DM channel or to a channel."""
+    recipient: str
+    message: str
+    direct: bool = True
+    attempts: int = 0
+
+
+class TokenBucket:
+    """
+    Rate limiter shared by all delivery workers: `rate` posts per second on
+    average, with bursts of up to `capacity` posts.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then take it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """Hand out no tokens for `seconds`, e.g. after the server answered 429."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None)
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds to wait before retrying, as requested by a 429 response."""
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    for header in ('Retry-After', 'X-RateLimit-Reset'):
+        try:
+            return max(0.0, float(headers[header]))
+        except (KeyError, TypeError, ValueError):
+            continue
+    return None
+
+
+class OutboundQueue:
+    """
+    Deliver posts in the background so command handling never waits on the
+    chat server.
+
+    Posts are spread over `workers` threads, each with its own bounded
+    queue. A recipient always maps to the same worker, so posts to one user
+    arrive in the order they were enqueued. All workers share a token
+    bucket; a 429 response pauses the bucket for the time the server asks
+    for. Failed posts are retried with exponential backoff, up to
+    `max_retries` times, for 429, 5xx and connection errors.
+    """
+
+    def __init__(self, bot, dm_channels: DirectChannels, workers: int = 4, maxsize: int = 1000,
+                 rate: float = 10, burst: float = 20, max_retries: int = 5, backoff: float = 1.0):
+        self.bot = bot
+        self.dm_channels = dm_channels
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.bucket = TokenBucket(rate, burst)
+        self.sent = 0
+        self.failed = 0
+
+        self._queues: List[queue.Queue] = [
+            queue.Queue(maxsize=max(1, maxsize // workers)) for _ in range(workers)
+        ]
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        for index, posts in enumerate(self._queues):
+            thread = threading.Thread(target=self._work, args=(posts,), name=f'outbound-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 10):
+        """Stop the workers once everything already enqueued is delivered."""
+        for posts in self._queues:
+            posts.put(None)
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(timeout=max(0, deadline - time.monotonic()))
+
+    def depth(self) -> int:
+        """Number of posts waiting to be delivered."""
+        return sum(posts.qsize() for posts in self._queues)
+
+    def send_direct(self, user_id: str, message: str):
+        """Enqueue a message to a user's DM channel. Blocks only while the queue is full."""
+        self._enqueue(OutboundPost(user_id, message, direct=True))
+
+    def send_channel(self, channel_id: str, message: str):
+        """Enqueue a message to a channel. Blocks only while the queue is full."""
+        self._enqueue(OutboundPost(channel_id, message, direct=False))
+
+    def _enqueue(self, post: OutboundPost):
+        posts = self._queues[zlib.crc32(post.recipient.encode()) % len(self._queues)]
+        if posts.full():
+            logger.warning(f"Outbound queue full ({self.depth()} posts waiting), waiting for a free slot")
+        posts.put(post)
+
+    def _deliver(self, post: OutboundPost):
+        if post.direct:
+            send_direct_message(self.bot, self.dm_channels, post.recipient, post.message)
+        else:
+            self.bot.posts.create_post({'channel_id': post.recipient, 'message': post.message})
+
+    def _work(self, posts: queue.Queue):
+        while (post := posts.get()) is not None:
+            self._send(post)
+
+    def _send(self, post: OutboundPost):
+        while True:
+            self.bucket.acquire()
+            try:
+                self._deliver(post)
+                self.sent += 1
+                return
+            except Exception as e:
+                post.attempts += 1
+                status = _status_code(e)
+                retryable = (
+                    status == 429
+                    or (status is not None and status >= 500)
+                    or isinstance(e, (requests.ConnectionError, requests.Timeout))
+                )
+                if not retryable or post.attempts > self.max_retries:
+                    self.failed += 1
+                    logger.error(f"Failed to deliver post to {post.recipient} after {post.attempts} attempts: {e}")
+                    return
+
+                delay = self.backoff * 2 ** (post.attempts - 1)
+                if status == 429:
+                    delay = max(delay, _retry_after(e) or 0)
+                    self.bucket.pause(delay)
+                logger.warning(f"Retrying post to {post.recipient} in {delay:.1f}s (attempt {post.attempts}): {e}")
+                time.sleep(delay)
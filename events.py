@@ -0,0 +1,134 @@
+import ssl
+import json
+import asyncio
+import logging
+import threading
+from typing import Callable, Optional
+
+import websockets
+
+# Get the logger in main.py
+logger = logging.getLogger('bot')
+
+
+class EventListener:
+    """
+    Listen to the Mattermost WebSocket API in a background thread.
+
+    `posted` events are decoded and handed to `on_post`, every other event is
+    passed to `on_event` as-is. `on_connect` is called after each successful
+    authentication so the caller can catch up on posts missed while the
+    connection was down.
+    """
+
+    def __init__(self, options: dict, token: str,
+                 on_post: Callable[[dict], None],
+                 on_connect: Optional[Callable[[], None]] = None,
+                 on_event: Optional[Callable[[dict], None]] = None,
+                 reconnect_delay: float = 5):
+        self.options = options
+        self.token = token
+        self.on_post = on_post
+        self.on_connect = on_connect
+        self.on_event = on_event
+        self.reconnect_delay = reconnect_delay
+
+        self._alive = False
+        self._connected = threading.Event()
+        self._thread = None
+        self._loop = None
+        self._websocket = None
+
+    @property
+    def connected(self) -> bool:
+        return self._connected.is_set()
+
+    @property
+    def url(self) -> str:
+        scheme = 'wss' if self.options['scheme'] == 'https' else 'ws'
+        return (
+            f"{scheme}://{self.options['url']}:{self.options['port']}"
+            f"{self.options.get('basepath', '/api/v4')}/websocket"
+        )
+
+    def start(self):
+        """Start listening in a daemon thread."""
+        self._alive = True
+        self._thread = threading.Thread(target=self._run, name='websocket', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop listening and close the connection."""
+        self._alive = False
+        if self._loop is not None and self._websocket is not None:
+            asyncio.run_coroutine_threadsafe(self._websocket.close(), self._loop)
+        if self._thread is not None:
+            self._thread.join(timeout=self.reconnect_delay + 1)
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(self._listen())
+        finally:
+            self._loop.close()
+
+    def _ssl_context(self) -> Optional[ssl.SSLContext]:
+        if self.options['scheme'] != 'https':
+            return None
+        context = ssl.create_default_context()
+        if not self.options.get('verify', True):
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        return context
+
+    async def _listen(self):
+        while self._alive:
+            try:
+                async with websockets.connect(self.url, ssl=self._ssl_context()) as websocket:
+                    self._websocket = websocket
+                    await self._authenticate(websocket)
+                    self._connected.set()
+                    logger.info("WebSocket connected")
+                    if self.on_connect:
+                        self.on_connect()
+                    async for message in websocket:
+                        self._dispatch(message)
+            except Exception as e:
+                if self._alive:
+                    logger.warning(f"WebSocket connection lost: {e}")
+            finally:
+                self._connected.clear()
+                self._websocket = None
+
+            if self._alive:
+                await asyncio.sleep(self.reconnect_delay)
+
+    async def _authenticate(self, websocket):
+        await websocket.send(json.dumps({
+            'seq': 1,
+            'action': 'authentication_challenge',
+            'data': {'token': self.token}
+        }))
+        # The hello event may arrive before or after the challenge reply
+        while True:
+            message = await websocket.recv()
+            status = json.loads(message)
+            if status.get('seq_reply') == 1:
+                if status.get('status') != 'OK':
+                    raise ConnectionError(f"WebSocket authentication failed: {status.get('error')}")
+                return
+            if status.get('event') == 'hello':
+                return
+            self._dispatch(message)
+
+    def _dispatch(self, message):
+        try:
+            event = json.loads(message)
+        except ValueError:
+            logger.error(f"Invalid WebSocket message: {message!r}")
+            return
+
+        if event.get('event') == 'posted':
+            self.on_post(json.loads(event['data']['post']))
+        elif self.on_event and 'event' in event:
+            self.on_event(event)
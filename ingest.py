@@ -0,0 +1,199 @@
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Get the logger in main.py
+logger = logging.getLogger('bot')
+
+# (create_at of the newest handled post, its post id)
+Cursor = Tuple[int, Optional[str]]
+
+
+class ChannelPoller:
+    """
+    Fetch new posts for many channels over REST.
+
+    Every channel keeps its own cursor (the newest handled post), so a busy
+    channel never moves the cursor of a quiet one. Channels are fetched
+    concurrently on a bounded thread pool, so one poll takes as long as the
+    slowest channel rather than the sum of all of them.
+
+    Cursors and the ids of handled posts are stored in the `channel_cursors`
+    and `processed_posts` tables, so a restart resumes where the previous
+    process stopped. Once a channel has a cursor post, the backlog after it
+    is fetched in pages of `page_size` posts, one page per channel per poll.
+
+    Channels can belong to different databases (one per team): `databases`
+    maps each channel id to the (cursor, connection) its state is stored in.
+
+    A post whose handling fails is rolled back and fetched again from the
+    channel's cursor on the next poll, with the channel's later posts
+    after it, up to `max_attempts` times.
+    """
+
+    def __init__(self, bot, databases: Dict[str, Tuple[sqlite3.Cursor, sqlite3.Connection]], since: int,
+                 max_workers: int = 8, page_size: int = 100, max_attempts: int = 3):
+        self.bot = bot
+        self.databases = dict(databases)
+        self.page_size = page_size
+        self.max_attempts = max_attempts
+
+        self.cursors: Dict[str, Cursor] = {channel_id: (since, None) for channel_id in self.databases}
+        for c, conn in self._distinct_databases():
+            c.execute("SELECT channel_id, create_at, post_id FROM channel_cursors")
+            for channel_id, create_at, post_id in c.fetchall():
+                if self.databases.get(channel_id, (None, None))[1] is conn:
+                    self.cursors[channel_id] = (create_at, post_id)
+
+        # Channels whose last page was full, i.e. that still have a backlog
+        self.behind = set()
+        # Failed attempts per post id, and the channels waiting for a failed post to be fetched again
+        self.attempts: Dict[str, int] = {}
+        self._retry = set()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, min(max_workers, len(self.cursors))),
+            thread_name_prefix='poller'
+        )
+
+    def _distinct_databases(self) -> List[Tuple[sqlite3.Cursor, sqlite3.Connection]]:
+        databases = {}
+        for c, conn in self.databases.values():
+            databases.setdefault(id(conn), (c, conn))
+        return list(databases.values())
+
+    def monitors(self, channel_id: str) -> bool:
+        return channel_id in self.cursors
+
+    def claim(self, post: dict) -> bool:
+        """
+        Mark a post as handled unless it is older than the channel's cursor
+        or was handled before. The mark is not committed here: it goes into
+        the same transaction as whatever the command writes, so a post is
+        either fully handled or not at all.
+        """
+        if post['create_at'] < self.cursors[post['channel_id']][0]:
+            return False
+        c, _ = self.databases[post['channel_id']]
+        c.execute(
+            "INSERT OR IGNORE INTO processed_posts VALUES (?, ?)",
+            (post['id'], post['create_at'])
+        )
+        return c.rowcount == 1
+
+    def advance(self, post: dict):
+        """Move the cursor of the post's channel past the post."""
+        channel_id = post['channel_id']
+        if post['create_at'] < self.cursors[channel_id][0]:
+            return
+        self.cursors[channel_id] = (post['create_at'], post['id'])
+        c, _ = self.databases[channel_id]
+        c.execute("""
+            INSERT INTO channel_cursors VALUES (?, ?, ?)
+            ON CONFLICT(channel_id) DO UPDATE SET create_at = excluded.create_at, post_id = excluded.post_id
+        """, (channel_id, post['create_at'], post['id']))
+
+    def process(self, post: dict, handle: Callable[[dict], None]) -> bool:
+        """
+        Claim `post`, pass it to `handle`, then commit the claim, the cursor
+        and whatever `handle` wrote. If `handle` raises, all of it is rolled
+        back and the post is retried (see `failed()`); after the last attempt
+        it is marked handled anyway. Returns whether the post was handled.
+        """
+        if not self.claim(post):
+            return False
+        _, conn = self.databases[post['channel_id']]
+        try:
+            handle(post)
+        except Exception as e:
+            conn.rollback()
+            if self.failed(post):
+                logger.error(f"Error processing post {post['id']} in channel {post['channel_id']}, will retry: {e}")
+                return False
+            logger.error(f"Error processing post {post['id']} in channel {post['channel_id']}, giving up: {e}")
+            self.claim(post)
+        self.attempts.pop(post['id'], None)
+        self.advance(post)
+        conn.commit()
+        return True
+
+    def failed(self, post: dict) -> bool:
+        """
+        Count a failed attempt at `post`. Returns True if it is to be
+        retried: its channel is then polled from its cursor again, and its
+        later posts wait until then.
+        """
+        attempts = self.attempts.get(post['id'], 0) + 1
+        if attempts >= self.max_attempts:
+            self.attempts.pop(post['id'], None)
+            return False
+        self.attempts[post['id']] = attempts
+        self.behind.add(post['channel_id'])
+        self._retry.add(post['channel_id'])
+        return True
+
+    def prune(self, keep_days: int = 7):
+        for c, conn in self._distinct_databases():
+            prune_processed_posts(c, conn, keep_days)
+
+    def _fetch(self, channel_id: str, cursor: Cursor) -> Tuple[List[dict], bool]:
+        create_at, post_id = cursor
+        if post_id is None:
+            # No post handled yet in this channel: start from the given time
+            params = {'since': create_at}
+        else:
+            params = {'after': post_id, 'per_page': self.page_size}
+
+        messages = self.bot.posts.get_posts_for_channel(channel_id, params=params)
+        posts = list((messages.get('posts') or {}).values())
+        full_page = post_id is not None and len(posts) >= self.page_size
+        return sorted(
+            (post for post in posts if post['create_at'] >= create_at),
+            key=lambda x: x['create_at']
+        ), full_page
+
+    def poll(self) -> Iterator[dict]:
+        """
+        Fetch all channels concurrently and yield their new posts.
+        Posts of one channel are yielded oldest first; channels are yielded
+        in the order their requests complete.
+        """
+        self._retry.clear()
+        futures = {
+            self._executor.submit(self._fetch, channel_id, cursor): channel_id
+            for channel_id, cursor in self.cursors.items()
+        }
+        for future in as_completed(futures):
+            channel_id = futures[future]
+            try:
+                posts, full_page = future.result()
+            except Exception as e:
+                logger.error(f"Error fetching messages for channel {channel_id}: {e}")
+                continue
+
+            if full_page:
+                self.behind.add(channel_id)
+            else:
+                self.behind.discard(channel_id)
+            if posts:
+                logger.debug(f"Processing {len(posts)} messages from channel {channel_id}")
+            for post in posts:
+                # The rest of the channel waits for a failed post, fetched again on the next poll
+                if channel_id in self._retry:
+                    break
+                yield post
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+def prune_processed_posts(c, conn, keep_days: int = 7):
+    """
+    Forget handled post ids more than `keep_days` older than the newest
+    cursor; the cursors cover anything older.
+    """
+    c.execute("""
+        DELETE FROM processed_posts
+        WHERE create_at < (SELECT COALESCE(MAX(create_at), 0) FROM channel_cursors) - ?
+    """, (keep_days * 24 * 60 * 60 * 1000,))
+    conn.commit()
@@ -0,0 +1,118 @@
+import os
+import time
+import socket
+import logging
+import threading
+from typing import Callable, Optional, Tuple
+
+# Get the logger in main.py
+logger = logging.getLogger('bot')
+
+
+def default_holder() -> str:
+    """An id for this process that is unique across replicas: host name and process id."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class Lease:
+    """
+    Leadership among replicas that share a database, held as a row of the
+    `leases` table.
+
+    Whoever holds the unexpired lease is the leader. The leader renews it
+    every `ttl / 3` seconds; when the leader stops renewing (it crashed, hung
+    or lost the database), another replica takes it over at most `ttl`
+    seconds after the last renewal. Taking and renewing are a single
+    conditional upsert, so two replicas can never both get the lease.
+
+    `held` is judged by the local clock against the expiry of the last
+    successful renewal, so a leader that was paused stops considering
+    itself the leader as soon as the lease could have been taken over.
+    Replicas must therefore have synchronised clocks (e.g. NTP).
+    """
+
+    def __init__(self, open_connection: Callable[[], Tuple], name: str = 'leader',
+                 holder: Optional[str] = None, ttl: float = 30,
+                 clock: Callable[[], float] = time.time):
+        self.name = name
+        self.holder = holder or default_holder()
+        self.ttl = ttl
+        self.clock = clock
+        self.c, self.conn = open_connection()
+        self._expires_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def held(self) -> bool:
+        return self._expires_at is not None and self.clock() < self._expires_at
+
+    def try_acquire(self) -> bool:
+        """Take the lease if it is free or expired, or renew it if it is ours. Returns whether we hold it."""
+        with self._lock:
+            now = self.clock()
+            try:
+                self.c.execute("""
+                    INSERT INTO leases VALUES (?, ?, ?)
+                    ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at
+                    WHERE leases.holder = excluded.holder OR leases.expires_at <= ?
+                """, (self.name, self.holder, now + self.ttl, now))
+                acquired = self.c.rowcount == 1
+                self.conn.commit()
+            except Exception as e:
+                self.conn.rollback()
+                logger.error(f"Error renewing lease {self.name}: {e}")
+                acquired = False
+
+            if acquired:
+                if self._expires_at is None:
+                    logger.info(f"Acquired lease {self.name} as {self.holder}")
+                self._expires_at = now + self.ttl
+            elif self._expires_at is not None:
+                logger.warning(f"Lost lease {self.name}, now held by {self.current_holder()}")
+                self._expires_at = None
+            return acquired
+
+    def current_holder(self) -> Optional[str]:
+        """The holder of the unexpired lease, if any."""
+        self.c.execute("SELECT holder FROM leases WHERE name = ? AND expires_at > ?", (self.name, self.clock()))
+        row = self.c.fetchone()
+        return row[0] if row else None
+
+    def wait(self, stop: Optional[threading.Event] = None) -> bool:
+        """
+        Block until the lease is ours (returns True) or `stop` is set
+        (returns False). Standbys retry every `ttl / 3` seconds.
+
+        Independent of `release()`, so a demoted leader waits again as a standby.
+        """
+        stop = stop or threading.Event()
+        while not self.try_acquire():
+            if stop.wait(self.ttl / 3):
+                return False
+        return True
+
+    def start(self):
+        """Keep renewing the lease on a background thread until `release()`."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._renew, name='lease', daemon=True)
+        self._thread.start()
+
+    def _renew(self):
+        while not self._stop.wait(self.ttl / 3):
+            self.try_acquire()
+
+    def release(self):
+        """Stop renewing and give the lease up, so a standby can take over right away."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            if self._expires_at is None:
+                return
+            self._expires_at = None
+            self.c.execute("DELETE FROM leases WHERE name = ? AND holder = ?", (self.name, self.holder))
+            self.conn.commit()
+            logger.info(f"Released lease {self.name}")
@@ -1,53 +1,42 @@
 # Standard library imports
 import os
+import queue
 import logging
 import sqlite3
+import threading
 import time as time_module
-from datetime import datetime, date, time
+from functools import partial
+from datetime import datetime, date, time, timedelta
+from typing import Optional
 from zoneinfo import ZoneInfo
 
 # Third-party imports
 import mattermostdriver
 
 # Local application imports
-from configs import (
-    DB_PATH, 
-    mattermost_url, 
-    bot_token, 
-    channel_id_attendance, 
-    channel_id_birthday, 
-    channel_id_admin, 
-    channels_to_monitor,
-    DEBUG
-)
-from commands import (
-    help_command,
-    record_attendance,
-    record_missing,
-    recent_records,
-    edit_record,
-    delete_record,
-    record_vacation,
-    get_team_status,
-    get_monthly_report,
-    add_member,
-    update_member,
-    delete_member,
-    get_member,
-    fix_database
-)
+import configs
+from commands import fix_database
+from registry import COMMANDS, CommandContext, UNKNOWN_COMMAND
 from utils import (
-    DateTimeValidator,
     BirthdayGreeter,
-    BirthdayState,
-    AutoCheckoutState,
     auto_checkout
 )
+from events import EventListener
+from cache import get_directory
+from delivery import DirectChannels, OutboundQueue
+from database import init_db, unindexed_hot_queries
+from ingest import ChannelPoller, prune_processed_posts
+from scheduler import Scheduler, Job, daily, monthly
+import metrics
+from profiling import profiler, SlowQueryLog
+from lease import Lease
+from reports import report_cache
+from vacations import vacation_index
 
 
 def setup_logger():
     """Configure and return logger instance"""
-    logger = logging.getLogger(__name__)
+    logger = logging.getLogger('bot')
     logger.setLevel(logging.INFO)
 
     # Create handlers
@@ -65,405 +54,424 @@ def setup_logger():
 
     return logger
 
-# Setup logger
-logger = setup_logger()
-
-bot = mattermostdriver.Driver({
-    'url': mattermost_url,
-    'token': bot_token,
-    'scheme': 'https',
-    'port': 8443
-})
-bot.login()
-
-# Get the bot's user ID
-bot_user = bot.users.get_user(user_id='me')
-bot_user_id = bot_user['id']
-
-# Connect to the database
-# Use DB_PATH when initializing your database connection
-conn = sqlite3.connect(DB_PATH)
-c = conn.cursor()
-
-c.execute('''CREATE TABLE IF NOT EXISTS attendance
-             (user_id TEXT, date TEXT, time_in TEXT, time_out TEXT, location TEXT)''')
-
-c.execute('''CREATE TABLE IF NOT EXISTS vacations
-             (user_id TEXT, start_date TEXT, end_date TEXT, reason TEXT)''')
-
-# Integrity check for user_id in members_info
-# user_id is a unique key in members_info
-c.execute('''CREATE TABLE IF NOT EXISTS members_info
-                (user_id TEXT PRIMARY KEY, name TEXT, position TEXT, phone TEXT, email TEXT, birthday TEXT)''')
-
-conn.commit()
-
-def handle_message(post):
-    try:
-        user_id = post['user_id']
-        message = post['message'].strip()
+# Shared by every module; handlers are added by setup_logger() when the bot starts
+logger = logging.getLogger('bot')
+
+
+class Shard:
+    """
+    One team's database. Like the driver, it is opened and migrated on
+    first use.
+    """
+
+    def __init__(self, team: configs.TeamConfig, slow_query_log=None):
+        self.team = team
+        self.slow_query_log = slow_query_log
+        self._conn = None
+        self._c = None
+        self._lock = threading.RLock()
+
+    def _connect(self, **kwargs) -> sqlite3.Connection:
+        # Every statement is timed, see metrics.py, and slow ones are logged
+        connection = sqlite3.connect(self.team.db_path, factory=metrics.InstrumentedConnection, **kwargs)
+        if self.slow_query_log is not None:
+            self.slow_query_log.install(connection)
+        return connection
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        with self._lock:
+            if self._conn is None:
+                # Connect to the database
+                # Use the team's db_path when initializing your database connection
+                conn = self._connect()
+
+                # Create tables and apply pending schema migrations
+                init_db(conn)
+                if unindexed := unindexed_hot_queries(conn):
+                    logger.warning(f"Hot queries not using an index in {self.team.db_path}: {unindexed}")
+                self._c = conn.cursor()
+                self._conn = conn
+            return self._conn
+
+    @property
+    def c(self) -> sqlite3.Cursor:
+        self.conn  # Connects on first use
+        return self._c
+
+    def open_worker_connection(self):
+        """Open a connection for use outside the main thread, returned as (cursor, connection)."""
+        # The main connection creates and migrates the schema first
+        self.conn
+        worker_conn = self._connect(check_same_thread=False)
+        return worker_conn.cursor(), worker_conn
+
+
+class Application:
+    """
+    The bot: Mattermost driver, team databases and background services.
+
+    Creating it (and importing this module) has no side effects. The driver
+    logs in and each team's database is opened and migrated on first use;
+    `run()` starts everything else. `state` goes from 'created' to
+    'starting', to 'ready' once posts are being handled, and to 'stopped'
+    on shutdown.
+
+    Every team in configs.teams gets its own database shard, channels and
+    scheduled jobs, while the driver, the poller, the outbound queue and
+    the user directory are shared by all of them.
+    """
+
+    def __init__(self):
+        self.state = 'created'
+        self._bot = None
+        self._bot_user_id = None
+        self._shards = None
+        self._by_channel = {}
+        self._lock = threading.RLock()
+
+    @property
+    def ready(self) -> bool:
+        return self.state == 'ready'
+
+    @property
+    def bot(self):
+        with self._lock:
+            if self._bot is None:
+                # Every API call through the endpoints is timed, see metrics.py
+                bot = metrics.InstrumentedDriver(mattermostdriver.Driver({
+                    'url': configs.mattermost_url,
+                    'token': configs.bot_token,
+                    'scheme': configs.mattermost_scheme,
+                    'port': configs.mattermost_port
+                }))
+                bot.login()
+
+                # Get the bot's user ID
+                self._bot_user_id = bot.users.get_user(user_id='me')['id']
+                self._bot = bot
+            return self._bot
+
+    @property
+    def bot_user_id(self) -> str:
+        self.bot  # Logs in on first use
+        return self._bot_user_id
+
+    @property
+    def shards(self):
+        """One Shard per configured team, in the order of configs.teams."""
+        with self._lock:
+            if self._shards is None:
+                slow_query_log = SlowQueryLog(configs.slow_query_ms) if configs.slow_query_ms else None
+                # Writes from transfer.py or another replica show up within cache_ttl seconds
+                report_cache.ttl = vacation_index.ttl = configs.cache_ttl
+                self._shards = [Shard(team, slow_query_log) for team in configs.teams]
+                # A channel monitored by several teams (the shared debug channel) goes to the first one
+                self._by_channel = {}
+                for shard in self._shards:
+                    for channel_id in shard.team.channels_to_monitor:
+                        self._by_channel.setdefault(channel_id, shard)
+            return self._shards
+
+    def shard_for(self, channel_id: str) -> Shard:
+        """The shard of the team monitoring `channel_id`, or the first team's."""
+        return self._by_channel.get(channel_id) or self.shards[0]
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """The first team's database connection."""
+        return self.shards[0].conn
+
+    @property
+    def c(self) -> sqlite3.Cursor:
+        return self.shards[0].c
+
+    def open_worker_connection(self):
+        """Open a connection to the first team's database for use outside the main thread."""
+        return self.shards[0].open_worker_connection()
+
+    def handle_message(self, post):
+        try:
+            message = post['message'].strip()
         
-        # Check if the message starts with a slash command
-        if not message.startswith('!'):
-            return None  # Ignore messages that aren't commands
+            # Check if the message starts with a slash command
+            if not message.startswith('!'):
+                return None  # Ignore messages that aren't commands
         
-        text = message.split()
-        command = text[0].lower()
-
-        if command == '!도움' or command == '!h' or command == '!help' :
-            return help_command()
-        ######################################
-        ### Attendance management commands ###
-        ######################################
-        elif command == '!출근' or command == '!in':
-            location = None
-            return record_attendance(bot, c, conn, user_id, 'in', location if location is not None else 'Not specified')
-        elif command == '!퇴근' or command == '!out':
-            location = None
-            return record_attendance(bot, c, conn, user_id, 'out', location if location is not None else 'Not specified')
-        elif command == '!출퇴근누락' or command == '!missing':
-            if len(text) < 4:
-                return (
-                    f"## 잘못된 형식 (Invalid Format)\n"
-                    f"올바른 사용법: `!missing YYYY-MM-DD <time_in> <time_out>`\n"
-                    f"예시: `!missing 2024-08-01 09:00 18:00`\n"
-                    f"\n"
-                    f"Use: `!missing YYYY-MM-DD <time_in> <time_out>`\n"
-                    f"Example: `!missing 2024-08-01 09:00 18:00`\n"
-                )
-            return record_missing(bot, c, conn, user_id, text[1], text[2], text[3])
-        elif command == '!최근기록' or command == '!recentrecord':
-            return recent_records(bot, c, conn, user_id)
-        elif command == '!수정' or command == '!edit':
-            if len(text) < 4:
-                return (
-                    f"## 잘못된 형식 (Invalid Format)\n"
-                    f"올바른 사용법: `!edit <인덱스> <날짜> <출근시간> <퇴근시간:선택> <위치:선택>`\n"
-                    f"인덱스는 최근 7일 출퇴근 기록에서 선택한 인덱스입니다. '!최근기록'을 사용해 확인하세요.\n"
-                    f"예시: `!edit 0 2024-08-01 09:00 18:00 집`\n"
-                    f"\n"
-                    f"Use: `!edit <index> <date> <time_in> <time_out:optional> <location:optional>`\n"
-                    f"Index is selected from recent 7 days' attendance records. Use `!recentrecord` to check.\n"
-                    f"Example: `!edit 0 2024-08-01 09:00 18:00 Home`\n"
-                )
-            return edit_record(bot, c, conn, user_id, text[1], text[2], text[3], text[4] if len(text) > 4 else None, text[5] if len(text) > 5 else None)
-        elif command == '!삭제' or command == '!delete':
-            if len(text) < 2:
-                return (
-                    f"## 잘못된 형식 (Invalid Format)\n"
-                    f"올바른 사용법: `!delete <인덱스>`\n"
-                    f"인덱스는 최근 7일 출퇴근 기록에서 선택한 인덱스입니다. '!최근기록'을 사용해 확인하세요.\n"
-                    f"예시: `!delete 0`\n"
-                    f"\n"
-                    f"Use: `!delete <index>`\n"
-                    f"Index is selected from recent 7 days' attendance records. Use `!recentrecord` to check.\n"
-                    f"Example: `!delete 0`\n"
-                )
-            return delete_record(bot, c, conn, user_id, text[1])
-        elif command == '!휴가' or command == '!vacation':
-            if len(text) < 4:
-                return (
-                    f"## 잘못된 형식 (Invalid Format)\n"
-                    f"올바른 사용법: `!vacation YYYY-MM-DD(시작일) YYYY-MM-DD(종료일) <사유>`\n"
-                    f"예시: `!vacation 2024-08-01 2024-08-05 가족여행`\n"
-                    f"\n"
-                    f"Use: `!vacation YYYY-MM-DD(start) YYYY-MM-DD(end) <reason>`\n"
-                    f"Example: `!vacation 2024-08-01 2024-08-05 Family_vacation`\n"
-                )
-            return record_vacation(bot, c, conn, user_id, text[1], text[2], ' '.join(text[3:]))
-        elif command == '!상태' or command == '!teamstatus':
-            if len(text) > 1:
-                # Check if the user provided a date
-                try:
-                    date = datetime.strptime(text[1], "%Y-%m-%d").strftime("%Y-%m-%d")
-                    return get_team_status(bot, c, conn, date)
-                except ValueError:
-                    return (
-                        f"## 오류: 잘못된 날짜 형식 (Error: Invalid date format)\n"
-                        f"YYYY-MM-DD 형식을 사용하세요.\n"
-                        f"예시: `!teamstatus 2024-08-01`\n"
-                        f"\n"
-                        f"Use YYYY-MM-DD format.\n"
-                        f"Example: `!teamstatus 2024-08-01`\n"
-                    )
-            # Get the team status for the current date
-            return get_team_status(bot, c, conn)
-        elif command == '!월간보고' or command == '!monthlyreport':
-            if len(text) > 1:
-                # Check if the user provided a date
-                try:
-                    datetime.strptime(text[1], "%Y-%m")
-                    requested_user = bot.users.get_user(user_id)['id']
-                    return get_monthly_report(bot, c, conn, requested_user, text[1].split('-')[0], text[1].split('-')[1])
-                except ValueError:
-                    return (
-                        f"## 오류: 잘못된 날짜 형식 (Error: Invalid date format)\n"
-                        f"YYYY-MM 형식을 사용하세요.\n"
-                        f"예시: `!monthlyreport 2024-08`\n"
-                        f"\n"
-                        f"Use YYYY-MM format.\n"
-                        f"Example: `!monthlyreport 2024-08`\n"
-                    )
-            # Get the monthly report for the current month
-            return get_monthly_report(bot, c, conn, user_id)
-
-        ##################################
-        ### Member management commands ###
-        ##################################
-        elif command == '!멤버추가' or command == "!addmember":
-            if len(text) < 7:
-                return (
-                    f"## 잘못된 형식 (Invalid Format)\n"
-                    f"올바른 사용법: `!addmember <사용자ID> <이름> <직위> <전화번호> <이메일> <생년월일>`\n"
-                    f"예시: `!addmember @gdhong 홍길동 석사 010-1234-5678 gdhong@kw.ac.kr 1970-01-01`\n"
-                    f"\n"
-                    f"Use: `!addmember <user_id> <name> <position> <phone> <email> <birthday>`\n"
-                    f"Example: `!addmember @gdhong Gildong_Hong MS 010-1234-5678 gdhong@kw.ac.kr 1970-01-01`\n"
-                )
-            try:
-                return add_member(bot, c, conn, text[1], text[2], text[3], text[4], text[5], text[6])
-            except sqlite3.IntegrityError:
-                return (
-                    f"## 오류: 멤버가 이미 존재함 (Error: Member already exists)\n"
-                    f"멤버 {text[1]}가 이미 존재합니다.\n"
-                    f"정보를 업데이트하려면 `!updatemember`를, 삭제하려면 `!deletemember`를 사용하세요.\n"
-                    f"\n"
-                    f"Member {text[1]} already exists.\n"
-                    f"Use `!updatemember` to update the information or `!deletemember` to delete the member.\n"
-                )
-        elif command == '!멤버삭제' or command == "!deletemember":
-            if len(text) < 2:
-                return (
-                    f"## 잘못된 형식 (Invalid Format)\n"
-                    f"올바른 사용법: `!deletemember <사용자ID>`\n"
-                    f"예시: `!deletemember @gdhong`\n"
-                    f"\n"
-                    f"Use: `!deletemember <user_id>`\n"
-                    f"Example: `!deletemember @gdhong`\n"
-                )
-            try:
-                return delete_member(bot, c, conn, text[1])
-            except sqlite3.IntegrityError:
-                return f"Error: Member {text[1]} does not exist."
-        elif command == '!멤버업데이트' or command == "!updatemember":
-            if len(text) < 7:
-                return (
-                    f"## 잘못된 형식 (Invalid Format)\n"
-                    f"올바른 사용법: `!updatemember <사용자ID> <이름> <전화번호> <이메일> <생년월일>`\n"
-                    f"예시: `!updatemember @gdhong 홍길동 박사 010-1234-5678 gdhong@kw.ac.kr 1970-01-01`\n"
-                    f"\n"
-                    f"Use: `!updatemember <user_id> <name> <phone> <email> <birthday>`\n"
-                    f"Example: `!updatemember @gdhong Gildong_Hong PhD 010-1234-5678 gdhong@kw.ac.kr 1970-01-01`\n"
-                )
-            try:
-                return update_member(bot, c, conn, text[1], text[2], text[3], text[4], text[5], text[6])
-            except sqlite3.IntegrityError:
-                return (
-                    f"## 오류: 멤버가 존재하지 않음 (Error: Member does not exist)\n"
-                    f"멤버 {text[1]}가 존재하지 않습니다.\n"
-                    f"멤버를 추가하려면 `!addmember`를 사용하세요.\n"
-                    f"\n"
-                    f"Member {text[1]} does not exist.\n"
-                    f"Use `!addmember` to add the member.\n"
-                )
-        elif command == '!멤버조회' or command == "!memberinfo":
-            if len(text) < 2:
-                return (
-                    f"## 잘못된 형식 (Invalid Format)\n"
-                    f"올바른 사용법: `!memberinfo <사용자ID>`\n"
-                    f"예시: `!memberinfo @gdhong`\n"
-                    f"\n"
-                    f"Use: `!memberinfo <user_id>`\n"
-                    f"Example: `!memberinfo @gdhong`\n"
-                )
+            text = message.split()
+            command = COMMANDS.get(text[0].lower())
+            if command is None:
+                return UNKNOWN_COMMAND
+
+            # Commands read and write the database of the team the post belongs to
+            shard = self.shard_for(post.get('channel_id'))
+            ctx = CommandContext(self.bot, shard.c, shard.conn, post, shard.team)
             try:
-                return get_member(bot, c, conn, text[1])
-            except sqlite3.IntegrityError:
-                return (
-                    f"## 오류: 멤버를 찾을 수 없음 (Error: Member not found)\n"
-                    f"멤버 {text[1]}를 찾을 수 없습니다.\n"
-                    f"\n"
-                    f"Member {text[1]} does not exist.\n"
-                )
-        elif command == '!fixdatabase':
-            try:
-                return fix_database(bot, c, conn)
-            except sqlite3.IntegrityError:
-                return (
-                    f"## 오류: 데이터베이스 오류 (Database Error)\n"
-                    f"데이터베이스 오류가 발생했습니다.\n"
-                    f"\n"
-                    f"An error occurred in the database.\n"
-                )
-        else:
+                with metrics.COMMAND_DURATION.time(command.name):
+                    return profiler.run(command.name, len(text) - 1, lambda: command(ctx, text[1:]))
+            except Exception:
+                metrics.COMMAND_ERRORS.inc(command.name)
+                raise
+        except KeyError as e:
+            return (
+                f"## 오류: 필수 필드 누락 (Error: Missing required field)\n"
+                f"메시지에서 필수 필드가 누락되었습니다: {str(e)}\n"
+                f"\n"
+                f"Missing required field in message: {str(e)}\n"
+            )
+        except IndexError:
             return (
-                f"## 알 수 없는 명령어 (Unknown command)\n"
+                f"## 오류: 잘못된 명령어 형식 (Error: Invalid command format)\n"
                 f"도움말을 보려면 `!h`를 사용하세요.\n"
                 f"\n"
                 f"Use `!h` for help.\n"
             )
-    except KeyError as e:
-        return (
-            f"## 오류: 필수 필드 누락 (Error: Missing required field)\n"
-            f"메시지에서 필수 필드가 누락되었습니다: {str(e)}\n"
-            f"\n"
-            f"Missing required field in message: {str(e)}\n"
-        )
-    except IndexError:
-        return (
-            f"## 오류: 잘못된 명령어 형식 (Error: Invalid command format)\n"
-            f"도움말을 보려면 `!h`를 사용하세요.\n"
-            f"\n"
-            f"Use `!h` for help.\n"
-        )
-    except Exception as e:
-        return (
-            f"## 예기치 않은 오류 발생 (An unexpected error occurred)\n"
-            f"오류 내용: {str(e)}\n"
-            f"\n"
-            f"Error details: {str(e)}\n"
-        )
-    
-def main():
-    try:
-        # Initialize timezone
-        tz = ZoneInfo("Asia/Seoul")
-        logger.debug("Timezone set to Asia/Seoul")
-        
-        # Initialize states using dataclasses
-        monthly_birthday_state = BirthdayState()
-        daily_birthday_state = BirthdayState()
-        auto_checkout_state = AutoCheckoutState()
-
-        # Date/Time validation
-        validator = DateTimeValidator()
+        except Exception as e:
+            return (
+                f"## 예기치 않은 오류 발생 (An unexpected error occurred)\n"
+                f"오류 내용: {str(e)}\n"
+                f"\n"
+                f"Error details: {str(e)}\n"
+            )
 
-        # Birthday greetings
-        greeter = BirthdayGreeter(c, conn)
+    def run(self):
+        """
+        Serve until interrupted. With `lease_ttl` set, only the replica
+        holding the lease (see lease.py) handles posts and runs the
+        scheduled jobs; the others wait as standbys, and one of them takes
+        over once the lease expires or is released.
+        """
+        # Log in and open the databases up front, so a standby is ready to take over
+        self.bot, self.shards
+
+        # Profile the first commands after startup when BOT_PROFILE is set
+        profiler.directory = configs.profile_dir
+        profiler.arm(configs.profile_commands)
+
+        if configs.metrics_port:
+            metrics.start_http_server(configs.metrics_port, configs.metrics_host, ready=lambda: self.ready)
+
+        lease = None
+        try:
+            if configs.lease_ttl:
+                lease = Lease(self.open_worker_connection, holder=configs.replica_id, ttl=configs.lease_ttl)
+            while True:
+                if lease is not None:
+                    self.state = 'standby'
+                    logger.info(f"Standing by for lease {lease.name} as {lease.holder}")
+                    if not lease.wait():
+                        break
+                    lease.start()
+                    # The previous leader may have written since this replica last served
+                    for shard in self.shards:
+                        report_cache.clear(shard.conn)
+                        vacation_index.clear(shard.conn)
+                self._serve(lease)
+                if lease is None:
+                    break
+                # Only returns once the lease is lost; stop renewing and stand by again
+                lease.release()
+        finally:
+            self.state = 'stopped'
+            if lease is not None:
+                lease.release()
+
+    def _serve(self, lease: Optional[Lease] = None):
+        """Handle posts and run the scheduled jobs, until `lease` (if any) is no longer held."""
+        self.state = 'starting'
+        bot, shards = self.bot, self.shards
+        bot_user_id = self.bot_user_id
+        handle_message = self.handle_message
+
+        def leader() -> bool:
+            return lease is None or lease.held
+
+        scheduler = outbound = listener = poller = dm_channels = None
+        try:
+            # Initialize timezone
+            tz = ZoneInfo("Asia/Seoul")
+            logger.debug("Timezone set to Asia/Seoul")
         
-        # Track message processing
-        last_processed = int(datetime.now(tz).timestamp() * 1000)
-        logger.info("Initial state initialized")
-
-        # Time constants
-        NOON = time(12, 0)
-        MIDNIGHT = time(23, 59) if not DEBUG else time(0, 0)
+            # User profiles and team rosters, shared by commands and the greeter
+            directory = get_directory(bot)
+
+            # Track message processing, one persisted cursor per monitored channel,
+            # stored in the database of the team the channel belongs to. A replica
+            # taking over resumes from the cursors its predecessor committed.
+            poller = ChannelPoller(
+                bot,
+                {
+                    channel_id: (shard.c, shard.conn)
+                    for shard in shards for channel_id in shard.team.channels_to_monitor
+                },
+                since=int(datetime.now(tz).timestamp() * 1000),
+                max_workers=configs.poll_workers,
+                page_size=configs.catchup_page_size
+            )
+            poller.prune()
+            logger.info(f"Initial state initialized for {len(shards)} team(s)")
+
+            # DM channel ids per user, so replies don't create the channel every time.
+            # Used from the delivery workers, so it gets its own connection; DM
+            # channels are not team-specific, so they are kept in the first team's database.
+            dm_channels = DirectChannels(
+                bot, bot_user_id, *self.open_worker_connection()
+            )
 
-        def process_messages(channel_id: str, last_processed: int) -> int:
-            try:
-                messages = bot.posts.get_posts_for_channel(
-                    channel_id, 
-                    params={'since': last_processed}
+            # Replies are posted in the background; handling a command only enqueues them
+            outbound = OutboundQueue(
+                bot,
+                dm_channels,
+                workers=configs.outbound_workers,
+                maxsize=configs.outbound_queue_size,
+                rate=configs.outbound_rate,
+                burst=configs.outbound_burst
+            )
+            outbound.start()
+            metrics.OUTBOUND_DEPTH.func = outbound.depth
+            metrics.OUTBOUND_SENT.func = lambda: outbound.sent
+            metrics.OUTBOUND_FAILED.func = lambda: outbound.failed
+
+            def reply(team: configs.TeamConfig, user_id: str, message: str):
+                if configs.DEBUG:
+                    outbound.send_channel(team.channel_id_attendance, message)
+                else:
+                    outbound.send_direct(user_id, message)
+
+            def process_post(post: dict, source: str):
+                # Leave the post (and the cursor) to the next leader once the lease is lost
+                if not leader():
+                    return
+
+                def handle(post: dict):
+                    shard = self.shard_for(post['channel_id'])
+                    metrics.POST_LAG.observe(max(0, time_module.time() - post['create_at'] / 1000), source)
+                    if post['user_id'] != bot_user_id and not post.get('root_id'):
+                        if response := handle_message(post):
+                            reply(shard.team, post['user_id'], response)
+                            logger.info(f"Queued response to user {post['user_id']}")
+
+                # Skips posts that were already handled, e.g. seen both over REST and the WebSocket
+                poller.process(post, handle)
+
+            # Posts pushed by the WebSocket listener, consumed by the main loop
+            post_queue = queue.Queue()
+            # Set whenever the WebSocket (re)connects, so posts sent while it was down are fetched over REST
+            catch_up = threading.Event()
+            listener = None
+            if configs.use_websocket:
+                listener = EventListener(
+                    bot.options,
+                    bot.client.token,
+                    on_post=post_queue.put,
+                    on_connect=catch_up.set,
+                    on_event=directory.handle_event
                 )
-                
-                if not (posts := messages.get('posts')):
-                    return last_processed
-
-                logger.debug(f"Processing {len(posts)} messages from channel {channel_id}")
-                
-                for post in sorted(posts.values(), key=lambda x: x['create_at']):
-                    if (post['user_id'] == bot_user_id or 
-                        post.get('root_id') or 
-                        post['create_at'] <= last_processed):
+                listener.start()
+                logger.info(f"Listening for posts on {listener.url}")
+
+            # Scheduled jobs run on the scheduler's thread, with a connection to their team's database
+            def send_daily_birthdays(team, c, conn, scheduled):
+                greeter = BirthdayGreeter(c, conn, directory)
+                if bday_response := greeter.get_daily_greeting(scheduled.date()):
+                    outbound.send_channel(team.channel_id_birthday, bday_response)
+
+            def send_monthly_birthdays(team, c, conn, scheduled):
+                greeter = BirthdayGreeter(c, conn, directory)
+                if bday_response := greeter.get_monthly_greeting(scheduled.date()):
+                    outbound.send_channel(team.channel_id_birthday, bday_response)
+
+            def run_auto_checkout(team, c, conn, scheduled):
+                for user_id, response in auto_checkout(bot, c, conn, scheduled.date()) or []:
+                    # Send a direct message to the user
+                    reply(team, user_id, response)
+
+            def run_maintenance(team, c, conn, scheduled):
+                try:
+                    logger.info(fix_database(bot, c, conn, incremental=True))
+                except sqlite3.IntegrityError:
+                    logger.error(f"Error fixing database of team {team.name}")
+
+                prune_processed_posts(c, conn)
+                logger.info(f"User cache stats: {directory.stats()}")
+                logger.info(f"Outbound queue: {outbound.depth()} waiting, {outbound.sent} sent, {outbound.failed} failed")
+
+            scheduler = Scheduler(self.open_worker_connection, clock=lambda: datetime.now(tz), guard=leader)
+            for shard in shards:
+                team = shard.team
+                noon = time.fromisoformat(team.greeting_time)
+                midnight = time.fromisoformat(team.checkout_time)
+                # Job runs are stored per team database; with several teams the
+                # team name in the job name tells them apart in logs and metrics
+                prefix = f"{team.name}." if len(shards) > 1 else ''
+
+                def add(name, rule, func, grace):
+                    scheduler.add(Job(prefix + name, rule, partial(func, team), grace=grace,
+                                      open_connection=shard.open_worker_connection))
+
+                # Greetings are only caught up on the same day; a missed auto-checkout
+                # is caught up for every missed day, so no record stays open
+                add('daily_birthdays', daily(noon, tz), send_daily_birthdays, timedelta(hours=11))
+                add('monthly_birthdays', monthly(1, noon, tz), send_monthly_birthdays, timedelta(hours=11))
+                add('auto_checkout', daily(midnight, tz), run_auto_checkout, timedelta(days=7))
+                add('maintenance', daily(midnight, tz), run_maintenance, timedelta(days=1))
+            scheduler.start()
+
+            self.state = 'ready'
+            logger.info("Bot is ready")
+            while leader():
+                try:
+                    # Poll all channels over REST when the WebSocket is disabled or down,
+                    # after every (re)connect to catch up on missed posts, and until
+                    # the backlog is drained (one page per channel per iteration)
+                    if (listener is None or not listener.connected or
+                            catch_up.is_set() or poller.behind):
+                        catch_up.clear()
+                        with metrics.POLL_DURATION.time():
+                            for post in poller.poll():
+                                process_post(post, 'rest')
+
+                    if listener is None:
+                        time_module.sleep(1)
                         continue
 
-                    if response := handle_message(post):
-                        dm_channel = bot.channels.create_direct_message_channel(
-                            [bot_user_id, post['user_id']]
-                        )
-                        bot.posts.create_post({
-                            'channel_id': dm_channel['id'] if not DEBUG else channel_id_attendance,
-                            'message': response
-                        })
-                        logger.info(f"Sent response to user {post['user_id']}")
-                    
-                    last_processed = max(last_processed, post['create_at'])
-                
-                return last_processed
-            
-            except Exception as e:
-                logger.error(f"Error processing messages for channel {channel_id}: {e}")
-                return last_processed
-
-        while True:
-            try:
-                current_time = datetime.now(tz)
-                current_date = current_time.date()
-
-                # Handle birthday resets and checks
-                if (monthly_birthday_state.last_date is None or 
-                    current_time.month != monthly_birthday_state.last_date.month):
-                    monthly_birthday_state.printed = False
-                    monthly_birthday_state.last_date = current_date
-                    logger.debug("Monthly birthday state reset")
-
-                if (daily_birthday_state.last_date is None or 
-                    current_date != daily_birthday_state.last_date):
-                    daily_birthday_state.printed = False
-                    daily_birthday_state.last_date = current_date
-                    logger.debug("Daily birthday state reset")
-
-                # Handle monthly birthday greetings
-                if (current_time.day == 1 and 
-                    current_time.hour == NOON.hour and
-                    current_time.minute == NOON.minute and
-                    not monthly_birthday_state.printed):
-                    logger.info("Sending monthly birthday greetings")
-                    if bday_response := greeter.get_monthly_greeting():
-                        bot.posts.create_post({
-                            'channel_id': channel_id_birthday,
-                            'message': bday_response
-                        })
-                    monthly_birthday_state.printed = True
-
-                # Handle daily birthday greetings
-                if (current_time.hour == NOON.hour and
-                    current_time.minute == NOON.minute and
-                    not daily_birthday_state.printed):
-                    logger.info("Sending daily birthday greetings")
-                    if bday_response := greeter.get_daily_greeting():
-                        bot.posts.create_post({
-                            'channel_id': channel_id_birthday,
-                            'message': bday_response
-                        })
-                    daily_birthday_state.printed = True
-                
-                # Handle auto-checkout and fix_database
-                if (current_time.hour == MIDNIGHT.hour and
-                    current_time.minute == MIDNIGHT.minute and
-                    not auto_checkout_state.responded):
-                    logger.info("Processing auto-checkout")
-                    checkout_response = auto_checkout(bot, c, conn)
-                    if checkout_response:
-                        for user_id, response in checkout_response:
-                            # Send a direct message to the user
-                            dm_channel = bot.channels.create_direct_message_channel(
-                                [bot_user_id, user_id]
-                            )
-                            bot.posts.create_post({
-                                'channel_id': dm_channel['id'] if not DEBUG else channel_id_attendance,
-                                'message': response
-                            })
-                    auto_checkout_state.responded = True
-
+                    # Handle posts pushed over the WebSocket; waiting on the queue doubles as the loop sleep
                     try:
-                        fix_database(bot, c, conn)
-                    except sqlite3.IntegrityError:
-                        logger.error("Error fixing database")              
+                        post = post_queue.get(timeout=1)
+                        while True:
+                            # Channels still catching up get this post from the REST backlog
+                            channel_id = post.get('channel_id')
+                            if poller.monitors(channel_id) and channel_id not in poller.behind:
+                                process_post(post, 'websocket')
+                            post = post_queue.get_nowait()
+                    except queue.Empty:
+                        pass
+
+                except Exception as e:
+                    logger.error(f"Error in main loop: {e}")
+                    time_module.sleep(5)  # Back off on error
+
+            logger.warning("Lease lost, handing over to another replica")
+
+        except Exception as e:
+            logger.critical(f"Fatal error in main function: {e}")
+            raise
+        finally:
+            if scheduler is not None:
+                scheduler.stop()
+            if listener is not None:
+                listener.stop()
+            if outbound is not None:
+                outbound.stop()
+            if dm_channels is not None:
+                dm_channels.close()
+            if poller is not None:
+                poller.shutdown()
 
-                # Process messages from all channels
-                for channel_id in channels_to_monitor:
-                    last_processed = process_messages(channel_id, last_processed)
 
-                time_module.sleep(1)
-
-            except Exception as e:
-                logger.error(f"Error in main loop: {e}")
-                time_module.sleep(5)  # Back off on error
-
-    except Exception as e:
-        logger.critical(f"Fatal error in main function: {e}")
-        raise
+def main():
+    setup_logger()
+    Application().run()
 
 if __name__ == "__main__":
     main()
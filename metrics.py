@@ -0,0 +1,312 @@
+import re
+import time
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Get the logger in main.py
+logger = logging.getLogger('bot')
+
+# Latency buckets in seconds, from a cached SQLite lookup to a slow API call
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_metrics: List['_Metric'] = []
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """A count that only goes up, per combination of label values."""
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values: str) -> float:
+        return self._values.get(label_values, 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{_format_labels(self.labels, key)} {value}" for key, value in self._values.items()]
+
+
+class Gauge(_Metric):
+    """A value read from `func` whenever the metrics are rendered."""
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, func: Optional[Callable[[], float]] = None):
+        super().__init__(name, help)
+        self.func = func
+
+    def _samples(self) -> List[str]:
+        if self.func is None:
+            return []
+        try:
+            return [f"{self.name} {self.func()}"]
+        except Exception as e:
+            logger.error(f"Error reading gauge {self.name}: {e}")
+            return []
+
+
+class Histogram(_Metric):
+    """Observed values (e.g. durations in seconds) in cumulative buckets, per combination of label values."""
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [count per bucket (non-cumulative, last is +Inf), sum]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *label_values: str):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, *label_values: str):
+        """Observe the duration of the `with` block, also when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def count(self, *label_values: str) -> int:
+        entry = self._values.get(label_values)
+        return sum(entry[0]) if entry else 0
+
+    def _samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key, (counts, total) in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    le = 'le="+Inf"' if bound == float('inf') else f'le="{bound}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    return '\n'.join(line for metric in _metrics for line in metric.render()) + '\n'
+
+
+###############
+### Metrics ###
+###############
+COMMAND_DURATION = Histogram('bot_command_duration_seconds', "Time to handle a command", ('command',))
+COMMAND_ERRORS = Counter('bot_command_errors_total', "Commands that raised an error", ('command',))
+DB_STATEMENT_DURATION = Histogram('bot_db_statement_duration_seconds', "Time to execute an SQLite statement",
+                                  ('operation', 'table'))
+DB_FETCH_DURATION = Histogram('bot_db_fetch_duration_seconds', "Time to fetch rows of an SQLite statement",
+                              ('operation', 'table'))
+API_CALL_DURATION = Histogram('bot_api_call_duration_seconds', "Time of a Mattermost API call",
+                              ('endpoint', 'method'))
+API_CALL_ERRORS = Counter('bot_api_call_errors_total', "Mattermost API calls that raised an error",
+                          ('endpoint', 'method'))
+POLL_DURATION = Histogram('bot_poll_duration_seconds', "Time to poll all monitored channels over REST and handle the new posts")
+POST_LAG = Histogram('bot_post_lag_seconds', "Time from a post's creation until the bot handles it", ('source',),
+                     buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 3600))
+JOB_DURATION = Histogram('bot_job_duration_seconds', "Time to run a scheduled job", ('job',))
+JOB_ERRORS = Counter('bot_job_errors_total', "Scheduled jobs that raised an error", ('job',))
+# Read from the outbound queue, set up in main.py
+OUTBOUND_DEPTH = Gauge('bot_outbound_queue_depth', "Posts waiting to be delivered")
+OUTBOUND_SENT = Gauge('bot_outbound_sent', "Posts delivered since the bot started")
+OUTBOUND_FAILED = Gauge('bot_outbound_failed', "Posts given up on since the bot started")
+
+
+##############
+### SQLite ###
+##############
+@lru_cache(maxsize=1024)
+def _statement_labels(sql: str) -> Tuple[str, str]:
+    """(operation, table) of a statement, e.g. ('SELECT', 'attendance')."""
+    words = sql.split(None, 1)
+    operation = words[0].upper() if words else ''
+    table = re.search(r'\b(?:FROM|INTO|UPDATE|TABLE)\s+(\w+)', sql, re.IGNORECASE)
+    return operation, table.group(1) if table else ''
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """
+    A cursor that times every statement it executes and every
+    fetchone/fetchmany/fetchall call reading its rows (for a SELECT, SQLite
+    does most of the work while the rows are fetched), and reports slow
+    ones to the connection's profiling.SlowQueryLog if one is installed.
+    Rows read by iterating over the cursor are not timed.
+    """
+
+    _sql = ''
+
+    def _watch(self, sql, action='statement'):
+        slow_query_log = getattr(self.connection, 'slow_query_log', None)
+        return slow_query_log.watch(sql, action) if slow_query_log is not None else nullcontext()
+
+    def execute(self, sql, parameters=()):
+        self._sql = sql
+        with DB_STATEMENT_DURATION.time(*_statement_labels(sql)), self._watch(sql):
+            return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._sql = sql
+        with DB_STATEMENT_DURATION.time(*_statement_labels(sql)), self._watch(sql):
+            return super().executemany(sql, seq_of_parameters)
+
+    def fetchone(self):
+        with DB_FETCH_DURATION.time(*_statement_labels(self._sql)), self._watch(self._sql, 'fetch'):
+            return super().fetchone()
+
+    def fetchmany(self, size=None):
+        with DB_FETCH_DURATION.time(*_statement_labels(self._sql)), self._watch(self._sql, 'fetch'):
+            return super().fetchmany(self.arraysize if size is None else size)
+
+    def fetchall(self):
+        with DB_FETCH_DURATION.time(*_statement_labels(self._sql)), self._watch(self._sql, 'fetch'):
+            return super().fetchall()
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """
+    A connection whose cursors are InstrumentedCursors. Use it as the
+    factory of sqlite3.connect().
+    """
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or InstrumentedCursor)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+##################
+### Mattermost ###
+##################
+class _EndpointProxy:
+    def __init__(self, endpoint, name: str):
+        self._endpoint = endpoint
+        self._name = name
+
+    def __getattr__(self, method: str):
+        func = getattr(self._endpoint, method)
+        if not callable(func):
+            return func
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                API_CALL_ERRORS.inc(self._name, method)
+                raise
+            finally:
+                API_CALL_DURATION.observe(time.perf_counter() - start, self._name, method)
+        return timed
+
+
+class InstrumentedDriver:
+    """
+    Wraps a mattermostdriver.Driver so every call through its endpoints
+    (`bot.posts.create_post(...)`, `bot.users.get_user(...)`, ...) is timed
+    and counted. Everything else is passed through unchanged.
+    """
+    ENDPOINTS = ('users', 'teams', 'channels', 'posts', 'files')
+
+    def __init__(self, driver):
+        self._driver = driver
+
+    def __getattr__(self, name: str):
+        value = getattr(self._driver, name)
+        if name in self.ENDPOINTS:
+            return _EndpointProxy(value, name)
+        return value
+
+
+############
+### HTTP ###
+############
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        if path == '/metrics':
+            self._send(200, render(), 'text/plain; version=0.0.4; charset=utf-8')
+        elif path == '/ready':
+            # For readiness probes: 200 once the bot handles posts, 503 before
+            ready = self.server.ready is None or self.server.ready()
+            self._send(200 if ready else 503, 'ready\n' if ready else 'not ready\n', 'text/plain; charset=utf-8')
+        else:
+            self.send_error(404)
+
+    def _send(self, status: int, text: str, content_type: str):
+        body = text.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes are too frequent for bot.log
+        pass
+
+
+def start_http_server(port: int, host: str = '0.0.0.0',
+                      ready: Optional[Callable[[], bool]] = None) -> ThreadingHTTPServer:
+    """
+    Serve the metrics at http://host:port/metrics from a background thread,
+    and the result of `ready()` at /ready.
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.ready = ready
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
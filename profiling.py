@@ -0,0 +1,96 @@
+import os
+import time
+import cProfile
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Callable
+
+# Get the logger in main.py
+logger = logging.getLogger('bot')
+
+
+class CommandProfiler:
+    """
+    Profile the next N commands with cProfile.
+
+    Each profiled command writes one stats file to `directory`, named after
+    the time, the command name and its number of arguments; the message
+    text itself is never recorded. Read a file with
+    `python -m pstats <file>`.
+    """
+
+    def __init__(self, directory: str = 'profiles'):
+        self.directory = directory
+        self._remaining = 0
+        self._written = 0
+        self._lock = threading.Lock()
+
+    @property
+    def remaining(self) -> int:
+        return self._remaining
+
+    def arm(self, count: int):
+        """Profile the next `count` commands (0 stops profiling)."""
+        with self._lock:
+            self._remaining = max(0, count)
+
+    def _take(self) -> bool:
+        with self._lock:
+            if self._remaining <= 0:
+                return False
+            self._remaining -= 1
+            self._written += 1
+            return True
+
+    def run(self, command: str, arg_count: int, func: Callable[[], str]) -> str:
+        """Call `func`, under the profiler if profiling is armed."""
+        if not self._take():
+            return func()
+
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(func)
+        finally:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(
+                self.directory,
+                f"{time.strftime('%Y%m%d-%H%M%S')}-{self._written:04d}-{command}-{arg_count}args.prof"
+            )
+            profile.dump_stats(path)
+            logger.info(f"Wrote profile of command {command} to {path}")
+
+
+class SlowQueryLog:
+    """
+    Log SQLite statements that take longer than `threshold_ms`.
+
+    Only the statement as written, with its `?` placeholders, and the time
+    are logged: the parameters are attendance and member data. Timing is
+    done by metrics.InstrumentedCursor, which calls `watch()` around each
+    statement and each fetchone/fetchmany/fetchall call on connections
+    this log is installed on. Fetches are timed one call at a time, so a
+    slow SELECT read with many fetchone() calls, or by iterating over the
+    cursor, may not be logged.
+    """
+
+    def __init__(self, threshold_ms: float):
+        self.threshold = threshold_ms / 1000
+
+    def install(self, conn):
+        conn.slow_query_log = self
+
+    @contextmanager
+    def watch(self, sql: str, action: str = 'statement'):
+        """Time the `with` block: running `sql` ('statement') or fetching its rows ('fetch')."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            if elapsed >= self.threshold:
+                logger.warning(f"Slow SQL {action} ({elapsed * 1000:.1f} ms): {' '.join(sql.split())}")
+
+
+# Shared by handle_message and the !profile command
+profiler = CommandProfiler()
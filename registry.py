@@ -0,0 +1,648 @@
+import sqlite3
+from datetime import datetime
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+import configs
+from configs import tz
+from profiling import profiler
+from cache import get_directory
+from rollup import rebuild_daily_rollup
+from reports import report_cache
+from transfer import TABLES, FORMATS, upload_export, import_rows, attachment_rows
+from commands import (
+    record_attendance,
+    record_missing,
+    recent_records,
+    edit_record,
+    delete_record,
+    record_vacation,
+    get_vacation_balance,
+    get_team_status,
+    get_monthly_report,
+    get_yearly_report,
+    get_attendance_rate,
+    add_member,
+    update_member,
+    delete_member,
+    get_member,
+    fix_database
+)
+
+HELP_VERSION = "241023"
+
+
+@dataclass
+class CommandContext:
+    """Everything a command handler needs to answer one post."""
+    bot: object
+    c: sqlite3.Cursor
+    conn: sqlite3.Connection
+    post: dict
+    # The team whose channel the post is in; `c` and `conn` are its database
+    team: configs.TeamConfig
+
+    @property
+    def user_id(self) -> str:
+        return self.post['user_id']
+
+    @property
+    def posted_at(self) -> Optional[datetime]:
+        """Time the post was created, which differs from now for replayed posts."""
+        if 'create_at' not in self.post:
+            return None
+        return datetime.fromtimestamp(self.post['create_at'] / 1000, tz)
+
+
+@dataclass(frozen=True)
+class HelpEntry:
+    """One block of the `!h` output."""
+    section: str
+    title: str
+    syntax: str
+    description: Tuple[str, ...]
+    example: str
+    note: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class Command:
+    """
+    A bot command: its aliases, handler and argument spec.
+
+    `min_args` is checked before the handler runs and `usage` is returned
+    when too few arguments are given. Each validator is an
+    (argument index, check, error message) triple, applied to the argument
+    if it is present. `admin_only` commands are refused outside the admin
+    channel.
+    """
+    name: str
+    aliases: Tuple[str, ...]
+    handler: Callable[[CommandContext, List[str]], str]
+    min_args: int = 0
+    usage: Optional[str] = None
+    validators: Tuple[Tuple[int, Callable[[str], bool], str], ...] = ()
+    help: Optional[HelpEntry] = None
+    admin_only: bool = False
+
+    def __call__(self, ctx: CommandContext, args: List[str]) -> str:
+        if self.admin_only and ctx.post.get('channel_id') != ctx.team.channel_id_admin:
+            return ADMIN_ONLY
+        if len(args) < self.min_args:
+            return self.usage
+        for index, check, error in self.validators:
+            if index < len(args) and not check(args[index]):
+                return error
+        return self.handler(ctx, args)
+
+
+def _invalid_format(usage_ko, example_ko, usage_en, example_en, note_ko=None, note_en=None) -> str:
+    """Build the usage message returned when a command has too few arguments."""
+    return (
+        f"## 잘못된 형식 (Invalid Format)\n"
+        f"올바른 사용법: `{usage_ko}`\n"
+        + (f"{note_ko}\n" if note_ko else "")
+        + f"예시: `{example_ko}`\n"
+        f"\n"
+        f"Use: `{usage_en}`\n"
+        + (f"{note_en}\n" if note_en else "")
+        + f"Example: `{example_en}`\n"
+    )
+
+
+def _invalid_date(fmt: str, example: str) -> str:
+    return (
+        f"## 오류: 잘못된 날짜 형식 (Error: Invalid date format)\n"
+        f"{fmt} 형식을 사용하세요.\n"
+        f"예시: `{example}`\n"
+        f"\n"
+        f"Use {fmt} format.\n"
+        f"Example: `{example}`\n"
+    )
+
+
+def _matches(fmt: str) -> Callable[[str], bool]:
+    def check(value: str) -> bool:
+        try:
+            datetime.strptime(value, fmt)
+            return True
+        except ValueError:
+            return False
+    return check
+
+
+def _date_or_format(value: str) -> bool:
+    return value in FORMATS or _matches("%Y-%m-%d")(value)
+
+
+EXPORT_USAGE = _invalid_format(
+    "!export <attendance|vacations|members> <시작일:선택> <종료일:선택> <csv|jsonl:선택>",
+    "!export attendance 2024-01-01 2024-12-31 csv",
+    "!export <attendance|vacations|members> <start:optional> <end:optional> <csv|jsonl:optional>",
+    "!export attendance 2024-01-01 2024-12-31 csv"
+)
+
+IMPORT_USAGE = _invalid_format(
+    "!import <attendance|vacations|members> (CSV 또는 JSONL 파일 첨부)", "!import members",
+    "!import <attendance|vacations|members> (attach a CSV or JSONL file)", "!import members"
+)
+
+INDEX_NOTE_KO = "인덱스는 최근 7일 출퇴근 기록에서 선택한 인덱스입니다. '!최근기록'을 사용해 확인하세요."
+INDEX_NOTE_EN = "Index is selected from recent 7 days' attendance records. Use `!recentrecord` to check."
+INDEX_NOTE_HELP = "Index는 최근 7일 출퇴근 기록에서 선택한 인덱스입니다. Index is selected from recent 7 days' attendance records."
+
+UNKNOWN_COMMAND = (
+    f"## 알 수 없는 명령어 (Unknown command)\n"
+    f"도움말을 보려면 `!h`를 사용하세요.\n"
+    f"\n"
+    f"Use `!h` for help.\n"
+)
+
+ADMIN_ONLY = (
+    f"## 오류: 관리자 전용 명령어 (Error: Admin-only command)\n"
+    f"이 명령어는 관리자 채널에서만 사용할 수 있습니다.\n"
+    f"\n"
+    f"This command can only be used in the admin channel.\n"
+)
+
+# Invalid rows listed in the reply to `!import`
+MAX_IMPORT_ERRORS = 20
+
+DATABASE_ERROR = (
+    f"## 오류: 데이터베이스 오류 (Database Error)\n"
+    f"데이터베이스 오류가 발생했습니다.\n"
+    f"\n"
+    f"An error occurred in the database.\n"
+)
+
+
+################
+### Handlers ###
+################
+def _help(ctx, args):
+    return help_command()
+
+def _check_in(ctx, args):
+    return record_attendance(ctx.bot, ctx.c, ctx.conn, ctx.user_id, 'in', 'Not specified', ctx.posted_at)
+
+def _check_out(ctx, args):
+    return record_attendance(ctx.bot, ctx.c, ctx.conn, ctx.user_id, 'out', 'Not specified', ctx.posted_at)
+
+def _missing(ctx, args):
+    return record_missing(ctx.bot, ctx.c, ctx.conn, ctx.user_id, args[0], args[1], args[2])
+
+def _recent_records(ctx, args):
+    return recent_records(ctx.bot, ctx.c, ctx.conn, ctx.user_id)
+
+def _edit(ctx, args):
+    return edit_record(ctx.bot, ctx.c, ctx.conn, ctx.user_id, args[0], args[1], args[2],
+                       args[3] if len(args) > 3 else None, args[4] if len(args) > 4 else None)
+
+def _delete(ctx, args):
+    return delete_record(ctx.bot, ctx.c, ctx.conn, ctx.user_id, args[0])
+
+def _vacation(ctx, args):
+    return record_vacation(ctx.bot, ctx.c, ctx.conn, ctx.user_id, args[0], args[1], ' '.join(args[2:]))
+
+def _vacation_balance(ctx, args):
+    if args:
+        return get_vacation_balance(ctx.bot, ctx.c, ctx.conn, ctx.user_id, args[0])
+    # Get the balance of the current year
+    return get_vacation_balance(ctx.bot, ctx.c, ctx.conn, ctx.user_id)
+
+def _team_status(ctx, args):
+    if args:
+        day = datetime.strptime(args[0], "%Y-%m-%d").strftime("%Y-%m-%d")
+        return get_team_status(ctx.bot, ctx.c, ctx.conn, day, ctx.team.channel_id_attendance)
+    # Get the team status for the current date
+    return get_team_status(ctx.bot, ctx.c, ctx.conn, channel_id=ctx.team.channel_id_attendance)
+
+def _monthly_report(ctx, args):
+    if args:
+        year, month = datetime.strptime(args[0], "%Y-%m").strftime("%Y-%m").split('-')
+        return get_monthly_report(ctx.bot, ctx.c, ctx.conn, ctx.user_id, year, month)
+    # Get the monthly report for the current month
+    return get_monthly_report(ctx.bot, ctx.c, ctx.conn, ctx.user_id)
+
+def _attendance_rate(ctx, args):
+    if args:
+        year, month = datetime.strptime(args[0], "%Y-%m").strftime("%Y-%m").split('-')
+        return get_attendance_rate(ctx.bot, ctx.c, ctx.conn, ctx.user_id, year, month, ctx.team.channel_id_attendance)
+    # Get the attendance rate of the current month
+    return get_attendance_rate(ctx.bot, ctx.c, ctx.conn, ctx.user_id, channel_id=ctx.team.channel_id_attendance)
+
+def _yearly_report(ctx, args):
+    if args:
+        return get_yearly_report(ctx.bot, ctx.c, ctx.conn, ctx.user_id, args[0])
+    # Get the yearly report for the current year
+    return get_yearly_report(ctx.bot, ctx.c, ctx.conn, ctx.user_id)
+
+def _add_member(ctx, args):
+    try:
+        return add_member(ctx.bot, ctx.c, ctx.conn, *args[:6])
+    except sqlite3.IntegrityError:
+        return (
+            f"## 오류: 멤버가 이미 존재함 (Error: Member already exists)\n"
+            f"멤버 {args[0]}가 이미 존재합니다.\n"
+            f"정보를 업데이트하려면 `!updatemember`를, 삭제하려면 `!deletemember`를 사용하세요.\n"
+            f"\n"
+            f"Member {args[0]} already exists.\n"
+            f"Use `!updatemember` to update the information or `!deletemember` to delete the member.\n"
+        )
+
+def _delete_member(ctx, args):
+    try:
+        return delete_member(ctx.bot, ctx.c, ctx.conn, args[0])
+    except sqlite3.IntegrityError:
+        return f"Error: Member {args[0]} does not exist."
+
+def _update_member(ctx, args):
+    return update_member(ctx.bot, ctx.c, ctx.conn, args[0], *args[1:5])
+
+def _member_info(ctx, args):
+    try:
+        return get_member(ctx.bot, ctx.c, ctx.conn, args[0])
+    except sqlite3.IntegrityError:
+        return (
+            f"## 오류: 멤버를 찾을 수 없음 (Error: Member not found)\n"
+            f"멤버 {args[0]}를 찾을 수 없습니다.\n"
+            f"\n"
+            f"Member {args[0]} does not exist.\n"
+        )
+
+def _cache_stats(ctx, args):
+    lines = [f"#### Cache Stats"]
+    stats = dict(get_directory(ctx.bot).stats(), reports=report_cache.stats())
+    for name, stats in stats.items():
+        lines.append(f"- **{name}**: {stats['hits']} hits, {stats['misses']} misses, {stats['size']} entries")
+    return "\n".join(lines)
+
+def _profile(ctx, args):
+    profiler.arm(int(args[0]))
+    if profiler.remaining == 0:
+        return "Profiling stopped"
+    return f"Profiling the next {profiler.remaining} commands, stats are written to `{profiler.directory}`"
+
+def _rebuild_rollup(ctx, args):
+    rows = rebuild_daily_rollup(ctx.c, ctx.conn)
+    return f"Daily attendance rollup rebuilt: {rows} rows"
+
+def _export(ctx, args):
+    # The validators check each argument on its own; here they must also be
+    # in order: table, up to two dates, then the format
+    rest = args[1:]
+    fmt = rest.pop() if rest and rest[-1] in FORMATS else 'csv'
+    if args[0] not in TABLES or len(rest) > 2 or not all(map(_matches("%Y-%m-%d"), rest)) or rest != sorted(rest):
+        return EXPORT_USAGE
+    table = TABLES[args[0]]
+    start, end = (rest + [None, None])[:2]
+    # Posted to the admin channel the command came from, as an attachment
+    count = upload_export(ctx.bot, ctx.c, ctx.post['channel_id'], table, fmt, start, end)
+    return f"Export of {table.name} uploaded to the admin channel: {count} rows"
+
+def _import(ctx, args):
+    file_ids = ctx.post.get('file_ids') or []
+    if not file_ids:
+        return (
+            f"## 오류: 첨부 파일 없음 (Error: No attachment)\n"
+            f"가져올 CSV 또는 JSONL 파일을 명령어와 함께 첨부하세요.\n"
+            f"\n"
+            f"Attach the CSV or JSONL file to import to the command.\n"
+        )
+    with attachment_rows(ctx.bot, file_ids[0]) as rows:
+        result = import_rows(ctx.c, ctx.conn, TABLES[args[0]], rows)
+    if not result.errors:
+        return f"#### Import: {result.table}\n- **Rows imported**: {result.loaded}"
+    lines = [
+        f"## 오류: 가져오기 실패 (Error: Import failed)",
+        f"잘못된 행이 {len(result.errors)}개 있어 아무것도 가져오지 않았습니다. 수정 후 다시 가져오세요.",
+        f"",
+        f"Nothing was imported: {len(result.errors)} invalid rows. Fix them and import the file again.",
+        f"",
+    ]
+    lines += [f"- Line {number}: {error}" for number, error in result.errors[:MAX_IMPORT_ERRORS]]
+    if len(result.errors) > MAX_IMPORT_ERRORS:
+        lines.append(f"- ... {len(result.errors) - MAX_IMPORT_ERRORS} more")
+    return "\n".join(lines)
+
+def _fix_database(ctx, args):
+    try:
+        return fix_database(ctx.bot, ctx.c, ctx.conn, incremental=bool(args) and args[0] == 'incremental')
+    except sqlite3.IntegrityError:
+        return DATABASE_ERROR
+
+
+################
+### Registry ###
+################
+REGISTRY: Tuple[Command, ...] = (
+    Command(
+        'help', ('!도움', '!h', '!help'), _help,
+        help=HelpEntry(
+            "Help", "Help",
+            "`!도움`, `!h`, `!help`",
+            ("도움말 보기 Show this help message",),
+            "`!도움` or `!h`"
+        )
+    ),
+    ######################################
+    ### Attendance management commands ###
+    ######################################
+    Command(
+        'in', ('!출근', '!in'), _check_in,
+        help=HelpEntry(
+            "Attendance Commands", "Check-in",
+            "`!출근`, `!in`",
+            ("출근 Attend work",),
+            "`!출근` or `!in`"
+        )
+    ),
+    Command(
+        'out', ('!퇴근', '!out'), _check_out,
+        help=HelpEntry(
+            "Attendance Commands", "Check-out",
+            "`!퇴근`, `!out`",
+            ("퇴근 Leave work",),
+            "`!퇴근` or `!out`"
+        )
+    ),
+    Command(
+        'missing', ('!출퇴근누락', '!missing'), _missing,
+        min_args=3,
+        usage=_invalid_format(
+            "!missing YYYY-MM-DD <time_in> <time_out>", "!missing 2024-08-01 09:00 18:00",
+            "!missing YYYY-MM-DD <time_in> <time_out>", "!missing 2024-08-01 09:00 18:00"
+        ),
+        help=HelpEntry(
+            "Attendance Commands", "Missing Attendance",
+            "`!출퇴근누락 <일자> <출근시간> <퇴근시간>`, `!missing <date> <time_in> <time_out>`",
+            ("누락된 출퇴근 기록 입력 Enter missing attendance",),
+            "`!출퇴근누락 2024-12-31 09:00 18:00` or `!missing 2024-12-31 09:00 18:00`"
+        )
+    ),
+    Command(
+        'recentrecord', ('!최근기록', '!recentrecord'), _recent_records,
+        help=HelpEntry(
+            "Attendance Commands", "Look up recent records",
+            "`!recentrecord`, `!최근기록`",
+            ("최근 7일 출퇴근 기록 조회 Look up recent 7 days' attendance records",),
+            "`!recentrecord` or `!최근기록`"
+        )
+    ),
+    Command(
+        'edit', ('!수정', '!edit'), _edit,
+        min_args=3,
+        usage=_invalid_format(
+            "!edit <인덱스> <날짜> <출근시간> <퇴근시간:선택> <위치:선택>", "!edit 0 2024-08-01 09:00 18:00 집",
+            "!edit <index> <date> <time_in> <time_out:optional> <location:optional>", "!edit 0 2024-08-01 09:00 18:00 Home",
+            INDEX_NOTE_KO, INDEX_NOTE_EN
+        ),
+        help=HelpEntry(
+            "Attendance Commands", "Edit a Record",
+            "`!수정 <인덱스> <날짜> <출근시간> <퇴근시간:선택> <위치:선택>`, `!edit <index> <date> <time_in> <time_out:optional> <location:optional>`",
+            ("최근 7일 출퇴근 기록 수정 Edit a record within recent 7 days",),
+            "`!수정 0 2024-12-31 09:00 18:00` or `!edit 0 2024-12-31 09:00 18:00`",
+            INDEX_NOTE_HELP
+        )
+    ),
+    Command(
+        'delete', ('!삭제', '!delete'), _delete,
+        min_args=1,
+        usage=_invalid_format(
+            "!delete <인덱스>", "!delete 0",
+            "!delete <index>", "!delete 0",
+            INDEX_NOTE_KO, INDEX_NOTE_EN
+        ),
+        help=HelpEntry(
+            "Attendance Commands", "Delete a Record",
+            "`!삭제 <인덱스>`, `!delete <index>`",
+            ("최근 7일 특정 출퇴근 기록 삭제 Delete a record within recent 7 days",),
+            "`!삭제 0` or `!delete 0`",
+            INDEX_NOTE_HELP
+        )
+    ),
+    Command(
+        'vacation', ('!휴가', '!vacation'), _vacation,
+        min_args=3,
+        usage=_invalid_format(
+            "!vacation YYYY-MM-DD(시작일) YYYY-MM-DD(종료일) <사유>", "!vacation 2024-08-01 2024-08-05 가족여행",
+            "!vacation YYYY-MM-DD(start) YYYY-MM-DD(end) <reason>", "!vacation 2024-08-01 2024-08-05 Family_vacation"
+        ),
+        help=HelpEntry(
+            "Attendance Commands", "Vacation",
+            "`!휴가 <휴가시작일> <휴가마감일> <사유>`, `!vacation <start_date> <end_date> <reason>`",
+            ("휴가 기록 Record vacation",),
+            "`!휴가 2024-12-31 2025-01-02 가족여행` or `!vacation 2024-12-31 2025-01-02 Family_trip`"
+        )
+    ),
+    Command(
+        'vacationbalance', ('!휴가잔여', '!vacationbalance'), _vacation_balance,
+        validators=((0, _matches("%Y"), _invalid_date("YYYY", "!vacationbalance 2024")),),
+        help=HelpEntry(
+            "Attendance Commands", "Vacation Balance",
+            "`!휴가잔여 <연도:선택>`, `!vacationbalance <year:optional>`",
+            (
+                "연차 사용 및 잔여 일수 출력 (주말과 공휴일 제외) Print used and remaining vacation days, not counting weekends and holidays",
+                "연도를 지정하지 않으면 올해 기준 Print the balance of the current year if no year is given",
+            ),
+            "`!휴가잔여` or `!휴가잔여 2024` or `!vacationbalance` or `!vacationbalance 2024`"
+        )
+    ),
+    Command(
+        'teamstatus', ('!상태', '!teamstatus'), _team_status,
+        validators=((0, _matches("%Y-%m-%d"), _invalid_date("YYYY-MM-DD", "!teamstatus 2024-08-01")),),
+        help=HelpEntry(
+            "Attendance Commands", "Team Status",
+            "`!상태 <일자:선택>`, `!teamstatus <date:optional>`",
+            (
+                "출퇴근 상태 출력 Print all team members' statuses",
+                "일자를 지정하지 않으면 오늘의 상태 출력 Print all team members' statuses for the current date",
+            ),
+            "`!상태` or `!상태 2024-12-31` or `!teamstatus` or `!teamstatus 2024-12-31`"
+        )
+    ),
+    Command(
+        'monthlyreport', ('!월간보고', '!monthlyreport'), _monthly_report,
+        validators=((0, _matches("%Y-%m"), _invalid_date("YYYY-MM", "!monthlyreport 2024-08")),),
+        help=HelpEntry(
+            "Attendance Commands", "Monthly Report",
+            "`!월간보고 <연도-월:선택>`, `!monthlyreport <year-month:optional>`",
+            (
+                "이번 달 출퇴근 보고서 출력 (자신의 보고서만) Print the monthly attendance report for the current month (your report only)",
+                "연도와 월을 지정하지 않으면 현재 달의 보고서 출력 Print the monthly attendance report for the specified year and month (your report only)",
+            ),
+            "`!월간보고` or `!월간보고 2024-12` or `!monthlyreport` or `!monthlyreport 2024-12`"
+        )
+    ),
+    Command(
+        'yearlyreport', ('!연간보고', '!yearlyreport'), _yearly_report,
+        validators=((0, _matches("%Y"), _invalid_date("YYYY", "!yearlyreport 2024")),),
+        help=HelpEntry(
+            "Attendance Commands", "Yearly Report",
+            "`!연간보고 <연도:선택>`, `!yearlyreport <year:optional>`",
+            (
+                "올해 출퇴근 보고서 출력: 근무시간 백분위수, 요일별 출근 시각, 지각 횟수 Print the yearly attendance report: hour percentiles, arrival times by weekday and late arrivals",
+                "연도를 지정하지 않으면 올해의 보고서 출력 Print the report of the current year if no year is given",
+            ),
+            "`!연간보고` or `!연간보고 2024` or `!yearlyreport` or `!yearlyreport 2024`"
+        )
+    ),
+    Command(
+        'attendancerate', ('!출근율', '!attendancerate'), _attendance_rate,
+        validators=((0, _matches("%Y-%m"), _invalid_date("YYYY-MM", "!attendancerate 2024-08")),),
+        help=HelpEntry(
+            "Attendance Commands", "Attendance Rate",
+            "`!출근율 <연도-월:선택>`, `!attendancerate <year-month:optional>`",
+            (
+                "출근율 출력: 출근일 / (근무일 - 휴가일), 미출근일 목록 포함 Print the attendance rate, attended / (working days - vacation days), with your missing days",
+                "연도와 월을 지정하지 않으면 이번 달 오늘까지 Print the current month up to today if no year and month are given",
+            ),
+            "`!출근율` or `!출근율 2024-12` or `!attendancerate` or `!attendancerate 2024-12`"
+        )
+    ),
+    ##################################
+    ### Member management commands ###
+    ##################################
+    Command(
+        'addmember', ('!멤버추가', '!addmember'), _add_member,
+        min_args=6,
+        usage=_invalid_format(
+            "!addmember <사용자ID> <이름> <직위> <전화번호> <이메일> <생년월일>",
+            "!addmember @gdhong 홍길동 석사 010-1234-5678 gdhong@kw.ac.kr 1970-01-01",
+            "!addmember <user_id> <name> <position> <phone> <email> <birthday>",
+            "!addmember @gdhong Gildong_Hong MS 010-1234-5678 gdhong@kw.ac.kr 1970-01-01"
+        ),
+        help=HelpEntry(
+            "Member Management Commands", "Add Member",
+            "`!멤버추가 <@아이디> <이름> <과정> <전화번호> <이메일> <생일>`, `!addmember <@user_id> <name> <position> <phone> <email> <birthday>`",
+            ("멤버 추가 Add a member",),
+            "`!멤버추가 @gdhong 홍길동 PhD 010-1234-5678 gdhong@kw.ac.kr 1970-01-01` or `!addmember @gdhong Gildong-Hong PhD 010-1234-5678 gdhong@kw.ac.kr 1970-01-01`"
+        )
+    ),
+    Command(
+        'deletemember', ('!멤버삭제', '!deletemember'), _delete_member,
+        min_args=1,
+        usage=_invalid_format(
+            "!deletemember <사용자ID>", "!deletemember @gdhong",
+            "!deletemember <user_id>", "!deletemember @gdhong"
+        ),
+        help=HelpEntry(
+            "Member Management Commands", "Delete Member",
+            "`!멤버삭제 <@아이디>`, `!deletemember <@user_id>`",
+            ("멤버 삭제 Delete a member",),
+            "`!멤버삭제 @gdhong` or `!deletemember @gdhong`"
+        )
+    ),
+    Command(
+        'updatemember', ('!멤버업데이트', '!updatemember'), _update_member,
+        min_args=1,
+        usage=_invalid_format(
+            "!updatemember <사용자ID> <직위:선택> <전화번호:선택> <이메일:선택> <생년월일:선택>",
+            "!updatemember @gdhong 박사 010-1234-5678",
+            "!updatemember <user_id> <position:optional> <phone:optional> <email:optional> <birthday:optional>",
+            "!updatemember @gdhong PhD 010-1234-5678"
+        ),
+        help=HelpEntry(
+            "Member Management Commands", "Update Member",
+            "`!멤버업데이트 <@아이디> <과정:선택> <전화번호:선택> <이메일:선택> <생일:선택>`, `!updatemember <@user_id> <position:optional> <phone:optional> <email:optional> <birthday:optional>`",
+            ("멤버 정보 업데이트 Update member info (optional)",),
+            "`!멤버업데이트 @gdhong PhD 010-1234-5678 gdhong@kw.ac.kr 1970-01-01` or `!updatemember @gdhong PhD 010-1234-5678`"
+        )
+    ),
+    Command(
+        'memberinfo', ('!멤버조회', '!memberinfo'), _member_info,
+        min_args=1,
+        usage=_invalid_format(
+            "!memberinfo <사용자ID>", "!memberinfo @gdhong",
+            "!memberinfo <user_id>", "!memberinfo @gdhong"
+        ),
+        help=HelpEntry(
+            "Member Management Commands", "Member Info",
+            "`!멤버조회 <@아이디>`, `!memberinfo <@user_id>`",
+            ("멤버 정보 조회 Get member info",),
+            "`!멤버조회 @gdhong` or `!memberinfo @gdhong`"
+        )
+    ),
+    ######################
+    ### Admin commands ###
+    ######################
+    Command('fixdatabase', ('!fixdatabase',), _fix_database),
+    Command('cachestats', ('!cachestats',), _cache_stats),
+    Command('rebuildrollup', ('!rebuildrollup',), _rebuild_rollup, admin_only=True),
+    Command(
+        'profile', ('!profile',), _profile,
+        min_args=1,
+        usage=_invalid_format("!profile <N>", "!profile 10", "!profile <N>", "!profile 10"),
+        validators=((0, str.isdigit, _invalid_format("!profile <N>", "!profile 10", "!profile <N>", "!profile 10")),),
+        admin_only=True
+    ),
+    Command(
+        'export', ('!export',), _export,
+        min_args=1,
+        usage=EXPORT_USAGE,
+        validators=(
+            (0, TABLES.__contains__, EXPORT_USAGE),
+            (1, _date_or_format, _invalid_date("YYYY-MM-DD", "!export attendance 2024-01-01 2024-12-31")),
+            (2, _date_or_format, _invalid_date("YYYY-MM-DD", "!export attendance 2024-01-01 2024-12-31")),
+            (3, FORMATS.__contains__, EXPORT_USAGE),
+        ),
+        admin_only=True
+    ),
+    Command(
+        'import', ('!import',), _import,
+        min_args=1,
+        usage=IMPORT_USAGE,
+        validators=((0, TABLES.__contains__, IMPORT_USAGE),),
+        admin_only=True
+    ),
+)
+
+# Every alias maps to its command, so dispatch is a single dict lookup
+COMMANDS: Dict[str, Command] = {
+    alias: command
+    for command in REGISTRY
+    for alias in command.aliases
+}
+
+
+@lru_cache(maxsize=None)
+def help_command() -> str:
+    """Build the `!h` message from the registry. Built once, then cached."""
+    lines = [
+        f"## Attendance Bot version {HELP_VERSION}",
+        f"# Bot Commands",
+        f"All commands must start with a '!' character.",
+        f"모든 명령어는 '!' 문자로 시작해야 합니다.",
+        f"",
+        f"Response will be sent to Direct Message.",
+        f"응답은 DM으로 전송됩니다.",
+        f"",
+        f"## Available commands:",
+    ]
+
+    section = None
+    for command in REGISTRY:
+        entry = command.help
+        if entry is None:
+            continue
+        if entry.section != section:
+            section = entry.section
+            lines += [f"", f"### {section}"]
+        lines += [f"", f"#### {entry.title}", f"- {entry.syntax}"]
+        lines += [f"- {description}" for description in entry.description]
+        lines.append(f"- **Example:** {entry.example}")
+        if entry.note:
+            lines.append(f"- **Note:** {entry.note}")
+
+    lines += [
+        f"",
+        f"## Developer Information",
+        f"",
+        f"- **Developer:** Jiwoon Lee 이지운",
+        f"- **GitHub:** [metr0jw](https://github.com/metr0jw)",
+        f"",
+        f"Contact me if you have any questions or suggestions.",
+        f"질문이나 제안이 있으면 연락주세요.",
+    ]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,105 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+
+def database_key(conn: sqlite3.Connection) -> str:
+    """The file of the connection's main database, shared by every connection to it."""
+    for _, name, path in conn.execute("PRAGMA database_list"):
+        if name == 'main' and path:
+            return path
+    # In-memory databases are private to their connection
+    return f"memory:{id(conn)}"
+
+
+class ReportCache:
+    """
+    Results of the !teamstatus, !monthlyreport and !yearlyreport queries,
+    per database.
+
+    Entries are keyed by kind and period: 'status' with a day
+    ('YYYY-MM-DD'), 'month' with a month ('YYYY-MM') or 'year' with a year
+    ('YYYY'). At most `maxsize` are kept, the least recently used are
+    evicted first.
+
+    Every command or job that writes attendance or vacations calls
+    `invalidate()` after committing, which drops exactly the entries of the
+    days (and their months and years) it touched. A result computed while such a write
+    was being committed is not stored: `lookup()` hands out the database's
+    generation, and `store()` ignores results from an older generation.
+
+    Writes by other processes (transfer.py, another replica) are not seen
+    by those calls, so results also expire `ttl` seconds after they were
+    stored (None keeps them until invalidated).
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        # Results with the time they were stored
+        self._data: "OrderedDict[Tuple[str, str, str], Tuple[Any, float]]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, conn: sqlite3.Connection, kind: str, period: str) -> Tuple[Optional[Any], Hashable]:
+        """Return (cached result or None, token to `store()` a freshly computed result with)."""
+        database = database_key(conn)
+        key = (database, kind, period)
+        with self._lock:
+            token = (key, self._generations.get(database, 0))
+            if key in self._data:
+                value, stored_at = self._data[key]
+                if self.ttl is None or self.clock() - stored_at < self.ttl:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value, token
+                del self._data[key]
+            self.misses += 1
+            return None, token
+
+    def store(self, token: Hashable, value: Any):
+        key, generation = token
+        with self._lock:
+            if self._generations.get(key[0], 0) != generation:
+                return
+            self._data[key] = (value, self.clock())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def _drop(self, database: str, matches):
+        self._generations[database] = self._generations.get(database, 0) + 1
+        for key in [key for key in self._data if key[0] == database and matches(key[1], key[2])]:
+            del self._data[key]
+
+    def invalidate(self, conn: sqlite3.Connection, days: Iterable[str]):
+        """Drop the results covering any of `days` ('YYYY-MM-DD')."""
+        # A day, its month and its year are prefixes of 'YYYY-MM-DD'
+        periods = {day[:length] for day in days for length in (10, 7, 4)}
+        with self._lock:
+            self._drop(database_key(conn), lambda kind, period: period in periods)
+
+    def invalidate_range(self, conn: sqlite3.Connection, start: str, end: str):
+        """Drop the results covering any day from `start` to `end`, inclusive."""
+        with self._lock:
+            self._drop(database_key(conn), lambda kind, period: (
+                start[:len(period)] <= period <= end[:len(period)]
+            ))
+
+    def clear(self, conn: sqlite3.Connection):
+        """Drop every result of the connection's database, e.g. after a bulk change."""
+        with self._lock:
+            self._drop(database_key(conn), lambda kind, period: True)
+
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data)}
+
+
+# Shared by the report commands and every writer of attendance and vacations
+report_cache = ReportCache()
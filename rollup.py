@@ -0,0 +1,36 @@
+import sqlite3
+from typing import Iterable, Tuple
+
+from timecodes import day_number
+from reports import report_cache
+
+# Worked minutes, number of sessions and first check-in per user and day.
+# Sessions without a check-out count towards `sessions` but add no minutes.
+DAILY_AGGREGATE = """
+    SELECT date, user_id, SUM(COALESCE(minute_out - minute_in, 0)), COUNT(*), MIN(minute_in)
+    FROM attendance
+"""
+
+
+def refresh_daily_rollup(c: sqlite3.Cursor, keys: Iterable[Tuple[str, str]]):
+    """
+    Recompute the attendance_daily rows of the given (user_id, date) pairs
+    from the raw attendance rows. Does not commit, so the rollup changes in
+    the same transaction as the records it summarises.
+    """
+    for user_id, date in set(keys):
+        c.execute("DELETE FROM attendance_daily WHERE date = ? AND user_id = ?", (date, user_id))
+        c.execute(
+            f"INSERT INTO attendance_daily {DAILY_AGGREGATE} WHERE user_id = ? AND day = ? GROUP BY date, user_id",
+            (user_id, day_number(date))
+        )
+
+
+def rebuild_daily_rollup(c: sqlite3.Cursor, conn: sqlite3.Connection) -> int:
+    """Regenerate the whole attendance_daily table from raw attendance. Returns the number of rows."""
+    c.execute("DELETE FROM attendance_daily")
+    c.execute(f"INSERT INTO attendance_daily {DAILY_AGGREGATE} GROUP BY date, user_id")
+    rows = c.rowcount
+    conn.commit()
+    report_cache.clear(conn)
+    return rows
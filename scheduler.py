@@ -0,0 +1,170 @@
+import heapq
+import logging
+import threading
+from time import perf_counter
+from dataclasses import dataclass, field
+from datetime import datetime, time, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from metrics import JOB_DURATION, JOB_ERRORS
+
+# Get the logger in main.py
+logger = logging.getLogger('bot')
+
+# Next fire time strictly after the given (timezone-aware) datetime
+Rule = Callable[[datetime], datetime]
+
+
+def daily(at: time, tz: ZoneInfo) -> Rule:
+    """Fire every day at `at`, local time in `tz`."""
+    def next_after(moment: datetime) -> datetime:
+        day = moment.astimezone(tz).date()
+        fire = datetime.combine(day, at, tzinfo=tz)
+        if fire <= moment:
+            fire = datetime.combine(day + timedelta(days=1), at, tzinfo=tz)
+        return fire
+    return next_after
+
+
+def monthly(day: int, at: time, tz: ZoneInfo) -> Rule:
+    """Fire on the `day`-th of every month at `at`, local time in `tz`. `day` must be at most 28."""
+    every_day = daily(at, tz)
+
+    def next_after(moment: datetime) -> datetime:
+        fire = every_day(moment)
+        while fire.astimezone(tz).day != day:
+            fire = every_day(fire)
+        return fire
+    return next_after
+
+
+@dataclass
+class Job:
+    """
+    A recurring task. `func(c, conn, scheduled)` receives a database
+    connection and the time the run was due. The connection is opened by
+    `open_connection` if given (e.g. for a team's own database), otherwise
+    by the scheduler's; either way it is opened once and then reused.
+
+    Runs missed while the bot was down (or busy) are caught up on start, as
+    long as they are at most `grace` late; older ones are skipped. Every
+    missed run within the grace period is made, oldest first.
+    """
+    name: str
+    rule: Rule
+    func: Callable
+    grace: timedelta = timedelta(hours=1)
+    open_connection: Optional[Callable[[], Tuple]] = None
+
+
+@dataclass(order=True)
+class _Entry:
+    fire_at: datetime
+    seq: int
+    job: Job = field(compare=False)
+
+
+class Scheduler:
+    """
+    Run jobs at their scheduled times on a background thread.
+
+    Next fire times are kept in a heap, so the thread sleeps until the
+    earliest one instead of checking the clock every second. The time of
+    each job's last run is stored in the `job_runs` table, so a restart
+    knows which runs were missed and does not repeat runs already made.
+    A job's runs are stored in the database the job runs against.
+
+    If `guard` is given, it is checked before every run; once it returns
+    False the scheduler stops without running or recording the job, e.g.
+    when this replica is no longer the leader.
+    """
+
+    def __init__(self, open_connection: Callable[[], Tuple], clock: Callable[[], datetime],
+                 guard: Optional[Callable[[], bool]] = None):
+        self.open_connection = open_connection
+        self.clock = clock
+        self.guard = guard
+        self.jobs: List[Job] = []
+        self._heap: List[_Entry] = []
+        self._seq = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # (cursor, connection) per connection opener, opened on the scheduler's thread
+        self._connections: Dict[Callable, Tuple] = {}
+
+    def add(self, job: Job):
+        self.jobs.append(job)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def pending(self) -> List[Tuple[str, datetime]]:
+        """(job name, next fire time) of every job, earliest first."""
+        return [(entry.job.name, entry.fire_at) for entry in sorted(self._heap)]
+
+    def _push(self, fire_at: datetime, job: Job):
+        self._seq += 1
+        heapq.heappush(self._heap, _Entry(fire_at, self._seq, job))
+
+    def _connection(self, job: Job) -> Tuple:
+        open_connection = job.open_connection or self.open_connection
+        if open_connection not in self._connections:
+            self._connections[open_connection] = open_connection()
+        return self._connections[open_connection]
+
+    def _last_run(self, c, job: Job) -> Optional[datetime]:
+        c.execute("SELECT last_run FROM job_runs WHERE name = ?", (job.name,))
+        row = c.fetchone()
+        return datetime.fromisoformat(row[0]) if row else None
+
+    def _execute(self, job: Job, scheduled: datetime):
+        c, conn = self._connection(job)
+        logger.info(f"Running job {job.name} scheduled for {scheduled.isoformat()}")
+        start = perf_counter()
+        try:
+            job.func(c, conn, scheduled)
+        except Exception as e:
+            conn.rollback()
+            JOB_ERRORS.inc(job.name)
+            logger.error(f"Error in job {job.name}: {e}")
+        JOB_DURATION.observe(perf_counter() - start, job.name)
+        # Recorded even on failure, so a broken run is not repeated forever
+        c.execute("INSERT OR REPLACE INTO job_runs VALUES (?, ?)", (job.name, scheduled.isoformat()))
+        conn.commit()
+
+    def _run(self):
+        now = self.clock()
+        for job in self.jobs:
+            last_run = self._last_run(self._connection(job)[0], job)
+            # Never run before: start with the next occurrence
+            fire_at = job.rule(last_run if last_run is not None else now)
+            self._push(fire_at, job)
+
+        while not self._stop.is_set():
+            now = self.clock()
+            entry = self._heap[0] if self._heap else None
+            if entry is None or entry.fire_at > now:
+                wait = (entry.fire_at - now).total_seconds() if entry else None
+                # Capped, so a changed system clock is noticed within a minute
+                self._stop.wait(min(wait, 60) if wait is not None else 60)
+                continue
+
+            if self.guard is not None and not self.guard():
+                logger.warning(f"Not running job {entry.job.name}: scheduler stopped by its guard")
+                break
+            heapq.heappop(self._heap)
+            if now - entry.fire_at <= entry.job.grace:
+                self._execute(entry.job, entry.fire_at)
+            else:
+                logger.warning(f"Skipping job {entry.job.name} scheduled for {entry.fire_at.isoformat()}: missed by more than {entry.job.grace}")
+            self._push(entry.job.rule(entry.fire_at), entry.job)
+
+        for c, conn in self._connections.values():
+            conn.close()
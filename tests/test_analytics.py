@@ -0,0 +1,54 @@
+import sqlite3
+import unittest
+from datetime import date
+
+import analytics
+from commands import _attendance_rate_stats, record_missing, record_vacation
+from database import init_db
+from timecodes import day_number
+from vacations import vacation_index
+
+
+class AttendanceRateTest(unittest.TestCase):
+    """Holidays and vacation days are left out of the attendance-rate denominator."""
+
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        self.addCleanup(self.conn.close)
+        init_db(self.conn)
+        self.c = self.conn.cursor()
+        # Mon 2024-08-12 to Sun 2024-08-18, with Liberation Day on Thursday the 15th:
+        # working days are the 12th, 13th, 14th and 16th
+        self.first, self.last = date(2024, 8, 12), date(2024, 8, 18)
+        for day in ('2024-08-12', '2024-08-13', '2024-08-15'):
+            record_missing(None, self.c, self.conn, 'a', day, '09:00', '18:00')
+        record_vacation(None, self.c, self.conn, 'a', '2024-08-16', '2024-08-16', 'Trip')
+        # Only on vacation, over the holiday and the weekend
+        record_vacation(None, self.c, self.conn, 'b', '2024-08-14', '2024-08-18', 'Trip')
+
+    def test_fixed_calendar(self):
+        working = [True, True, True, False, True, False, False]
+        rates = analytics.attendance_rates(
+            analytics.load_attendance(self.c, self.first, self.last), day_number(self.first), working,
+            vacation_index.overlapping(self.conn, self.first, self.last)
+        )
+        by_user = {user_id: i for i, user_id in enumerate(rates.user_ids)}
+        a, b = by_user['a'], by_user['b']
+        # Check-in on the holiday is not counted; the vacation day is not expected
+        self.assertEqual((rates.attended[a], rates.expected[a], rates.vacation[a]), (2, 3, 1))
+        self.assertEqual(rates.missing[a].tolist(), [day_number('2024-08-14')])
+        # Vacation days are the working days of the vacation: the 14th and 16th
+        self.assertEqual((rates.attended[b], rates.expected[b], rates.vacation[b]), (0, 2, 2))
+        self.assertEqual(rates.missing[b].tolist(), [day_number('2024-08-12'), day_number('2024-08-13')])
+
+    def test_korean_calendar(self):
+        stats = _attendance_rate_stats(self.c, self.conn, self.first, self.last)
+        self.assertEqual(stats['working_days'], 4)
+        self.assertEqual(stats['users'], {
+            'a': (2, 3, 1, [date(2024, 8, 14)]),
+            'b': (0, 2, 2, [date(2024, 8, 12), date(2024, 8, 13)]),
+        })
+
+
+if __name__ == '__main__':
+    unittest.main()
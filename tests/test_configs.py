@@ -0,0 +1,63 @@
+import unittest
+from unittest import mock
+
+import configs
+from main import Application
+
+CONFIGS = {
+    'DEBUG': False,
+    'mattermost_url': 'mattermost.example.com',
+    'bot_token': 'token',
+    'channel_id_attendance': 'attendance',
+    'channel_id_birthday': 'birthday',
+    'channel_id_admin': 'admin',
+    'channel_id_debug': 'debug',
+    'db_path': '/data/mydb.db',
+    'db_path_debug': 'debugdb.db',
+    'teams': [
+        {'name': 'lab-a', 'db_path': '/data/lab-a.db', 'channel_id_attendance': 'a-attendance',
+         'channel_id_birthday': 'a-birthday', 'channel_id_admin': 'a-admin'},
+        {'name': 'lab-b', 'db_path': '/data/lab-b.db', 'channel_id_attendance': 'b-attendance',
+         'channel_id_birthday': 'b-birthday', 'channel_id_admin': 'b-admin'},
+    ],
+}
+
+
+class TeamsTest(unittest.TestCase):
+
+    def application(self, **overrides) -> Application:
+        settings = mock.patch.object(configs, '_loaded', configs._settings(dict(CONFIGS, **overrides)))
+        settings.start()
+        self.addCleanup(settings.stop)
+        return Application()
+
+    def test_posts_are_routed_by_channel(self):
+        app = self.application()
+        lab_a, lab_b = app.shards
+        self.assertEqual((lab_a.team.db_path, lab_b.team.db_path), ('/data/lab-a.db', '/data/lab-b.db'))
+        for channel_id, shard in (('a-attendance', lab_a), ('a-admin', lab_a),
+                                  ('b-attendance', lab_b), ('b-admin', lab_b),
+                                  ('elsewhere', lab_a)):
+            self.assertIs(app.shard_for(channel_id), shard, channel_id)
+
+    def test_debug_gives_every_team_its_own_database(self):
+        app = self.application(DEBUG=True)
+        lab_a, lab_b = app.shards
+        self.assertEqual((lab_a.team.db_path, lab_b.team.db_path), ('debugdb-lab-a.db', 'debugdb-lab-b.db'))
+        # The shared debug channel goes to the first team, the admin channels to their own
+        self.assertIs(app.shard_for('debug'), lab_a)
+        self.assertIs(app.shard_for('b-admin'), lab_b)
+
+    def test_debug_database_set_by_a_team_is_kept(self):
+        teams = [dict(CONFIGS['teams'][0], db_path_debug='/tmp/a.db'), CONFIGS['teams'][1]]
+        self.assertEqual([team.db_path for team in configs._teams(dict(CONFIGS, teams=teams), True)],
+                         ['/tmp/a.db', 'debugdb-lab-b.db'])
+
+    def test_teams_need_their_own_database(self):
+        teams = [CONFIGS['teams'][0], dict(CONFIGS['teams'][1], db_path='/data/lab-a.db')]
+        with self.assertRaisesRegex(ValueError, "db_path"):
+            configs._teams(dict(CONFIGS, teams=teams), False)
+
+
+if __name__ == '__main__':
+    unittest.main()
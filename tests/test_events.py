@@ -0,0 +1,136 @@
+import json
+import time
+import asyncio
+import threading
+import unittest
+
+import websockets
+
+from events import EventListener
+
+
+def wait_for(condition, timeout: float = 5) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class FakeMattermost:
+    """
+    A local WebSocket server speaking the part of the Mattermost protocol
+    EventListener uses: the authentication challenge, then `events`.
+    With `close_after_events`, each connection is closed once they are sent.
+    """
+
+    def __init__(self, token: str = 'token', events=(), close_after_events: bool = False):
+        self.token = token
+        self.events = list(events)
+        self.close_after_events = close_after_events
+        self.connections = 0
+        self.challenges = []
+        self.port = None
+        self._ready = threading.Event()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_until_complete, args=(self._serve(),), daemon=True)
+
+    def start(self):
+        self._thread.start()
+        self._ready.wait(5)
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._stop.set)
+        self._thread.join(5)
+        self._loop.close()
+
+    async def _serve(self):
+        self._stop = asyncio.Event()
+        async with websockets.serve(self._handle, '127.0.0.1', 0) as server:
+            self.port = server.sockets[0].getsockname()[1]
+            self._ready.set()
+            await self._stop.wait()
+
+    async def _handle(self, websocket):
+        self.connections += 1
+        challenge = json.loads(await websocket.recv())
+        self.challenges.append(challenge)
+        if challenge['data']['token'] != self.token:
+            await websocket.send(json.dumps({
+                'status': 'FAIL', 'seq_reply': challenge['seq'], 'error': 'invalid token'
+            }))
+            return
+        await websocket.send(json.dumps({'status': 'OK', 'seq_reply': challenge['seq']}))
+        for event in self.events:
+            await websocket.send(json.dumps(event))
+        if not self.close_after_events:
+            await websocket.wait_closed()
+
+    @property
+    def options(self) -> dict:
+        return {'scheme': 'http', 'url': '127.0.0.1', 'port': self.port, 'basepath': '/api/v4'}
+
+
+def posted(message: str) -> dict:
+    # Mattermost sends the post itself as a JSON string
+    post = {'id': 'post1', 'channel_id': 'attendance', 'user_id': 'user', 'message': message}
+    return {'event': 'posted', 'data': {'post': json.dumps(post)}, 'seq': 2}
+
+
+class EventListenerTest(unittest.TestCase):
+
+    def server(self, **kwargs) -> FakeMattermost:
+        server = FakeMattermost(**kwargs)
+        server.start()
+        self.addCleanup(server.stop)
+        return server
+
+    def listener(self, server: FakeMattermost, token: str = 'token', **callbacks) -> EventListener:
+        listener = EventListener(server.options, token, reconnect_delay=0.05,
+                                 **{'on_post': lambda post: None, **callbacks})
+        listener.start()
+        self.addCleanup(listener.stop)
+        return listener
+
+    def test_posts_and_events_are_dispatched(self):
+        server = self.server(events=[posted('!in'), {'event': 'typing', 'data': {}, 'seq': 3}])
+        posts, events, connects = [], [], []
+        listener = self.listener(server, on_post=posts.append, on_event=events.append,
+                                 on_connect=lambda: connects.append(True))
+
+        self.assertTrue(wait_for(lambda: posts and events))
+        self.assertEqual(server.challenges[0]['action'], 'authentication_challenge')
+        self.assertEqual(server.challenges[0]['data'], {'token': 'token'})
+        self.assertEqual(posts, [{'id': 'post1', 'channel_id': 'attendance', 'user_id': 'user', 'message': '!in'}])
+        self.assertEqual([event['event'] for event in events], ['typing'])
+        self.assertEqual(connects, [True])
+        self.assertTrue(listener.connected)
+
+        listener.stop()
+        self.assertFalse(listener.connected)
+
+    def test_reconnects_and_catches_up_after_connection_loss(self):
+        server = self.server(events=[posted('!in')], close_after_events=True)
+        posts, connects = [], []
+        self.listener(server, on_post=posts.append, on_connect=lambda: connects.append(True))
+
+        # on_connect runs on every reconnect, so missed posts can be fetched
+        self.assertTrue(wait_for(lambda: len(connects) >= 3 and len(posts) >= 3))
+        self.assertGreaterEqual(server.connections, 3)
+
+    def test_rejected_token_does_not_connect(self):
+        server = self.server()
+        connects = []
+        with self.assertLogs('bot', 'WARNING') as logs:
+            listener = self.listener(server, token='wrong', on_connect=lambda: connects.append(True))
+            # Retried, but never authenticated
+            self.assertTrue(wait_for(lambda: server.connections >= 2))
+            listener.stop()
+        self.assertFalse(listener.connected)
+        self.assertEqual(connects, [])
+        self.assertIn("WebSocket authentication failed: invalid token", logs.output[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
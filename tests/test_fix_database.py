@@ -0,0 +1,82 @@
+import sqlite3
+import unittest
+
+from commands import fix_database
+from database import init_db
+
+INSERT = "INSERT INTO attendance (user_id, date, time_in, time_out, location) VALUES (?, ?, ?, ?, ?)"
+
+
+class FixDatabaseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        self.addCleanup(self.conn.close)
+        init_db(self.conn)
+        # Bad rows repaired by a first, full run, which sets the watermark
+        self.conn.executemany(INSERT, [
+            ('a', '2024-08-01', '9:00', '18:00', None),
+            ('a', '2024-08-02', '09:00:30', None, None),
+            ('b', '2024-08-01', '10:00', '10:00', None),
+        ])
+        self.conn.commit()
+        fix_database(None, self.conn.cursor(), self.conn)
+
+    def copy(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(':memory:')
+        self.addCleanup(conn.close)
+        self.conn.backup(conn)
+        return conn
+
+    def rows(self, conn):
+        return (conn.execute("SELECT user_id, date, time_in, time_out FROM attendance ORDER BY rowid").fetchall(),
+                conn.execute("SELECT * FROM attendance_daily ORDER BY date, user_id").fetchall())
+
+    def add_bad_rows(self, conn):
+        conn.executemany(INSERT, [
+            ('c', '2024-08-05', '8:45', None, None),
+            ('c', '2024-08-06', '09:00', '09:00', None),
+        ])
+        # A repaired row broken again after the watermark
+        conn.execute("UPDATE attendance SET time_out = '25:00' WHERE user_id = 'a' AND date = '2024-08-01'")
+        conn.commit()
+
+    def test_incremental_matches_full(self):
+        incremental, full = self.conn, self.copy()
+        for conn in (incremental, full):
+            self.add_bad_rows(conn)
+
+        result = fix_database(None, incremental.cursor(), incremental, incremental=True)
+        self.assertIn("(incremental)", result)
+        self.assertIn("- Zero-padded check-in hours: 1", result)
+        self.assertIn("- Clamped check-out past 23:59: 1", result)
+        fix_database(None, full.cursor(), full)
+        self.assertEqual(self.rows(incremental), self.rows(full))
+        self.assertEqual(self.rows(incremental)[0], [
+            ('a', '2024-08-01', '09:00', '23:59'),
+            ('a', '2024-08-02', '09:00', '23:59'),
+            ('c', '2024-08-05', '08:45', '23:59'),
+        ])
+
+    def test_incremental_only_examines_rows_changed_since_watermark(self):
+        # A bad row from before the watermark that the change log does not cover,
+        # e.g. written before the log existed
+        self.conn.execute(INSERT, ('d', '2024-08-01', '7:30', '12:00', None))
+        self.conn.execute("DELETE FROM attendance_changes")
+        self.conn.commit()
+        full = self.copy()
+        self.add_bad_rows(self.conn)
+        self.add_bad_rows(full)
+
+        fix_database(None, self.conn.cursor(), self.conn, incremental=True)
+        fix_database(None, full.cursor(), full)
+        incremental_rows, full_rows = self.rows(self.conn)[0], self.rows(full)[0]
+        self.assertIn(('d', '2024-08-01', '7:30', '12:00'), incremental_rows)
+        self.assertIn(('d', '2024-08-01', '07:30', '12:00'), full_rows)
+        # Every row changed since the watermark is repaired the same way
+        self.assertEqual([row for row in incremental_rows if row[0] != 'd'],
+                         [row for row in full_rows if row[0] != 'd'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from database import init_db
+from ingest import ChannelPoller
+
+
+class FakePosts:
+    """The posts endpoint of a Mattermost server, with `since` and `after`/`per_page` paging."""
+
+    def __init__(self):
+        self.channels = {}
+        self.requests = []
+
+    def add(self, channel_id: str, count: int, start: int = 1000):
+        posts = self.channels.setdefault(channel_id, [])
+        for i in range(count):
+            create_at = start + len(posts)
+            posts.append({'id': f'{channel_id}-{create_at}', 'channel_id': channel_id, 'user_id': 'user',
+                          'message': f'!in {len(posts)}', 'create_at': create_at})
+        return posts[-count:]
+
+    def get_posts_for_channel(self, channel_id, params):
+        self.requests.append((channel_id, dict(params)))
+        posts = self.channels.get(channel_id, [])
+        if 'after' in params:
+            ids = [post['id'] for post in posts]
+            start = ids.index(params['after']) + 1
+            found = posts[start:start + params['per_page']]
+        else:
+            found = [post for post in posts if post['create_at'] >= params['since']]
+        return {'order': [post['id'] for post in found], 'posts': {post['id']: post for post in found}}
+
+
+class ChannelPollerTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'ingest.db')
+        self.posts = FakePosts()
+        self.bot = SimpleNamespace(posts=self.posts)
+        self.conn = self.connect()
+        self.conn.execute("CREATE TABLE handled (post_id TEXT)")
+        self.conn.commit()
+
+    def connect(self):
+        conn = sqlite3.connect(self.path)
+        self.addCleanup(conn.close)
+        init_db(conn)
+        return conn
+
+    def poller(self, channels=('attendance',), **kwargs) -> ChannelPoller:
+        conn = self.conn
+        poller = ChannelPoller(self.bot, {channel_id: (conn.cursor(), conn) for channel_id in channels},
+                               since=1000, **kwargs)
+        self.addCleanup(poller.shutdown)
+        return poller
+
+    def handle(self, post):
+        # A command writing to the database
+        self.conn.execute("INSERT INTO handled VALUES (?)", (post['id'],))
+
+    def handled(self):
+        return [post_id for post_id, in self.conn.execute("SELECT post_id FROM handled ORDER BY rowid")]
+
+    def drain(self, poller, handle=None):
+        for post in poller.poll():
+            poller.process(post, handle or self.handle)
+
+    def test_failed_post_is_rolled_back_and_retried(self):
+        posts = self.posts.add('attendance', 3)
+        poller = self.poller()
+        failures = []
+
+        def flaky(post):
+            self.handle(post)
+            if post is posts[1] and not failures:
+                failures.append(post['id'])
+                raise RuntimeError("database is locked")
+
+        with self.assertLogs('bot', 'ERROR'):
+            self.drain(poller, flaky)
+        # The failed post's writes and claim were rolled back, and the post after it waits
+        self.assertEqual(self.handled(), [posts[0]['id']])
+        self.assertEqual(poller.cursors['attendance'], (posts[0]['create_at'], posts[0]['id']))
+        self.assertIn('attendance', poller.behind)
+
+        self.drain(poller, flaky)
+        self.assertEqual(self.handled(), [post['id'] for post in posts])
+        self.assertEqual(poller.cursors['attendance'], (posts[2]['create_at'], posts[2]['id']))
+
+    def test_gives_up_after_max_attempts(self):
+        posts = self.posts.add('attendance', 2)
+        poller = self.poller(max_attempts=2)
+
+        def broken(post):
+            if post is posts[0]:
+                raise RuntimeError("bug")
+            self.handle(post)
+
+        with self.assertLogs('bot', 'ERROR') as logs:
+            self.drain(poller, broken)
+            self.drain(poller, broken)
+        self.assertIn("giving up", logs.output[-1])
+        self.assertEqual(self.handled(), [posts[1]['id']])
+        # Marked handled, so it is not fetched again
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM processed_posts WHERE post_id = ?",
+                                           (posts[0]['id'],)).fetchone(), (1,))
+        self.assertEqual(poller.cursors['attendance'][1], posts[1]['id'])
+        self.assertNotIn('attendance', poller.behind)
+
+    def test_post_seen_over_rest_and_websocket_is_handled_once(self):
+        [post] = self.posts.add('attendance', 1)
+        poller = self.poller()
+        self.drain(poller)
+        # The same post pushed over the WebSocket
+        self.assertFalse(poller.process(dict(post), self.handle))
+        self.assertEqual(self.handled(), [post['id']])
+
+    def test_restart_resumes_from_stored_cursor(self):
+        first = self.posts.add('attendance', 2)
+        self.drain(self.poller())
+
+        later = self.posts.add('attendance', 2)
+        self.conn = self.connect()
+        restarted = self.poller()
+        self.assertEqual(restarted.cursors['attendance'], (first[1]['create_at'], first[1]['id']))
+        self.drain(restarted)
+        self.assertEqual(self.handled(), [post['id'] for post in first + later])
+        self.assertEqual(self.posts.requests[-1], ('attendance', {'after': first[1]['id'], 'per_page': 100}))
+
+    def test_backlog_is_fetched_in_pages(self):
+        [first] = self.posts.add('attendance', 1)
+        poller = self.poller(page_size=10)
+        self.drain(poller)
+        backlog = self.posts.add('attendance', 25)
+
+        polls = 0
+        while True:
+            self.drain(poller)
+            polls += 1
+            if 'attendance' not in poller.behind:
+                break
+        # Pages of 10, 10 and 5 posts
+        self.assertEqual(polls, 3)
+        self.assertEqual(self.handled(), [post['id'] for post in [first] + backlog])
+        self.assertEqual([params['per_page'] for _, params in self.posts.requests[1:]], [10, 10, 10])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from database import init_db
+from lease import Lease
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class LeaseTest(unittest.TestCase):
+    """Two replicas sharing one SQLite file, as in a failover."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'lease.db')
+        conn = sqlite3.connect(self.path)
+        init_db(conn)
+        conn.close()
+
+    def open_connection(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.addCleanup(conn.close)
+        return conn.cursor(), conn
+
+    def lease(self, holder, **kwargs) -> Lease:
+        lease = Lease(self.open_connection, holder=holder, **kwargs)
+        self.addCleanup(lease.release)
+        return lease
+
+    def test_only_one_holder(self):
+        clock = FakeClock()
+        a, b = self.lease('a', ttl=30, clock=clock), self.lease('b', ttl=30, clock=clock)
+        self.assertTrue(a.try_acquire())
+        self.assertFalse(b.try_acquire())
+        self.assertTrue(a.held)
+        self.assertFalse(b.held)
+        self.assertEqual(b.current_holder(), 'a')
+        # Renewing keeps it
+        clock.now += 20
+        self.assertTrue(a.try_acquire())
+        clock.now += 20
+        self.assertFalse(b.try_acquire())
+
+    def test_standby_takes_over_after_expiry(self):
+        clock = FakeClock()
+        a, b = self.lease('a', ttl=30, clock=clock), self.lease('b', ttl=30, clock=clock)
+        self.assertTrue(a.try_acquire())
+        clock.now += 30
+        # The leader stopped renewing: it no longer considers itself the leader
+        self.assertFalse(a.held)
+        self.assertTrue(b.try_acquire())
+        self.assertFalse(a.try_acquire())
+        self.assertEqual(a.current_holder(), 'b')
+
+    def test_release_hands_over_at_once(self):
+        clock = FakeClock()
+        a, b = self.lease('a', ttl=30, clock=clock), self.lease('b', ttl=30, clock=clock)
+        self.assertTrue(a.try_acquire())
+        a.release()
+        self.assertFalse(a.held)
+        self.assertTrue(b.try_acquire())
+
+    def test_demoted_leader_waits_as_standby(self):
+        a, b = self.lease('a', ttl=0.3), self.lease('b', ttl=0.3)
+        self.assertTrue(a.wait())
+        a.start()
+        a.release()
+        self.assertTrue(b.try_acquire())
+        b.start()
+
+        # After release(), wait() (as called by Application.run) must block
+        # while another replica holds the lease
+        acquired = []
+        waiter = threading.Thread(target=lambda: acquired.append(a.wait()), daemon=True)
+        waiter.start()
+        waiter.join(0.5)
+        self.assertTrue(waiter.is_alive())
+        self.assertFalse(a.held)
+
+        # ... and take over once it is released
+        b.release()
+        waiter.join(2)
+        self.assertFalse(waiter.is_alive())
+        self.assertEqual(acquired, [True])
+        self.assertTrue(a.held)
+
+    def test_wait_returns_false_when_stopped(self):
+        a, b = self.lease('a', ttl=30), self.lease('b', ttl=30)
+        self.assertTrue(a.try_acquire())
+        stop = threading.Event()
+        stop.set()
+        self.assertFalse(b.wait(stop))
+
+
+if __name__ == '__main__':
+    unittest.main()
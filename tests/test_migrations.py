@@ -0,0 +1,56 @@
+import sqlite3
+import unittest
+from unittest import mock
+
+import database
+from database import init_db, schema_version
+
+
+class IntegerColumnsMigrationTest(unittest.TestCase):
+    """Databases migrated to version 6, with stored integer columns, are converted to generated ones."""
+
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        self.addCleanup(self.conn.close)
+        with mock.patch.object(database, 'MIGRATIONS', database.MIGRATIONS[:6]):
+            init_db(self.conn)
+        self.assertEqual(schema_version(self.conn), 6)
+        self.conn.executemany("INSERT INTO attendance (user_id, date, time_in, time_out, location) VALUES (?, ?, ?, ?, ?)", [
+            ('user', '2024-08-01', '09:00', '18:00', 'Office'),
+            ('user', '2024-08-02', '9:50', '18:00', 'Office'),
+        ])
+        # As encoded by the version 5 triggers before times were split at the colon
+        self.conn.execute("UPDATE attendance SET minute_in = 540 WHERE time_in = '9:50'")
+        self.conn.execute("INSERT INTO attendance_daily VALUES ('2024-08-02', 'user', 540, 1, 540)")
+        self.conn.commit()
+
+    def columns(self):
+        return {name: hidden for _, name, _, _, _, _, hidden in self.conn.execute("PRAGMA table_xinfo(attendance)")}
+
+    def test_columns_become_virtual_and_correct(self):
+        self.assertEqual(self.columns()['minute_in'], 0)
+        init_db(self.conn)
+        self.assertEqual(schema_version(self.conn), len(database.MIGRATIONS))
+        # 2: a VIRTUAL generated column
+        self.assertEqual({name: self.columns()[name] for name in ('day', 'minute_in', 'minute_out')},
+                         {'day': 2, 'minute_in': 2, 'minute_out': 2})
+        self.assertEqual(self.conn.execute("SELECT day, minute_in, minute_out FROM attendance ORDER BY rowid").fetchall(),
+                         [(19936, 540, 1080), (19937, 590, 1080)])
+        self.assertEqual(self.conn.execute("SELECT * FROM attendance_daily ORDER BY date").fetchall(),
+                         [('2024-08-01', 'user', 540, 1, 540), ('2024-08-02', 'user', 490, 1, 590)])
+        self.assertEqual(database.unindexed_hot_queries(self.conn), {})
+
+    def test_writes_after_conversion(self):
+        init_db(self.conn)
+        before = self.conn.execute("SELECT COUNT(*) FROM attendance_changes").fetchone()[0]
+        self.conn.execute("UPDATE attendance SET time_out = '17:30' WHERE date = '2024-08-01'")
+        self.conn.execute("INSERT INTO attendance (user_id, date, time_in, location) VALUES ('user', '2024-08-05', '8:05', 'Office')")
+        # One log entry per write, and no encoding triggers left
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM attendance_changes").fetchone()[0], before + 2)
+        self.assertEqual(self.conn.execute("SELECT name FROM sqlite_master WHERE name LIKE 'attendance_encode%'").fetchall(), [])
+        self.assertEqual(self.conn.execute("SELECT minute_in, minute_out FROM attendance WHERE day >= 19936 ORDER BY day").fetchall(),
+                         [(540, 1050), (590, 1080), (485, None)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import time
+import sqlite3
+import unittest
+
+import metrics
+from profiling import SlowQueryLog
+
+
+class SlowQueryLogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:', factory=metrics.InstrumentedConnection)
+        self.addCleanup(self.conn.close)
+        self.conn.execute("CREATE TABLE members_info (user_id TEXT, phone TEXT)")
+
+    def test_logs_statement_without_parameters(self):
+        SlowQueryLog(0).install(self.conn)
+        with self.assertLogs('bot', 'WARNING') as logs:
+            self.conn.execute("INSERT INTO members_info VALUES (?, ?)", ('@alice', '010-1234-5678'))
+        [message] = logs.output
+        self.assertIn("INSERT INTO members_info VALUES (?, ?)", message)
+        self.assertNotIn('alice', message)
+        self.assertNotIn('010-1234-5678', message)
+
+    def test_slow_fetch_is_logged(self):
+        self.conn.executemany("INSERT INTO members_info VALUES (?, ?)", [(f'@user{i}', '') for i in range(5)])
+        # SQLite computes each row as it is fetched
+        self.conn.create_function('slow', 1, lambda value: time.sleep(0.02) or value)
+        SlowQueryLog(50).install(self.conn)
+        with self.assertLogs('bot', 'WARNING') as logs:
+            cursor = self.conn.execute("SELECT slow(user_id) FROM members_info")
+            self.assertEqual(len(cursor.fetchall()), 5)
+        self.assertIn("Slow SQL fetch", logs.output[-1])
+        self.assertIn("SELECT slow(user_id) FROM members_info", logs.output[-1])
+        self.assertGreater(metrics.DB_FETCH_DURATION.count('SELECT', 'members_info'), 0)
+
+    def test_fast_statements_are_not_logged(self):
+        SlowQueryLog(60 * 1000).install(self.conn)
+        with self.assertNoLogs('bot', 'WARNING'):
+            self.conn.execute("SELECT * FROM members_info WHERE user_id = ?", ('@alice',))
+
+
+if __name__ == '__main__':
+    unittest.main()
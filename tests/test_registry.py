@@ -0,0 +1,67 @@
+import sqlite3
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from commands import add_member
+from database import init_db
+from registry import COMMANDS, EXPORT_USAGE
+
+
+class ExportArgumentsTest(unittest.TestCase):
+
+    def export(self, *args):
+        team = SimpleNamespace(channel_id_admin='admin')
+        ctx = SimpleNamespace(bot=None, c=None, conn=None, team=team, post={'channel_id': 'admin'})
+        with mock.patch('registry.upload_export', return_value=0) as upload:
+            return COMMANDS['!export'](ctx, list(args)), upload
+
+    def test_valid_arguments(self):
+        for args, expected in (
+            (('attendance',), ('csv', None, None)),
+            (('attendance', 'jsonl'), ('jsonl', None, None)),
+            (('attendance', '2024-01-01'), ('csv', '2024-01-01', None)),
+            (('vacations', '2024-01-01', '2024-12-31', 'jsonl'), ('jsonl', '2024-01-01', '2024-12-31')),
+        ):
+            response, upload = self.export(*args)
+            self.assertIn("uploaded", response)
+            self.assertEqual(upload.call_args.args[4:], expected)
+
+    def test_invalid_arguments_get_usage(self):
+        for args in (
+            ('attendance', 'csv', '2024-01-01'),
+            ('timesheets',),
+            ('attendance', '2024-12-31', '2024-01-01'),
+            ('attendance', '2024-01-01', '2024-01-02', '2024-01-03'),
+        ):
+            response, upload = self.export(*args)
+            self.assertEqual(response, EXPORT_USAGE, args)
+            upload.assert_not_called()
+
+
+class UpdateMemberTest(unittest.TestCase):
+
+    def setUp(self):
+        conn = sqlite3.connect(':memory:')
+        self.addCleanup(conn.close)
+        init_db(conn)
+        self.ctx = SimpleNamespace(bot=None, c=conn.cursor(), conn=conn, post={'channel_id': 'attendance'})
+        add_member(None, self.ctx.c, conn, '@gdhong', 'Gildong_Hong', 'MS', '010-1234-5678', 'gd@example.com', '1970-01-01')
+
+    def member(self):
+        self.ctx.c.execute("SELECT position, phone, email, birthday, birthday_md FROM members_info WHERE user_id = '@gdhong'")
+        return self.ctx.c.fetchone()
+
+    def test_updates_given_fields(self):
+        self.assertEqual(COMMANDS['!updatemember'](self.ctx, ['@gdhong', 'PhD', '010-0000-0000']), "Member info updated")
+        self.assertEqual(self.member(), ('PhD', '010-0000-0000', 'gd@example.com', '1970-01-01', '01-01'))
+        COMMANDS['!updatemember'](self.ctx, ['@gdhong', 'PhD', '010-0000-0000', 'new@example.com', '1971-02-03'])
+        self.assertEqual(self.member(), ('PhD', '010-0000-0000', 'new@example.com', '1971-02-03', '02-03'))
+
+    def test_unknown_member_is_reported(self):
+        response = COMMANDS['!updatemember'](self.ctx, ['@nobody', 'PhD'])
+        self.assertIn("Member @nobody does not exist", response)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import sqlite3
+import unittest
+
+from reports import ReportCache
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class ReportCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        self.addCleanup(self.conn.close)
+        self.clock = FakeClock()
+
+    def cached(self, cache, kind='month', period='2024-08'):
+        return cache.lookup(self.conn, kind, period)[0]
+
+    def test_invalidate_drops_covering_periods(self):
+        cache = ReportCache()
+        for kind, period in (('status', '2024-08-01'), ('month', '2024-08'), ('year', '2024'), ('month', '2024-07')):
+            _, token = cache.lookup(self.conn, kind, period)
+            cache.store(token, period)
+        cache.invalidate(self.conn, ['2024-08-01'])
+        self.assertIsNone(self.cached(cache, 'status', '2024-08-01'))
+        self.assertIsNone(self.cached(cache, 'month', '2024-08'))
+        self.assertIsNone(self.cached(cache, 'year', '2024'))
+        self.assertEqual(self.cached(cache, 'month', '2024-07'), '2024-07')
+
+    def test_result_computed_during_a_write_is_not_stored(self):
+        cache = ReportCache()
+        _, token = cache.lookup(self.conn, 'month', '2024-08')
+        cache.invalidate(self.conn, ['2024-08-01'])
+        cache.store(token, 'stale')
+        self.assertIsNone(self.cached(cache))
+
+    def test_results_expire_after_ttl(self):
+        cache = ReportCache(ttl=60, clock=self.clock)
+        _, token = cache.lookup(self.conn, 'month', '2024-08')
+        cache.store(token, 'report')
+        self.clock.now += 59
+        self.assertEqual(self.cached(cache), 'report')
+        # Not extended by the hit above
+        self.clock.now += 1
+        self.assertIsNone(self.cached(cache))
+        self.assertEqual(cache.stats()['size'], 0)
+
+    def test_no_ttl_keeps_results(self):
+        cache = ReportCache(clock=self.clock)
+        _, token = cache.lookup(self.conn, 'month', '2024-08')
+        cache.store(token, 'report')
+        self.clock.now += 10 ** 6
+        self.assertEqual(self.cached(cache), 'report')
+
+
+if __name__ == '__main__':
+    unittest.main()
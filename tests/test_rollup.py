@@ -0,0 +1,40 @@
+import sqlite3
+import unittest
+from datetime import date
+
+import analytics
+from commands import record_missing
+from database import init_db
+from rollup import rebuild_daily_rollup
+
+
+class RollupTest(unittest.TestCase):
+    """The analytics reports read attendance_daily, which writers keep in sync."""
+
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        self.addCleanup(self.conn.close)
+        init_db(self.conn)
+        self.c = self.conn.cursor()
+
+    def frame(self):
+        frame = analytics.load_attendance(self.c, date(2024, 8, 1), date(2024, 8, 31))
+        return sorted(zip([frame.user_ids[i] for i in frame.user], frame.day.tolist(),
+                          frame.arrival.tolist(), frame.worked.tolist()))
+
+    def test_first_check_in_and_worked_minutes(self):
+        record_missing(None, self.c, self.conn, 'user', '2024-08-01', '13:00', '18:00')
+        record_missing(None, self.c, self.conn, 'user', '2024-08-01', '08:30', '12:00')
+        # 2024-08-01 is day 19936
+        self.assertEqual(self.frame(), [('user', 19936, 510, 510)])
+
+    def test_rebuild_matches_incremental(self):
+        record_missing(None, self.c, self.conn, 'user', '2024-08-01', '09:00', '18:00')
+        record_missing(None, self.c, self.conn, 'other', '2024-08-02', '10:15', '11:00')
+        incremental = self.frame()
+        rebuild_daily_rollup(self.c, self.conn)
+        self.assertEqual(self.frame(), incremental)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import sqlite3
+import unittest
+
+from commands import record_missing, fix_database
+from database import init_db
+from timecodes import SQL_MINUTES, minute_of_day
+from utils import DateTimeValidator
+
+
+class TimesTest(unittest.TestCase):
+    """Times without a leading zero are stored, compared and encoded like zero-padded ones."""
+
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        self.addCleanup(self.conn.close)
+        init_db(self.conn)
+        self.c = self.conn.cursor()
+
+    def records(self):
+        self.c.execute("SELECT date, time_in, time_out, minute_in, minute_out FROM attendance ORDER BY rowid")
+        return self.c.fetchall()
+
+    def test_unpadded_times_are_normalized(self):
+        response = record_missing(None, self.c, self.conn, 'user', '2024-8-1', '9:30', '18:00')
+        self.assertIn("Successfully recorded", response)
+        self.assertEqual(self.records(), [('2024-08-01', '09:30', '18:00', 570, 1080)])
+
+    def test_check_out_before_check_in_is_rejected(self):
+        response = record_missing(None, self.c, self.conn, 'user', '2024-08-02', '18:00', '9:30')
+        self.assertIn("Check-out time cannot be earlier than check-in time", response)
+        self.assertEqual(self.records(), [])
+
+    def test_is_past_fails_closed(self):
+        self.assertTrue(DateTimeValidator.is_past('9:30', '18:00'))
+        self.assertFalse(DateTimeValidator.is_past('18:00', '9:30'))
+        self.assertTrue(DateTimeValidator.is_past('xx:30', '09:00'))
+        self.assertTrue(DateTimeValidator.is_past('2024-13-01', '2024-08-01'))
+
+    def test_fix_database_pads_stored_times(self):
+        self.c.execute("INSERT INTO attendance (user_id, date, time_in, time_out, location) "
+                       "VALUES ('user', '2024-08-01', '9:30', '18:00', 'Office')")
+        self.conn.commit()
+        fix_database(None, self.c, self.conn)
+        self.assertEqual(self.records(), [('2024-08-01', '09:30', '18:00', 570, 1080)])
+
+    def test_unpadded_stored_times_encode_correctly(self):
+        # Written before times were normalized, e.g. by an old import
+        self.c.execute("INSERT INTO attendance (user_id, date, time_in, time_out, location) "
+                       "VALUES ('user', '2024-08-01', '9:50', '18:05', 'Office')")
+        self.assertEqual(self.records(), [('2024-08-01', '9:50', '18:05', 590, 1085)])
+
+    def test_sql_encoding_matches_python(self):
+        for time_str in ('00:00', '0:00', '9:05', '9:50', '09:59', '10:00', '23:59', '18:00:00'):
+            self.c.execute(f"SELECT {SQL_MINUTES.format(':time')}", {'time': time_str})
+            self.assertEqual(self.c.fetchone()[0], minute_of_day(time_str), time_str)
+
+
+if __name__ == '__main__':
+    unittest.main()
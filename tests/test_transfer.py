@@ -0,0 +1,124 @@
+import io
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from mattermostdriver import Driver
+
+from database import init_db
+from transfer import TABLES, attachment_rows, import_rows, read_rows, write_export
+
+
+class TransferTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def connect(self, name: str) -> sqlite3.Connection:
+        conn = sqlite3.connect(os.path.join(self.directory, name))
+        self.addCleanup(conn.close)
+        init_db(conn)
+        return conn
+
+    def source(self) -> sqlite3.Connection:
+        conn = self.connect('source.db')
+        conn.executemany("INSERT INTO attendance (user_id, date, time_in, time_out, location) VALUES (?, ?, ?, ?, ?)", [
+            ('a', '2024-08-01', '09:00', '18:00', 'Office'),
+            ('a', '2024-08-02', '09:30', None, None),
+            ('b', '2024-08-01', '10:15', '19:45', '재택'),
+        ])
+        conn.executemany("INSERT INTO vacations VALUES (?, ?, ?, ?)", [
+            ('a', '2024-08-05', '2024-08-09', 'Trip'),
+            ('b', '2024-08-05', '2024-08-05', 'Sick'),
+        ])
+        conn.commit()
+        return conn
+
+    def export(self, conn: sqlite3.Connection, table: str, fmt: str) -> str:
+        out = io.StringIO(newline='')
+        write_export(conn.cursor(), out, TABLES[table], fmt)
+        return out.getvalue()
+
+    def load(self, conn: sqlite3.Connection, table: str, text: str, fmt: str = 'csv'):
+        return import_rows(conn.cursor(), conn, TABLES[table], read_rows(io.StringIO(text, newline=''), fmt))
+
+    def test_export_import_round_trip(self):
+        source = self.source()
+        for fmt in ('csv', 'jsonl'):
+            target = self.connect(f'target-{fmt}.db')
+            for table in ('attendance', 'vacations'):
+                text = self.export(source, table, fmt)
+                result = self.load(target, table, text, fmt)
+                self.assertEqual((result.loaded, result.errors), (len(text.splitlines()) - (fmt == 'csv'), []))
+                self.assertEqual(self.export(target, table, fmt), text)
+            self.assertEqual(target.execute("SELECT * FROM attendance_daily ORDER BY date, user_id").fetchall(), [
+                ('2024-08-01', 'a', 540, 1, 540),
+                ('2024-08-01', 'b', 570, 1, 615),
+                ('2024-08-02', 'a', 0, 1, 570),
+            ])
+
+    def test_invalid_rows_are_reported_and_nothing_is_loaded(self):
+        conn = self.source()
+        result = self.load(conn, 'attendance', (
+            "user_id,date,time_in,time_out,location\n"
+            "c,2024-08-03,09:00,18:00,Office\n"
+            "c,2999-01-01,09:00,,\n"
+            "c,2024-08-04,18:00,09:00,\n"
+        ))
+        self.assertEqual(result.errors, [(3, "date 2999-01-01 is in the future"), (4, "time_out is before time_in")])
+        self.assertEqual(result.loaded, 0)
+
+        result = self.load(conn, 'vacations', (
+            "user_id,start_date,end_date,reason\n"
+            "a,2024-08-09,2024-08-12,Overlaps a stored vacation\n"
+            "c,2024-08-10,2024-08-12,Trip\n"
+            "c,2024-08-12,2024-08-13,Overlaps line 3\n"
+            "b,2024-08-06,2024-08-06,Next to a stored vacation\n"
+        ))
+        self.assertEqual(result.errors, [
+            (2, "overlaps the vacation 2024-08-05 ~ 2024-08-09"),
+            (4, "overlaps the vacation 2024-08-10 ~ 2024-08-12 in this file"),
+        ])
+        self.assertEqual(result.loaded, 0)
+        # Rolled back: only the seeded rows remain
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM attendance").fetchone(), (3,))
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM vacations").fetchone(), (2,))
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM attendance_daily WHERE user_id = 'c'").fetchone(), (0,))
+
+    def test_attachment_is_streamed_from_the_server(self):
+        body = "\ufeffuser_id,start_date,end_date,reason\nc,2024-08-10,2024-08-12,여행\n".encode('utf-8')
+        requests = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                requests.append((self.path, self.headers['Authorization']))
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/csv')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        bot = Driver({'scheme': 'http', 'url': '127.0.0.1', 'port': server.server_address[1], 'token': 'token'})
+        bot.client.token = 'token'
+        with attachment_rows(bot, 'file1') as rows:
+            self.assertEqual(list(rows), [
+                (2, {'user_id': 'c', 'start_date': '2024-08-10', 'end_date': '2024-08-12', 'reason': '여행'}),
+            ])
+        self.assertEqual(requests, [('/api/v4/files/file1', 'Bearer token')])
+
+
+if __name__ == '__main__':
+    unittest.main()
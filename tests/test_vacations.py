@@ -0,0 +1,65 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from database import init_db
+from vacations import VacationIndex
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class VacationIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'vacations.db')
+        self.conn = self.connect()
+        init_db(self.conn)
+        self.conn.executemany("INSERT INTO vacations VALUES (?, ?, ?, ?)", [
+            ('a', '2024-08-01', '2024-08-05', 'Trip'),
+            ('b', '2024-08-05', '2024-08-09', 'Trip'),
+        ])
+        self.conn.commit()
+        self.clock = FakeClock()
+        self.index = VacationIndex(ttl=60, clock=self.clock)
+
+    def connect(self):
+        conn = sqlite3.connect(self.path)
+        self.addCleanup(conn.close)
+        return conn
+
+    def test_lookups(self):
+        self.assertEqual(self.index.on_vacation(self.conn, '2024-08-05'), {'a', 'b'})
+        self.assertEqual(self.index.on_vacation(self.conn, '2024-08-06'), {'b'})
+        self.assertEqual([v.user_id for v in self.index.overlapping(self.conn, '2024-07-01', '2024-08-01')], ['a'])
+        self.assertEqual(self.index.overlapping(self.conn, '2024-08-01', '2024-08-31', 'c'), [])
+
+    def test_add_is_seen_at_once(self):
+        self.index.on_vacation(self.conn, '2024-08-05')
+        self.conn.execute("INSERT INTO vacations VALUES ('c', '2024-08-05', '2024-08-05', 'Trip')")
+        self.conn.commit()
+        self.index.add(self.conn, 'c', '2024-08-05', '2024-08-05', 'Trip')
+        self.assertEqual(self.index.on_vacation(self.conn, '2024-08-05'), {'a', 'b', 'c'})
+
+    def test_other_process_writes_are_seen_after_ttl(self):
+        self.assertEqual(self.index.on_vacation(self.conn, '2024-08-20'), set())
+        # e.g. transfer.py importing vacations
+        other = self.connect()
+        other.execute("INSERT INTO vacations VALUES ('c', '2024-08-20', '2024-08-21', 'Trip')")
+        other.commit()
+        self.clock.now += 59
+        self.assertEqual(self.index.on_vacation(self.conn, '2024-08-20'), set())
+        self.clock.now += 1
+        self.assertEqual(self.index.on_vacation(self.conn, '2024-08-20'), {'c'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import date, timedelta
+from unittest import mock
+
+from workalendar.asia import SouthKorea
+
+import workdays
+from database import init_db
+from workdays import WorkingDays
+
+
+class WorkingDaysTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'workdays.db')
+        self.conn = sqlite3.connect(self.path)
+        self.addCleanup(self.conn.close)
+        init_db(self.conn)
+        # Computed again from workalendar, not taken from another test
+        years = mock.patch.dict(workdays._years, clear=True)
+        years.start()
+        self.addCleanup(years.stop)
+        self.calendar = SouthKorea()
+
+    def stored_years(self):
+        return [year for year, in self.conn.execute("SELECT year FROM working_days ORDER BY year")]
+
+    def test_matches_workalendar(self):
+        working_days = WorkingDays(self.conn.cursor(), self.conn)
+        # 2023 has Seollal (Jan 21-23) and Chuseok (Sep 28-30),
+        # and the range crosses into 2024
+        first, last = date(2023, 1, 1), date(2024, 1, 31)
+        days = [first + timedelta(days=i) for i in range((last - first).days + 1)]
+        for day in days:
+            self.assertEqual(working_days.is_working_day(day), self.calendar.is_working_day(day), day)
+        self.assertFalse(working_days.is_working_day(date(2023, 1, 23)))
+        self.assertFalse(working_days.is_working_day(date(2023, 9, 29)))
+
+        for start, end in ((date(2023, 1, 20), date(2023, 1, 26)), (date(2023, 9, 25), date(2023, 10, 10)),
+                           (date(2023, 12, 20), date(2024, 1, 10)), (first, last)):
+            expected = sum(self.calendar.is_working_day(day) for day in days if start <= day <= end)
+            self.assertEqual(working_days.working_days_between(start, end), expected, (start, end))
+
+        for start, n in ((date(2023, 1, 20), 2), (date(2023, 9, 27), 2), (date(2023, 12, 28), 5)):
+            expected = start - timedelta(days=1)
+            for _ in range(n):
+                expected = self.calendar.add_working_days(expected, 1)
+            self.assertEqual(working_days.nth_working_day(start, n), expected, (start, n))
+        self.assertEqual(self.stored_years(), [2023, 2024])
+
+    def test_caller_transaction_is_not_committed(self):
+        self.conn.execute("INSERT INTO vacations VALUES ('a', '2023-08-01', '2023-08-01', 'Trip')")
+        WorkingDays(self.conn.cursor(), self.conn).is_working_day(date(2023, 8, 1))
+        self.conn.rollback()
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM vacations").fetchone(), (0,))
+        # Not stored while the caller held the write lock, but still cached
+        self.assertEqual(self.stored_years(), [])
+        self.assertIn(2023, workdays._years)
+
+        WorkingDays(self.conn.cursor(), self.conn).is_working_day(date(2022, 8, 1))
+        self.assertEqual(self.stored_years(), [2022])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+from datetime import date, timedelta
+from typing import Optional, Union
+
+# Attendance dates are also stored as day numbers (days since 1970-01-01)
+# and times as minutes since midnight, see database._add_integer_columns.
+EPOCH = date(1970, 1, 1)
+
+# The same conversions in SQL, for generated columns and migrations.
+# julianday() of a 'YYYY-MM-DD' date is N.5, and 2440587.5 is 1970-01-01.
+SQL_DAY_NUMBER = "CAST(julianday({0}) - 2440587.5 AS INTEGER)"
+# Hours and minutes are split at the ':', so legacy unpadded 'H:MM' times
+# encode like 'HH:MM' ones.
+SQL_MINUTES = (
+    "(CASE WHEN {0} != '' THEN CAST(substr({0}, 1, instr({0}, ':') - 1) AS INTEGER) * 60"
+    " + CAST(substr({0}, instr({0}, ':') + 1, 2) AS INTEGER) END)"
+)
+
+
+def day_number(day: Union[date, str]) -> int:
+    """Days since 1970-01-01 of a date or a 'YYYY-MM-DD' string."""
+    if isinstance(day, str):
+        day = date.fromisoformat(day)
+    return (day - EPOCH).days
+
+
+def day_from_number(number: int) -> date:
+    return EPOCH + timedelta(days=number)
+
+
+def minute_of_day(time_str: Optional[str]) -> Optional[int]:
+    """Minutes since midnight of an 'HH:MM' (or 'H:MM', 'HH:MM:SS') string."""
+    if not time_str:
+        return None
+    hours, minutes = time_str.split(':')[:2]
+    return int(hours) * 60 + int(minutes)
@@ -0,0 +1,377 @@
+import io
+import csv
+import sys
+import json
+import logging
+import sqlite3
+import argparse
+import tempfile
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+import requests
+
+from rollup import refresh_daily_rollup, rebuild_daily_rollup
+from reports import report_cache
+from vacations import vacation_index
+from timecodes import day_number, day_from_number
+from utils import DateTimeValidator
+
+# Get the logger in main.py
+logger = logging.getLogger('bot')
+
+validator = DateTimeValidator()
+
+FORMATS = ('csv', 'jsonl')
+
+# Rows fetched from SQLite at a time while exporting
+CHUNK_SIZE = 1000
+
+# Above this many rows, an attendance import rebuilds the whole daily
+# rollup instead of refreshing each imported (user, day)
+ROLLUP_REFRESH_LIMIT = 10000
+
+
+@dataclass(frozen=True)
+class Table:
+    """What can be exported from and imported into one table."""
+    name: str
+    columns: Tuple[str, ...]
+    # SELECT ... FROM ... clause and the WHERE condition for a date range (start, end)
+    select: str
+    range_condition: Optional[str]
+    range_params: Optional[Callable[[str, str], tuple]]
+    order_by: str
+    insert: str
+    # (connection, row, state shared by the rows of one import) -> error
+    validate: Callable[[sqlite3.Connection, dict, dict], Optional[str]]
+
+
+def _is_blank(value) -> bool:
+    return value is None or str(value).strip() == ''
+
+
+def _validate_attendance(conn: sqlite3.Connection, row: dict, state: dict) -> Optional[str]:
+    if _is_blank(row.get('user_id')):
+        return "user_id is missing"
+    if not validator.valid_date(row.get('date') or ''):
+        return f"invalid date {row.get('date')!r}, use YYYY-MM-DD"
+    # Same rule as !missing
+    if validator.is_future(validator.normalize_date(row['date'])):
+        return f"date {row['date']} is in the future"
+    if not validator.valid_time(row.get('time_in') or ''):
+        return f"invalid time_in {row.get('time_in')!r}, use HH:MM"
+    if not _is_blank(row.get('time_out')):
+        if not validator.valid_time(row['time_out']):
+            return f"invalid time_out {row['time_out']!r}, use HH:MM"
+        if validator.is_past(row['time_out'], row['time_in']):
+            return "time_out is before time_in"
+    return None
+
+
+def _validate_vacation(conn: sqlite3.Connection, row: dict, state: dict) -> Optional[str]:
+    if _is_blank(row.get('user_id')):
+        return "user_id is missing"
+    for column in ('start_date', 'end_date'):
+        if not validator.valid_date(row.get(column) or ''):
+            return f"invalid {column} {row.get(column)!r}, use YYYY-MM-DD"
+    if validator.is_past(row['end_date'], row['start_date']):
+        return "end_date is before start_date"
+    # One vacation per day, as with !vacation: against the table and the file's earlier rows
+    user_id = str(row['user_id']).strip()
+    start_date, end_date = validator.normalize_date(row['start_date']), validator.normalize_date(row['end_date'])
+    for vacation in vacation_index.overlapping(conn, start_date, end_date, user_id):
+        return f"overlaps the vacation {vacation.start_date} ~ {vacation.end_date}"
+    start, end = day_number(start_date), day_number(end_date)
+    imported = state.setdefault('vacations', {}).setdefault(user_id, [])
+    for other_start, other_end in imported:
+        if other_start <= end and start <= other_end:
+            return f"overlaps the vacation {day_from_number(other_start)} ~ {day_from_number(other_end)} in this file"
+    imported.append((start, end))
+    return None
+
+
+def _validate_member(conn: sqlite3.Connection, row: dict, state: dict) -> Optional[str]:
+    if _is_blank(row.get('user_id')):
+        return "user_id is missing"
+    if not validator.valid_date(row.get('birthday') or ''):
+        return f"invalid birthday {row.get('birthday')!r}, use YYYY-MM-DD"
+    return None
+
+
+# Dates and times are stored zero-padded, whatever the file had ('9:30' -> '09:30')
+NORMALIZE: Dict[str, Callable[[str], Optional[str]]] = {
+    'date': validator.normalize_date,
+    'start_date': validator.normalize_date,
+    'end_date': validator.normalize_date,
+    'birthday': validator.normalize_date,
+    'time_in': validator.normalize_time,
+    'time_out': validator.normalize_time,
+}
+
+
+TABLES: Dict[str, Table] = {
+    'attendance': Table(
+        'attendance',
+        ('user_id', 'date', 'time_in', 'time_out', 'location'),
+        "SELECT user_id, date, time_in, time_out, location FROM attendance",
+        "day BETWEEN ? AND ?",
+        lambda start, end: (day_number(start), day_number(end)),
+        "day",
+        "INSERT INTO attendance (user_id, date, time_in, time_out, location) VALUES (?, ?, ?, ?, ?)",
+        _validate_attendance
+    ),
+    'vacations': Table(
+        'vacations',
+        ('user_id', 'start_date', 'end_date', 'reason'),
+        "SELECT user_id, start_date, end_date, reason FROM vacations",
+        # Every vacation overlapping the range
+        "start_date <= ? AND end_date >= ?",
+        lambda start, end: (end, start),
+        "start_date",
+        "INSERT INTO vacations (user_id, start_date, end_date, reason) VALUES (?, ?, ?, ?)",
+        _validate_vacation
+    ),
+    'members': Table(
+        'members',
+        ('user_id', 'name', 'position', 'phone', 'email', 'birthday'),
+        "SELECT user_id, name, position, phone, email, birthday FROM members_info",
+        None,
+        None,
+        "user_id",
+        # Importing a member that exists updates it
+        """INSERT INTO members_info (user_id, name, position, phone, email, birthday, birthday_md)
+           VALUES (?, ?, ?, ?, ?, ?, strftime('%m-%d', ?))
+           ON CONFLICT(user_id) DO UPDATE SET
+               name = excluded.name, position = excluded.position, phone = excluded.phone,
+               email = excluded.email, birthday = excluded.birthday, birthday_md = excluded.birthday_md""",
+        _validate_member
+    ),
+}
+
+
+##############
+### Export ###
+##############
+def export_rows(c: sqlite3.Cursor, table: Table, start: Optional[str] = None, end: Optional[str] = None,
+                chunk_size: int = CHUNK_SIZE) -> Iterator[tuple]:
+    """
+    Yield the rows of `table`, oldest first, optionally only those in the
+    date range [start, end]. Rows are fetched `chunk_size` at a time, so
+    memory use does not depend on the size of the table.
+    """
+    sql, params = table.select, ()
+    if table.range_condition and (start or end):
+        sql += f" WHERE {table.range_condition}"
+        params = table.range_params(start or '0001-01-01', end or '9999-12-31')
+    c.execute(f"{sql} ORDER BY {table.order_by}", params)
+    while rows := c.fetchmany(chunk_size):
+        yield from rows
+
+
+def write_export(c: sqlite3.Cursor, out: TextIO, table: Table, fmt: str = 'csv',
+                 start: Optional[str] = None, end: Optional[str] = None) -> int:
+    """Write an export of `table` to `out` as CSV (with a header) or JSON Lines. Returns the number of rows."""
+    count = 0
+    if fmt == 'csv':
+        writer = csv.writer(out)
+        writer.writerow(table.columns)
+        for row in export_rows(c, table, start, end):
+            writer.writerow(row)
+            count += 1
+    else:
+        for row in export_rows(c, table, start, end):
+            out.write(json.dumps(dict(zip(table.columns, row)), ensure_ascii=False) + '\n')
+            count += 1
+    return count
+
+
+def upload_export(bot, c, channel_id: str, table: Table, fmt: str = 'csv',
+                  start: Optional[str] = None, end: Optional[str] = None) -> int:
+    """
+    Export `table` to a temporary file and post it to `channel_id` as an
+    attachment. Returns the number of rows.
+    """
+    with tempfile.TemporaryFile() as f:
+        text = io.TextIOWrapper(f, encoding='utf-8', newline='')
+        count = write_export(c, text, table, fmt, start, end)
+        text.flush()
+        f.seek(0)
+
+        period = f"-{start or 'start'}-{end or 'end'}" if table.range_condition and (start or end) else ''
+        filename = f"{table.name}{period}.{fmt}"
+        file_id = bot.files.upload_file(channel_id, {'files': (filename, f)})['file_infos'][0]['id']
+        text.detach()
+    bot.posts.create_post({
+        'channel_id': channel_id,
+        'message': f"#### Export: {filename}\n- **Rows**: {count}",
+        'file_ids': [file_id]
+    })
+    return count
+
+
+##############
+### Import ###
+##############
+@dataclass
+class ImportResult:
+    """Outcome of an import: the rows loaded, or the (line, error) of every invalid row."""
+    table: str
+    loaded: int = 0
+    errors: List[Tuple[int, str]] = field(default_factory=list)
+
+
+def read_rows(lines: Iterable[str], fmt: str) -> Iterator[Tuple[int, dict]]:
+    """Yield (line number, row) from CSV (with a header) or JSON Lines text."""
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            row = {'_error': f"invalid JSON: {e}"}
+        yield number, row if isinstance(row, dict) else {'_error': "not a JSON object"}
+
+
+def sniff_format(head: str) -> str:
+    """'jsonl' if the text starts with a JSON object, otherwise 'csv'."""
+    return 'jsonl' if head.lstrip('\ufeff \t\r\n').startswith('{') else 'csv'
+
+
+def import_rows(c: sqlite3.Cursor, conn: sqlite3.Connection, table: Table,
+                rows: Iterable[Tuple[int, dict]]) -> ImportResult:
+    """
+    Validate every row and load them with one executemany in one
+    transaction. If any row is invalid nothing is loaded, so a corrected
+    file can simply be imported again.
+    """
+    result = ImportResult(table.name)
+    # (user_id, date) of imported attendance, to refresh the daily rollup
+    keys = set()
+    state = {}
+
+    def valid_rows():
+        for number, row in rows:
+            error = row.get('_error') or table.validate(conn, row, state)
+            if error:
+                result.errors.append((number, error))
+                continue
+            values = tuple(None if _is_blank(row.get(column)) else NORMALIZE.get(column, str)(str(row[column]).strip())
+                           for column in table.columns)
+            if table.name == 'members':
+                values += (values[-1],)     # birthday_md
+            if table.name == 'attendance' and len(keys) <= ROLLUP_REFRESH_LIMIT:
+                keys.add((values[0], values[1]))
+            result.loaded += 1
+            yield values
+
+    try:
+        c.executemany(table.insert, valid_rows())
+        if result.errors:
+            conn.rollback()
+            result.loaded = 0
+            return result
+        if table.name == 'attendance':
+            if len(keys) <= ROLLUP_REFRESH_LIMIT:
+                refresh_daily_rollup(c, keys)
+            else:
+                conn.commit()
+                rebuild_daily_rollup(c, conn)
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    if table.name != 'members':
+        report_cache.clear(conn)
+    if table.name == 'vacations':
+        vacation_index.clear(conn)
+    logger.info(f"Imported {result.loaded} rows into {table.name}")
+    return result
+
+
+@contextmanager
+def attachment_rows(bot, file_id: str) -> Iterator[Iterator[Tuple[int, dict]]]:
+    """
+    The rows of an attached CSV or JSON Lines file, as `read_rows` yields
+    them. The file is streamed from the server and parsed a line at a
+    time, so memory use does not depend on its size.
+    """
+    client = bot.client
+    with requests.get(f"{client.url}/files/{file_id}", headers=client.auth_header(), verify=bot.options['verify'],
+                      timeout=client.request_timeout, stream=True) as response:
+        response.raise_for_status()
+        response.raw.decode_content = True
+        # Kept open once the body is read, so the buffered text can still be
+        response.raw.auto_close = False
+        body = io.BufferedReader(response.raw)
+        fmt = sniff_format(body.peek(1024)[:1024].decode('utf-8-sig', 'ignore'))
+        yield read_rows(io.TextIOWrapper(body, encoding='utf-8-sig', newline=''), fmt)
+
+
+###########
+### CLI ###
+###########
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export or import attendance, vacations and members.")
+    parser.add_argument('--db', help="database path (default: DB_PATH from configs.json)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    export = commands.add_parser('export', help="write a table as CSV or JSON Lines")
+    export.add_argument('table', choices=TABLES)
+    export.add_argument('--from', dest='start', help="first date, YYYY-MM-DD")
+    export.add_argument('--to', dest='end', help="last date, YYYY-MM-DD")
+    export.add_argument('--format', choices=FORMATS, default='csv')
+    export.add_argument('--output', help="file to write (default: stdout)")
+
+    load = commands.add_parser('import', help="load a CSV or JSON Lines file into a table")
+    load.add_argument('table', choices=TABLES)
+    load.add_argument('file')
+    load.add_argument('--format', choices=FORMATS, help="default: detected from the file")
+
+    args = parser.parse_args(argv)
+    for day in (getattr(args, 'start', None), getattr(args, 'end', None)):
+        if day and not validator.valid_date(day):
+            parser.error(f"invalid date {day}, use YYYY-MM-DD")
+
+    if args.db is None:
+        from configs import DB_PATH
+        args.db = DB_PATH
+    from database import init_db
+    conn = sqlite3.connect(args.db)
+    init_db(conn)
+    c = conn.cursor()
+    table = TABLES[args.table]
+
+    if args.command == 'export':
+        out = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+        try:
+            count = write_export(c, out, table, args.format, args.start, args.end)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        print(f"Exported {count} rows from {table.name}", file=sys.stderr)
+        return 0
+
+    with open(args.file, encoding='utf-8-sig', newline='') as f:
+        fmt = args.format or sniff_format(f.read(1024))
+        f.seek(0)
+        result = import_rows(c, conn, table, read_rows(f, fmt))
+    for number, error in result.errors:
+        print(f"line {number}: {error}", file=sys.stderr)
+    if result.errors:
+        print(f"Nothing imported: {len(result.errors)} invalid rows", file=sys.stderr)
+        return 1
+    print(f"Imported {result.loaded} rows into {table.name}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    # Usage: python transfer.py export attendance --from 2024-01-01 --to 2024-12-31 --output attendance.csv
+    #        python transfer.py import members members.csv
+    sys.exit(main())
@@ -1,14 +1,19 @@
 from datetime import datetime, timezone, date, time
 from zoneinfo import ZoneInfo
-from dataclasses import dataclass
 
 from typing import Union, Optional, List, Tuple
 import logging
 
+from rollup import refresh_daily_rollup
+from reports import report_cache
+from timecodes import day_number, minute_of_day
+
 SEOUL_TZ = ZoneInfo("Asia/Seoul")
 DATE_FORMAT = "%Y-%m-%d"
 TIME_FORMAT = "%H:%M"
 BIRTHDAY_FORMAT = "%m-%d"
+# Page size for Mattermost list endpoints and bulk lookups
+API_PAGE_SIZE = 200
 
 # Get the logger in main.py
 logger = logging.getLogger('bot')
@@ -28,19 +33,20 @@ class DateTimeValidator:
 
     @staticmethod
     def is_past(date1: str, date2: str) -> bool:
-        """Compare two dates/times and check if date1 is before date2."""
+        """
+        Compare two dates/times and check if date1 is before date2.
+        Values that cannot be compared count as before, so callers reject them.
+        """
         try:
             if ':' in date1 and ':' in date2:
-                # Time comparison
-                return int(date1.replace(':', '')) < int(date2.replace(':', ''))
+                # Time comparison, in minutes since midnight
+                return minute_of_day(date1) < minute_of_day(date2)
             
-            # Date comparison
-            date1_obj = datetime.strptime(date1, DATE_FORMAT)
-            date2_obj = datetime.strptime(date2, DATE_FORMAT)
-            return date1_obj < date2_obj
-        except ValueError as e:
+            # Date comparison, in day numbers
+            return day_number(DateTimeValidator.normalize_date(date1)) < day_number(DateTimeValidator.normalize_date(date2))
+        except (TypeError, ValueError) as e:
             logger.error(f"Date comparison error: {e}")
-            return False
+            return True
 
     @staticmethod
     def valid_date(date_str: str) -> bool:
@@ -60,10 +66,55 @@ class DateTimeValidator:
         except ValueError:
             return False
 
+    # strptime also accepts values without leading zeros ('2024-8-1', '9:30'),
+    # but dates and times are stored and compared zero-padded
+    @staticmethod
+    def normalize_date(date_str: str) -> Optional[str]:
+        """The date as 'YYYY-MM-DD', or None if it is not a valid date."""
+        try:
+            return datetime.strptime(date_str, DATE_FORMAT).strftime(DATE_FORMAT)
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def normalize_time(time_str: str) -> Optional[str]:
+        """The time as 'HH:MM', or None if it is not a valid time."""
+        try:
+            return datetime.strptime(time_str, TIME_FORMAT).strftime(TIME_FORMAT)
+        except (TypeError, ValueError):
+            return None
+
+def get_team_member_ids(bot, team_id: str) -> List[str]:
+    """Get the user ids of every member of a team, one page at a time."""
+    member_ids = []
+    page = 0
+    while True:
+        members = bot.teams.get_team_members(team_id, params={'page': page, 'per_page': API_PAGE_SIZE})
+        member_ids.extend(member['user_id'] for member in members)
+        if len(members) < API_PAGE_SIZE:
+            return member_ids
+        page += 1
+
 class BirthdayGreeter:
-    def __init__(self, db_cursor, db_connection):
+    def __init__(self, db_cursor, db_connection, directory=None):
         self.cursor = db_cursor
         self.conn = db_connection
+        # Optional cache.UserDirectory, used to skip deactivated accounts
+        self.directory = directory
+
+    def _active_members(self, members: list) -> list:
+        """Drop members whose Mattermost account (user_id is '@username') is deactivated."""
+        if self.directory is None or not members:
+            return members
+        try:
+            users = self.directory.get_users_by_usernames([member[0].lstrip('@') for member in members])
+        except Exception as e:
+            logger.error(f"Error looking up birthday members: {e}")
+            return members
+        return [
+            member for member in members
+            if users.get(member[0].lstrip('@'), {}).get('delete_at', 0) == 0
+        ]
 
     def _format_greeting(self, members: list, is_monthly: bool) -> Optional[str]:
         """Format birthday greeting message."""
@@ -80,51 +131,39 @@ class BirthdayGreeter:
         greeting.append(f"\n{len(members)} birthdays {'this month' if is_monthly else 'today'}! :confetti_ball:")
         return "\n".join(greeting)
 
-    def get_daily_greeting(self) -> Optional[str]:
-        """Get daily birthday greetings."""
-        today = datetime.now(SEOUL_TZ).strftime(BIRTHDAY_FORMAT)
+    def get_daily_greeting(self, day: Optional[date] = None) -> Optional[str]:
+        """Get daily birthday greetings for `day` (default: today)."""
+        today = (day or datetime.now(SEOUL_TZ)).strftime(BIRTHDAY_FORMAT)
         self.cursor.execute(
-            "SELECT * FROM members_info WHERE strftime('%m-%d', birthday) = ?", 
+            "SELECT * FROM members_info WHERE birthday_md = ?", 
             (today,)
         )
-        return self._format_greeting(self.cursor.fetchall(), False)
+        return self._format_greeting(self._active_members(self.cursor.fetchall()), False)
 
-    def get_monthly_greeting(self) -> Optional[str]:
-        """Get monthly birthday greetings."""
-        current_month = datetime.now(SEOUL_TZ).strftime("%m")
+    def get_monthly_greeting(self, day: Optional[date] = None) -> Optional[str]:
+        """Get monthly birthday greetings for the month of `day` (default: this month)."""
+        current_month = (day or datetime.now(SEOUL_TZ)).strftime("%m")
         self.cursor.execute(
-            "SELECT * FROM members_info WHERE strftime('%m', birthday) = ?", 
-            (current_month,)
+            "SELECT * FROM members_info WHERE birthday_md BETWEEN ? AND ?", 
+            (f"{current_month}-01", f"{current_month}-31")
         )
-        return self._format_greeting(self.cursor.fetchall(), True)
-
-
-@dataclass
-class BirthdayState:
-    printed: bool = False
-    last_date: Optional[date] = None
-
-@dataclass
-class AutoCheckoutState:
-    responded: bool = False
-    last_date: Optional[date] = None
+        return self._format_greeting(self._active_members(self.cursor.fetchall()), True)
 
 
-def auto_checkout(bot, c, conn) -> List[Tuple[str, str]]:
+def auto_checkout(bot, c, conn, day: Optional[date] = None) -> List[Tuple[str, str]]:
     """
-    Automatically check out users who haven't checked out for the day.
+    Automatically check out users who haven't checked out on `day` (default: today).
     Returns a list of tuples containing (user_id, response_message).
     """
-    now = datetime.now()
-    date = now.strftime("%Y-%m-%d")
+    date = (day or datetime.now(SEOUL_TZ)).strftime("%Y-%m-%d")
     time_midnight = time(23, 59).strftime("%H:%M")
     
     # Get all users who haven't checked out today
     c.execute("""
         SELECT user_id, location 
         FROM attendance 
-        WHERE date = ? AND time_out IS NULL
-    """, (date,))
+        WHERE day = ? AND minute_out IS NULL
+    """, (day_number(date),))
     
     unchecked_users = c.fetchall()
     if not unchecked_users:
@@ -134,10 +173,12 @@ def auto_checkout(bot, c, conn) -> List[Tuple[str, str]]:
     c.execute("""
         UPDATE attendance 
         SET time_out = ? 
-        WHERE date = ? AND time_out IS NULL
-    """, (time_midnight, date))
+        WHERE day = ? AND minute_out IS NULL
+    """, (time_midnight, day_number(date)))
+    refresh_daily_rollup(c, [(user_id, date) for user_id, _ in unchecked_users])
     
     conn.commit()
+    report_cache.invalidate(conn, [date])
 
     # Generate response messages for each user
     responses = []
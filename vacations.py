@@ -0,0 +1,238 @@
+import bisect
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Set, Union
+
+from reports import database_key
+from timecodes import day_number, day_from_number
+
+# Get the logger in main.py
+logger = logging.getLogger('bot')
+
+# Vacations added since the tree was built are scanned one by one;
+# past this many the tree is rebuilt
+MAX_PENDING = 64
+
+
+@dataclass(frozen=True)
+class Vacation:
+    """One row of the vacations table, with its dates as day numbers (both inclusive)."""
+    user_id: str
+    start: int
+    end: int
+    reason: str
+
+    @property
+    def start_date(self) -> date:
+        return day_from_number(self.start)
+
+    @property
+    def end_date(self) -> date:
+        return day_from_number(self.end)
+
+    def overlaps(self, start: int, end: int) -> bool:
+        return self.start <= end and self.end >= start
+
+
+@dataclass
+class _Node:
+    center: int
+    # The vacations containing `center`, by start (ascending) and by end (descending)
+    by_start: List[Vacation]
+    by_end: List[Vacation]
+    left: Optional['_Node'] = None
+    right: Optional['_Node'] = None
+
+
+def _build(vacations: Sequence[Vacation]) -> Optional[_Node]:
+    if not vacations:
+        return None
+    # The median endpoint leaves at most half of the vacations on either side
+    endpoints = sorted(day for vacation in vacations for day in (vacation.start, vacation.end))
+    center = endpoints[len(endpoints) // 2]
+    here = [vacation for vacation in vacations if vacation.start <= center <= vacation.end]
+    return _Node(
+        center,
+        sorted(here, key=lambda vacation: vacation.start),
+        sorted(here, key=lambda vacation: vacation.end, reverse=True),
+        _build([vacation for vacation in vacations if vacation.end < center]),
+        _build([vacation for vacation in vacations if vacation.start > center])
+    )
+
+
+class IntervalTree:
+    """
+    A centered interval tree over vacations. `stab()` and `overlapping()`
+    take O(log n + k) for k results.
+    """
+
+    def __init__(self, vacations: Sequence[Vacation]):
+        self._root = _build(vacations)
+        self._sorted = sorted(vacations, key=lambda vacation: vacation.start)
+        self._starts = [vacation.start for vacation in self._sorted]
+
+    def __len__(self) -> int:
+        return len(self._sorted)
+
+    @property
+    def vacations(self) -> List[Vacation]:
+        return self._sorted
+
+    def stab(self, day: int) -> Iterator[Vacation]:
+        """The vacations containing `day`."""
+        node = self._root
+        while node is not None:
+            if day < node.center:
+                for vacation in node.by_start:
+                    if vacation.start > day:
+                        break
+                    yield vacation
+                node = node.left
+            elif day > node.center:
+                for vacation in node.by_end:
+                    if vacation.end < day:
+                        break
+                    yield vacation
+                node = node.right
+            else:
+                yield from node.by_start
+                return
+
+    def overlapping(self, start: int, end: int) -> Iterator[Vacation]:
+        """The vacations overlapping [start, end]: those containing `start`, then those starting after it."""
+        yield from self.stab(start)
+        yield from self._sorted[bisect.bisect_right(self._starts, start):bisect.bisect_right(self._starts, end)]
+
+
+@dataclass
+class _Vacations:
+    """The vacations of one database."""
+    tree: IntervalTree
+    loaded_at: float
+    # Added since `tree` was built
+    pending: List[Vacation] = field(default_factory=list)
+    by_user: Dict[str, List[Vacation]] = field(default_factory=dict)
+
+    def add(self, vacation: Vacation):
+        self.by_user.setdefault(vacation.user_id, []).append(vacation)
+        self.pending.append(vacation)
+        if len(self.pending) > MAX_PENDING:
+            self.tree = IntervalTree(self.tree.vacations + self.pending)
+            self.pending = []
+
+    def overlapping(self, start: int, end: int) -> List[Vacation]:
+        return list(self.tree.overlapping(start, end)) + [
+            vacation for vacation in self.pending if vacation.overlaps(start, end)
+        ]
+
+
+Day = Union[date, str]
+
+
+class VacationIndex:
+    """
+    The vacations table of each database, held in memory as an interval
+    tree for "who is on vacation on a day / in a range" and per user for
+    overlap checks.
+
+    A database's vacations are loaded on first use. Every writer of the
+    table in this process keeps the index in sync after committing:
+    `add()` for a single vacation, `clear()` (reload on next use) for bulk
+    changes. Writes by other processes are picked up by reloading `ttl`
+    seconds after loading (None never reloads).
+    """
+
+    def __init__(self, ttl: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self._databases: Dict[str, _Vacations] = {}
+        self._lock = threading.Lock()
+
+    def _vacations(self, conn: sqlite3.Connection) -> _Vacations:
+        # Called with the lock held
+        key = database_key(conn)
+        vacations = self._databases.get(key)
+        if vacations is None or (self.ttl is not None and self.clock() - vacations.loaded_at >= self.ttl):
+            vacations = self._databases[key] = self._load(conn)
+        return vacations
+
+    def _load(self, conn: sqlite3.Connection) -> _Vacations:
+        loaded, skipped = [], 0
+        for user_id, start_date, end_date, reason in conn.execute(
+                "SELECT user_id, start_date, end_date, reason FROM vacations"):
+            try:
+                vacation = Vacation(user_id, day_number(start_date), day_number(end_date), reason)
+            except (TypeError, ValueError):
+                skipped += 1
+                continue
+            # An inverted range covers no day
+            if vacation.start <= vacation.end:
+                loaded.append(vacation)
+        if skipped:
+            logger.warning(f"Skipped {skipped} vacations with invalid dates")
+
+        vacations = _Vacations(IntervalTree(loaded), self.clock())
+        for vacation in loaded:
+            vacations.by_user.setdefault(vacation.user_id, []).append(vacation)
+        return vacations
+
+    def on_vacation(self, conn: sqlite3.Connection, day: Day) -> Set[str]:
+        """The users on vacation on `day`."""
+        number = day_number(day)
+        with self._lock:
+            return {vacation.user_id for vacation in self._vacations(conn).overlapping(number, number)}
+
+    def overlapping(self, conn: sqlite3.Connection, start: Day, end: Day,
+                    user_id: Optional[str] = None) -> List[Vacation]:
+        """The vacations (of `user_id`, if given) overlapping `start` to `end`, inclusive, by start."""
+        start, end = day_number(start), day_number(end)
+        with self._lock:
+            vacations = self._vacations(conn)
+            if user_id is None:
+                found = vacations.overlapping(start, end)
+            else:
+                found = [vacation for vacation in vacations.by_user.get(user_id, ()) if vacation.overlaps(start, end)]
+        return sorted(found, key=lambda vacation: (vacation.start, vacation.end))
+
+    def add(self, conn: sqlite3.Connection, user_id: str, start: Day, end: Day, reason: str):
+        vacation = Vacation(user_id, day_number(start), day_number(end), reason)
+        with self._lock:
+            # Not loaded yet: the next use reads it from the table
+            if (vacations := self._databases.get(database_key(conn))) is not None and vacation.start <= vacation.end:
+                vacations.add(vacation)
+
+    def clear(self, conn: sqlite3.Connection):
+        """Drop the vacations of the connection's database; they are reloaded on next use."""
+        with self._lock:
+            self._databases.pop(database_key(conn), None)
+
+
+def vacation_days(working_days, vacations: Sequence[Vacation], start: date, end: date) -> int:
+    """
+    Working days (no weekends or public holidays, see workdays.py) from
+    `start` to `end` covered by `vacations`. Days covered by several
+    vacations count once.
+    """
+    first, last = day_number(start), day_number(end)
+    total, merged_start, merged_end = 0, None, None
+    for vacation in sorted(vacations, key=lambda vacation: vacation.start):
+        vacation_start, vacation_end = max(vacation.start, first), min(vacation.end, last)
+        if vacation_start > vacation_end:
+            continue
+        if merged_end is not None and vacation_start <= merged_end + 1:
+            merged_end = max(merged_end, vacation_end)
+            continue
+        if merged_end is not None:
+            total += working_days.working_days_between(day_from_number(merged_start), day_from_number(merged_end))
+        merged_start, merged_end = vacation_start, vacation_end
+    if merged_end is not None:
+        total += working_days.working_days_between(day_from_number(merged_start), day_from_number(merged_end))
+    return total
+
+
+# Shared by team status, reports and every writer of vacations
+vacation_index = VacationIndex()
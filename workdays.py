@@ -0,0 +1,150 @@
+import logging
+import sqlite3
+import threading
+from array import array
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Dict
+
+from reports import database_key
+
+# Get the logger in main.py
+logger = logging.getLogger('bot')
+
+
+def _bitmap(days: int, is_set) -> bytes:
+    bits = bytearray((days + 7) // 8)
+    for index in range(days):
+        if is_set(index):
+            bits[index >> 3] |= 1 << (index & 7)
+    return bytes(bits)
+
+
+def _bit(bits: bytes, index: int) -> bool:
+    return bool(bits[index >> 3] >> (index & 7) & 1)
+
+
+@dataclass
+class _Year:
+    """Working days and holidays of one year, as bitmaps indexed by day of the year (0-based)."""
+    first: date
+    days: int
+    working: bytes
+    holidays: bytes
+
+    def __post_init__(self):
+        # prefix[i]: working days before day i; ordinals[k]: day index of the k-th working day
+        self.prefix = array('H', [0])
+        self.ordinals = array('H')
+        for index in range(self.days):
+            if _bit(self.working, index):
+                self.ordinals.append(index)
+            self.prefix.append(len(self.ordinals))
+
+    @property
+    def total(self) -> int:
+        return self.prefix[-1]
+
+
+# Years computed or loaded so far, shared by every WorkingDays instance
+_years: Dict[int, _Year] = {}
+_years_lock = threading.Lock()
+
+
+class WorkingDays:
+    """
+    Working-day calendar of South Korea (weekends and public holidays,
+    including the lunar ones).
+
+    Each year is computed with workalendar on first use and stored as two
+    bitmaps in the `working_days` table, so later processes only read
+    ~100 bytes per year. Lookups use per-year prefix sums and are O(1)
+    within a year. The caller's transaction is left alone: a computed year
+    is stored through a connection of its own.
+    """
+
+    def __init__(self, c, conn):
+        self.c = c
+        self.conn = conn
+
+    def _year(self, year: int) -> _Year:
+        if (cached := _years.get(year)) is not None:
+            return cached
+
+        with _years_lock:
+            if (cached := _years.get(year)) is not None:
+                return cached
+
+            first = date(year, 1, 1)
+            days = (date(year + 1, 1, 1) - first).days
+            row = self.conn.execute("SELECT working, holidays FROM working_days WHERE year = ?", (year,)).fetchone()
+            if row:
+                entry = _Year(first, days, row[0], row[1])
+            else:
+                # Imported here, as building the calendar is only needed once per year
+                from workalendar.asia import SouthKorea
+                logger.info(f"Computing the working-day calendar of {year}")
+                cal = SouthKorea()
+                entry = _Year(
+                    first,
+                    days,
+                    _bitmap(days, lambda index: cal.is_working_day(first + timedelta(days=index))),
+                    _bitmap(days, lambda index: cal.is_holiday(first + timedelta(days=index))),
+                )
+                self._store(year, entry)
+
+            _years[year] = entry
+            return entry
+
+    def _store(self, year: int, entry: _Year):
+        path = database_key(self.conn)
+        if path.startswith('memory:'):
+            # Private to the caller's connection, so only cached in this process
+            return
+        # No waiting: if the caller holds the write lock this would wait for itself.
+        # The year is then computed again by the next process.
+        conn = sqlite3.connect(path, timeout=0)
+        try:
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO working_days VALUES (?, ?, ?)",
+                             (year, entry.working, entry.holidays))
+        except sqlite3.OperationalError as e:
+            logger.info(f"Working-day calendar of {year} not stored: {e}")
+        finally:
+            conn.close()
+
+    def is_working_day(self, day: date) -> bool:
+        entry = self._year(day.year)
+        return _bit(entry.working, (day - entry.first).days)
+
+    def is_holiday(self, day: date) -> bool:
+        """Public holidays only; weekends are not holidays unless they are also a public holiday."""
+        entry = self._year(day.year)
+        return _bit(entry.holidays, (day - entry.first).days)
+
+    def working_days_between(self, start: date, end: date) -> int:
+        """Number of working days from `start` to `end`, both inclusive. 0 if `end` is before `start`."""
+        if end < start:
+            return 0
+        if start.year == end.year:
+            entry = self._year(start.year)
+            return entry.prefix[(end - entry.first).days + 1] - entry.prefix[(start - entry.first).days]
+
+        first = self._year(start.year)
+        last = self._year(end.year)
+        count = first.total - first.prefix[(start - first.first).days]
+        count += sum(self._year(year).total for year in range(start.year + 1, end.year))
+        return count + last.prefix[(end - last.first).days + 1]
+
+    def nth_working_day(self, start: date, n: int) -> date:
+        """The `n`-th working day on or after `start` (n=1 is the first one)."""
+        if n < 1:
+            raise ValueError("n must be at least 1")
+        year = start.year
+        entry = self._year(year)
+        position = entry.prefix[(start - entry.first).days] + n - 1
+        while position >= entry.total:
+            position -= entry.total
+            year += 1
+            entry = self._year(year)
+        return entry.first + timedelta(days=entry.ordinals[position])